@@ -0,0 +1,59 @@
+import functools
+import hashlib
+import json
+from pathlib import Path
+
+import fire
+
+# prompt images and tables, listed with their mime type and content hash in manifest.json
+ASSET_DIR = Path(__file__).parent / "prompt_assets"
+MANIFEST_FILE = ASSET_DIR / "manifest.json"
+
+MIME_TYPES = {".png": "image/png", ".csv": "text/plain"}
+
+
+@functools.lru_cache(maxsize=None)
+def load_manifest():
+    return json.loads(MANIFEST_FILE.read_text())
+
+
+@functools.lru_cache(maxsize=None)
+def asset_bytes(name):
+    entry = load_manifest()[name]
+    data = (ASSET_DIR / entry["file"]).read_bytes()
+    if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+        raise ValueError(
+            f"Prompt asset {entry['file']} does not match its manifest hash, "
+            f"run `python qol_assets.py update` after changing it"
+        )
+    return data
+
+
+@functools.lru_cache(maxsize=None)
+def asset_part(name):
+    # only read (and the SDK only imported) the first time a request is built
+    from vertexai.generative_models import Part
+
+    return Part.from_data(mime_type=load_manifest()[name]["mime_type"], data=asset_bytes(name))
+
+
+def update():
+    # rehash every asset file, new files are added under their file stem
+    manifest = json.loads(MANIFEST_FILE.read_text()) if MANIFEST_FILE.exists() else {}
+    files = {entry["file"]: name for name, entry in manifest.items()}
+    for file in sorted(ASSET_DIR.iterdir()):
+        if file.suffix not in MIME_TYPES:
+            continue
+        name = files.get(file.name, file.stem)
+        manifest[name] = {
+            "file": file.name,
+            "mime_type": MIME_TYPES[file.suffix],
+            "sha256": hashlib.sha256(file.read_bytes()).hexdigest(),
+        }
+    manifest = {name: entry for name, entry in manifest.items() if (ASSET_DIR / entry["file"]).exists()}
+    MANIFEST_FILE.write_text(json.dumps(manifest, indent=2) + "\n")
+    print(f"Wrote {len(manifest)} assets to {MANIFEST_FILE}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"update": update})
@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from types import SimpleNamespace
+
+# the generation pipeline only relies on what a Vertex GenerativeModel offers: an async
+# `generate_content_async(contents, generation_config=..., safety_settings=..., stream=True)` whose
+# chunks carry `.text`, `.candidates[0].content.parts`, `.candidates[0].finish_reason.name` and
+# `.usage_metadata`. A backend creates such a model handle for an endpoint
+
+
+class VertexBackend:
+    def __init__(self, model_name, system_instruction, credentials=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.credentials = credentials
+
+    def create_model(self, endpoint):
+        import vertexai
+        from vertexai.generative_models import GenerativeModel
+
+        # GenerativeModel captures project and location from the global config at construction time,
+        # so every endpoint gets its own init before its model handle is created
+        vertexai.init(project=endpoint.project, location=endpoint.location, credentials=self.credentials)
+        return GenerativeModel(self.model_name, system_instruction=self.system_instruction)
+
+
+def parse_distribution(spec):
+    # "fixed:1.5", "uniform:1:3", "exponential:2" (mean) or "lognormal:8:0.4" (median, sigma), in seconds
+    kind, *params = str(spec).split(":")
+    params = [float(param) for param in params]
+    if kind == "fixed":
+        return lambda rng: params[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1 / params[0])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(params[0]), params[1])
+    raise ValueError(f"Unknown latency distribution {spec}")
+
+
+def mock_record(name, schema, mangle=False):
+    # the scores only depend on the ED name, so every run (and every retry) gives the same answer
+    rng = random.Random(hashlib.sha256(name.encode()).digest())
+    base = rng.randint(20, 90)
+
+    def fill(schema):
+        if schema["type"] == "OBJECT":
+            return {key: fill(property_schema) for key, property_schema in schema["properties"].items()}
+        if schema["type"] == "INTEGER":
+            return max(1, min(100, base + rng.randint(-15, 15)))
+        return name
+
+    answer = fill(schema["properties"]["answer"])
+    scores = [score for group in answer.values() if isinstance(group, dict) for score in group.values()]
+    answer["QoL"] = round(sum(scores) / len(scores))
+    if mangle:
+        # the kind of "correction" seen from the real model, Swineford -> Swinford
+        vowels = [i for i, char in enumerate(name) if char in "aeiou"]
+        position = vowels[len(vowels) // 2] if vowels else len(name) - 1
+        name = name[:position] + name[position + 1 :]
+    return {"query": name, "answer": answer}
+
+
+class MockModel:
+    def __init__(self, backend, endpoint):
+        self.backend = backend
+        self.endpoint = endpoint
+        self.request_times = []
+
+    def check_quota(self, now):
+        quota = self.backend.requests_per_minute
+        if quota is None:
+            return
+        self.request_times = [t for t in self.request_times if now - t < 60]
+        if len(self.request_times) >= quota:
+            raise self.backend.rate_limit_error(f"Quota exceeded for {self.endpoint.name} (mock)")
+        self.request_times.append(now)
+
+    async def generate_content_async(self, contents, generation_config=None, safety_settings=None, stream=True):
+        from google.api_core import exceptions
+
+        backend = self.backend
+        rng = backend.next_rng()
+        now = time.time()
+        start, end = backend.outages.get(self.endpoint.name, (0, 0))
+        if start <= now - backend.created_at < end:
+            raise exceptions.ServiceUnavailable(f"{self.endpoint.name} is down (mock)")
+        self.check_quota(now)
+        if rng.random() < backend.rate_limit_rate:
+            raise backend.rate_limit_error("Resource exhausted (mock)")
+        if rng.random() < backend.unavailable_rate:
+            await asyncio.sleep(backend.latency(rng) * rng.random())
+            raise exceptions.ServiceUnavailable("Service unavailable (mock)")
+        if backend.fatal_rate and rng.random() < backend.fatal_rate:
+            raise exceptions.InvalidArgument("Request contains an invalid argument (mock)")
+        if rng.random() < backend.safety_rate:
+            usage_metadata = SimpleNamespace(prompt_token_count=0, candidates_token_count=0, total_token_count=0)
+            return backend.stream("", "SAFETY", usage_metadata, backend.latency(rng))
+
+        query = contents[-1] if isinstance(contents[-1], str) else ""
+        records = []
+        for name in re.findall(r"<query_\d+>(.*?)</query_\d+>", query, flags=re.DOTALL):
+            if rng.random() < backend.drop_rate:
+                continue
+            records.append(mock_record(name, backend.schema["items"], mangle=rng.random() < backend.mangle_rate))
+        text = backend.render(records)
+
+        max_output_tokens = backend.max_output_tokens(generation_config)
+        finish_reason = "STOP"
+        if len(text) / backend.chars_per_token > max_output_tokens:
+            text = text[: int(max_output_tokens * backend.chars_per_token)]
+            finish_reason = "MAX_TOKENS"
+        elif records and rng.random() < backend.truncation_rate:
+            text = text[: rng.randint(1, len(text) - 1)]
+            finish_reason = "MAX_TOKENS"
+
+        prompt_tokens = sum(
+            len(part) / backend.chars_per_token if isinstance(part, str) else 258 for part in contents
+        )
+        output_tokens = math.ceil(len(text) / backend.chars_per_token)
+        usage_metadata = SimpleNamespace(
+            prompt_token_count=int(prompt_tokens),
+            candidates_token_count=output_tokens,
+            total_token_count=int(prompt_tokens) + output_tokens,
+        )
+        latency = backend.latency(rng)
+        return backend.stream(text, finish_reason, usage_metadata, latency)
+
+
+class MockBackend:
+    # offline stand-in for Vertex: schema-valid answers derived from the ED name, with configurable latency,
+    # server side quota, 429 / 503 / 400 errors, endpoint outages, safety blocks, truncation, dropped and renamed EDs.
+    # Faults are drawn from a seeded generator, so a run with the same settings fails the same way
+    def __init__(
+        self,
+        schema,
+        latency="fixed:0.05",
+        time_to_first_chunk=0.3,
+        chunk_chars=512,
+        requests_per_minute=None,
+        rate_limit_rate=0.0,
+        unavailable_rate=0.0,
+        truncation_rate=0.0,
+        drop_rate=0.0,
+        mangle_rate=0.0,
+        safety_rate=0.0,
+        fatal_rate=0.0,
+        retry_after=None,
+        outages=None,
+        chars_per_token=4,
+        seed=0,
+    ):
+        self.schema = schema
+        self.latency_spec = latency
+        self.latency = parse_distribution(latency)
+        # share of the latency spent before the first chunk arrives
+        self.time_to_first_chunk = time_to_first_chunk
+        self.chunk_chars = chunk_chars
+        self.requests_per_minute = requests_per_minute
+        self.rate_limit_rate = rate_limit_rate
+        self.unavailable_rate = unavailable_rate
+        self.truncation_rate = truncation_rate
+        self.drop_rate = drop_rate
+        self.mangle_rate = mangle_rate
+        # share of responses blocked as SAFETY without any content
+        self.safety_rate = safety_rate
+        # share of requests rejected as invalid (400), which no retry fixes
+        self.fatal_rate = fatal_rate
+        # seconds a 429 asks the client to wait (as gRPC RetryInfo), None for no hint
+        self.retry_after = retry_after
+        # {"project:location": [from, to]}, seconds after the backend was created during which the endpoint is down
+        self.outages = outages or {}
+        self.created_at = time.time()
+        self.chars_per_token = chars_per_token
+        self.seed = seed
+        self.requests = 0
+
+    def next_rng(self):
+        self.requests += 1
+        return random.Random(f"{self.seed}:{self.requests}")
+
+    def create_model(self, endpoint):
+        return MockModel(self, endpoint)
+
+    def rate_limit_error(self, message):
+        from google.api_core import exceptions
+
+        details = []
+        if self.retry_after is not None:
+            from google.protobuf.duration_pb2 import Duration
+            from google.rpc.error_details_pb2 import RetryInfo
+
+            seconds = int(self.retry_after)
+            nanos = int((self.retry_after - seconds) * 1e9)
+            details.append(RetryInfo(retry_delay=Duration(seconds=seconds, nanos=nanos)))
+        return exceptions.ResourceExhausted(message, details=details)
+
+    def render(self, records):
+        return json.dumps(records, indent=2)
+
+    def max_output_tokens(self, generation_config):
+        if generation_config is None:
+            return math.inf
+        if hasattr(generation_config, "to_dict"):
+            generation_config = generation_config.to_dict()
+        return generation_config.get("max_output_tokens", math.inf)
+
+    async def stream(self, text, finish_reason, usage_metadata, latency):
+        chunks = [text[i : i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        await asyncio.sleep(latency * self.time_to_first_chunk)
+        for i, chunk in enumerate(chunks):
+            if i > 0:
+                await asyncio.sleep(latency * (1 - self.time_to_first_chunk) / (len(chunks) - 1))
+            last = i == len(chunks) - 1
+            candidate = SimpleNamespace(
+                content=SimpleNamespace(parts=[chunk] if chunk else []),
+                finish_reason=SimpleNamespace(name=finish_reason) if last else None,
+            )
+            yield SimpleNamespace(
+                text=chunk, candidates=[candidate], usage_metadata=usage_metadata if last else None
+            )
+
+
+def create_backend(name, model_name, system_instruction, schema, options=None):
+    options = options or {}
+    if name == "vertex":
+        return VertexBackend(model_name, system_instruction, **options)
+    if name == "mock":
+        return MockBackend(schema, **options)
+    raise ValueError(f"Unknown backend {name}, expected 'vertex' or 'mock'")
@@ -0,0 +1,229 @@
+import asyncio
+import json
+from pathlib import Path
+
+import fire
+
+from qol_backend import MockBackend
+from qol_batching import BatchPlanner, diff_records
+from qol_journal import FAILED, SUCCEEDED, RunJournal
+from qol_prefix_cache import prefix_hash
+from qol_response_cache import ResponseCache, response_key
+from qol_semantic import reject_invalid
+from qol_session import Endpoint
+from qol_store import ResultStore
+from qol_stream import parse_records
+from synthesizing_pol import (
+    build_contents,
+    build_generation_config,
+    build_prefix_parts,
+    build_query,
+    load_eds,
+    max_output_tokens,
+    model_name,
+    output_json_schema,
+    parse_query,
+    safety_settings,
+    system_prompt,
+    store_batch,
+)
+
+# Vertex AI batch prediction takes a JSONL file with one {"request": GenerateContentRequest} per line and
+# writes one {"request": ..., "response": GenerateContentResponse, "status": ""} per line back. Nothing
+# besides the request itself is carried through, so results are matched to EDs by the <query_i> tags in it.
+# Neither direction talks to the API, the files are moved with `gsutil` / the batch prediction console
+
+
+def proto_json(message):
+    # the JSON form of the underlying proto message, with enums by name and unset fields left out
+    raw = getattr(message, "_raw_generation_config", None) or getattr(message, "_raw_part", None) or message
+    return json.loads(type(raw).to_json(raw, use_integers_for_enums=False, including_default_value_fields=False))
+
+
+def content_part(part):
+    return {"text": part} if isinstance(part, str) else proto_json(part)
+
+
+def build_request(batch, ed_name):
+    return {
+        "contents": [
+            {"role": "user", "parts": [content_part(part) for part in build_contents(build_query(batch, ed_name))]}
+        ],
+        "systemInstruction": {"parts": [{"text": system_prompt}]},
+        "generationConfig": proto_json(build_generation_config()),
+        "safetySettings": [proto_json(setting) for setting in safety_settings],
+    }
+
+
+def request_query(request):
+    # the query is the last text part of the request
+    parts = request["contents"][-1]["parts"]
+    return next(part["text"] for part in reversed(parts) if "text" in part)
+
+
+def field(message, name):
+    # the output uses the JSON (camelCase) names, accept the proto names as well
+    snake = "".join(f"_{char.lower()}" if char.isupper() else char for char in name)
+    return message.get(name, message.get(snake))
+
+
+def export_requests(
+    output: str = "batch_requests.jsonl",
+    state_dir: str = ".qol_state",
+    all_eds: bool = False,
+):
+    # one request per planned batch, by default only for the EDs the journal doesn't have as succeeded yet
+    data = load_eds()
+    journal = RunJournal(Path(state_dir) / "journal.jsonl")
+    journal.close()
+    pending = [i for i, row in enumerate(data) if all_eds or not journal.is_done(row["ED_ID"])]
+    planner = BatchPlanner(max_output_tokens, state_file=Path(state_dir) / "batch_planner.json")
+
+    def ed_name(i):
+        return data[i]["Electoral Divisions"]
+
+    batches = planner.plan(pending, name=ed_name)
+    with open(output, "w") as f:
+        for batch in batches:
+            f.write(json.dumps({"request": build_request(batch, ed_name)}) + "\n")
+    print(f"Wrote {len(batches)} requests for {len(pending)} EDs to {output}")
+
+
+def import_results(
+    results: str,
+    output_dir: str = "qol_dataset",
+    state_dir: str = ".qol_state",
+    response_cache: bool = True,
+    validate: bool = True,
+    qol_tolerance: float = 15.0,
+):
+    # records go to the same results store, journal and response cache as those of the online path, after
+    # the same validation (see synthesizing_pol.py --validate). EDs missing from the results or with an
+    # invalid record are journaled as failed and picked up by `synthesizing_pol.py --resume`
+    data = load_eds()
+    journal = RunJournal(Path(state_dir) / "journal.jsonl")
+    planner = BatchPlanner(max_output_tokens, state_file=Path(state_dir) / "batch_planner.json")
+    cache = ResponseCache(Path(state_dir) / "response_cache.sqlite") if response_cache else None
+    static_prefix_hash = prefix_hash(model_name, [system_prompt], build_prefix_parts())
+    store = ResultStore(output_dir)
+
+    def batch_ids(batch, names):
+        return [data[i]["ED_ID"] for i in batch if data[i]["Electoral Divisions"] in names]
+
+    requests = succeeded = failed = 0
+    try:
+        with open(results) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                requests += 1
+                batch = []
+                for i, name in parse_query(request_query(entry["request"])):
+                    if i < len(data) and data[i]["Electoral Divisions"] == name:
+                        batch.append(i)
+                    else:
+                        print(f"Skipping {name!r}, it is not row {i} of the ED table")
+                if not batch:
+                    continue
+                names = [data[i]["Electoral Divisions"] for i in batch]
+
+                response = entry.get("response")
+                if not response or not response.get("candidates"):
+                    reason = entry.get("status") or "no response in batch prediction"
+                    journal.record(batch_ids(batch, names), FAILED, reason=reason)
+                    failed += len(batch)
+                    continue
+                candidate = response["candidates"][0]
+                text = "".join(part.get("text", "") for part in (candidate.get("content") or {}).get("parts", []))
+                finish_reason = field(candidate, "finishReason")
+                usage_metadata = field(response, "usageMetadata") or {}
+                planner.observe(names, field(usage_metadata, "candidatesTokenCount"), finish_reason == "MAX_TOKENS")
+
+                records, errors = parse_records(text, output_json_schema["items"])
+                for error in errors:
+                    print(f"Invalid record for batch {batch[0]}: {error}")
+                records, missing, unexpected = diff_records(names, records)
+                for record in unexpected:
+                    print(f"Unexpected record {record['query']!r} for batch {batch[0]}")
+                invalid = {}
+                if validate and records:
+                    records, invalid = reject_invalid(records, qol_tolerance)
+                for name, problems in invalid.items():
+                    print(f"Invalid record {name!r} for batch {batch[0]}: {problems}")
+                if invalid:
+                    reason = "failed validation: " + "; ".join(invalid.values())
+                    journal.record(batch_ids(batch, set(invalid)), FAILED, reason=reason)
+                    failed += len(invalid)
+                if records:
+                    store_batch(store, data, batch, records)
+                    journal.record(batch_ids(batch, {record["query"] for record in records}), SUCCEEDED)
+                    succeeded += len(records)
+                if cache is not None:
+                    generation_config = build_generation_config()
+                    cache.put_many(
+                        [
+                            (response_key(static_prefix_hash, record["query"], generation_config), json.dumps(record))
+                            for record in records
+                        ],
+                        field(usage_metadata, "totalTokenCount"),
+                    )
+                if missing:
+                    reason = f"missing or invalid in batch prediction ({finish_reason})"
+                    journal.record(batch_ids(batch, set(missing)), FAILED, reason=reason)
+                    failed += len(missing)
+    finally:
+        store.close()
+        journal.close()
+        if cache is not None:
+            cache.close()
+    print(f"Imported {succeeded} EDs from {requests} responses, {failed} EDs failed")
+    print(f"Journal: {journal.summary(row['ED_ID'] for row in data)}")
+
+
+def mock_results(requests: str, output: str = "batch_results.jsonl", backend_options: dict = None):
+    # answers an exported requests file the way batch prediction would, from the mock backend, so export
+    # and import can be tried out and tested without Vertex. Faults of the mock (see qol_backend.MockBackend)
+    # turn into failed lines or truncated and incomplete answers
+    options = {"latency": "fixed:0", **(backend_options or {})}
+    model = MockBackend(output_json_schema, **options).create_model(Endpoint("batch-prediction", "mock"))
+
+    async def answer(request):
+        generation_config = {"max_output_tokens": field(request["generationConfig"], "maxOutputTokens")}
+        responses = await model.generate_content_async(
+            [request_query(request)], generation_config=generation_config, stream=True
+        )
+        text = []
+        async for response in responses:
+            text.append(response.text)
+        candidate = response.candidates[0]
+        usage_metadata = response.usage_metadata
+        return {
+            "candidates": [
+                {
+                    "content": {"role": "model", "parts": [{"text": "".join(text)}]},
+                    "finishReason": candidate.finish_reason.name,
+                }
+            ],
+            "usageMetadata": {
+                "promptTokenCount": usage_metadata.prompt_token_count,
+                "candidatesTokenCount": usage_metadata.candidates_token_count,
+                "totalTokenCount": usage_metadata.total_token_count,
+            },
+        }
+
+    async def answer_all():
+        with open(requests) as f, open(output, "w") as out:
+            for line in f:
+                request = json.loads(line)["request"]
+                try:
+                    entry = {"request": request, "response": await answer(request), "status": ""}
+                except Exception as e:
+                    entry = {"request": request, "status": repr(e)}
+                out.write(json.dumps(entry) + "\n")
+
+    asyncio.run(answer_all())
+
+
+if __name__ == "__main__":
+    fire.Fire({"export": export_requests, "import": import_results, "mock": mock_results})
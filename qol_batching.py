@@ -0,0 +1,200 @@
+import json
+from collections import defaultdict
+
+from qol_state import STATE_DIR, atomic_write_text, read_json
+
+
+class BatchPlanner:
+    # packs EDs into requests whose estimated output stays within `safety` of the output token cap.
+    # An ED's output is its fixed size answer plus its name echoed back in "query", so the estimate is
+    # `tokens_per_record + len(name) / chars_per_token`, where `tokens_per_record` is learned from the
+    # usage metadata of past responses and kept on disk for the next run
+    def __init__(
+        self,
+        max_output_tokens=8192,
+        safety=0.8,
+        tokens_per_record=400,
+        max_batch_size=40,
+        chars_per_token=4,
+        smoothing=0.2,
+        state_file=None,
+    ):
+        self.max_output_tokens = max_output_tokens
+        self.safety = safety
+        self.max_batch_size = max_batch_size
+        self.chars_per_token = chars_per_token
+        self.smoothing = smoothing
+        self.state_file = state_file or STATE_DIR / "batch_planner.json"
+        state = read_json(self.state_file, default={})
+        self.tokens_per_record = state.get("tokens_per_record", tokens_per_record)
+        self.observations = state.get("observations", 0)
+
+    @property
+    def budget(self):
+        return self.safety * self.max_output_tokens
+
+    def estimate(self, names):
+        return sum(self.tokens_per_record + len(name) / self.chars_per_token for name in names)
+
+    def plan(self, items, name=lambda item: item):
+        batches = []
+        batch = []
+        tokens = 0.0
+        for item in items:
+            item_tokens = self.estimate([name(item)])
+            if batch and (tokens + item_tokens > self.budget or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch = []
+                tokens = 0.0
+            batch.append(item)
+            tokens += item_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def split(self, batch):
+        middle = len(batch) // 2
+        return [half for half in [batch[:middle], batch[middle:]] if half]
+
+    def observe(self, names, output_tokens, truncated=False):
+        if not names or not output_tokens:
+            return
+        per_record = (output_tokens - sum(len(name) for name in names) / self.chars_per_token) / len(names)
+        if truncated:
+            # the answer was cut off, so the real size is at least this and likely more
+            per_record = max(per_record, self.max_output_tokens / len(names))
+        if self.observations == 0:
+            self.tokens_per_record = per_record
+        else:
+            self.tokens_per_record += self.smoothing * (per_record - self.tokens_per_record)
+        self.observations += 1
+        atomic_write_text(
+            self.state_file,
+            json.dumps({"tokens_per_record": self.tokens_per_record, "observations": self.observations}),
+        )
+
+
+class RetryPacker:
+    # collects EDs that have to be redone from many batches and hands them back as dense batches,
+    # so a couple of missing EDs per batch don't turn into as many nearly empty requests
+    def __init__(self, planner, name=lambda item: item, max_retries=2, order=list, group=None):
+        self.planner = planner
+        self.name = name
+        # applied to the waiting items before they're packed, e.g. `locality_order`
+        self.order = order
+        # with `group` (e.g. the county) no batch spans two groups
+        self.group = group
+        self.max_retries = max_retries
+        # failures per item so far
+        self.attempts = defaultdict(int)
+        self.waiting = []
+        self.exhausted = []
+
+    def pack(self, items):
+        # the batches of every group
+        items = self.order(items)
+        if self.group is None:
+            return [self.planner.plan(items, name=self.name)]
+        groups = defaultdict(list)
+        for item in items:
+            groups[self.group(item)].append(item)
+        return [self.planner.plan(group_items, name=self.name) for group_items in groups.values()]
+
+    def add(self, items):
+        # returns the batches that are full by now, the rest waits for more failures or `flush`
+        for item in items:
+            self.attempts[item] += 1
+            if self.attempts[item] > self.max_retries:
+                self.exhausted.append(item)
+            else:
+                self.waiting.append(item)
+        batches = []
+        waiting = []
+        for group_batches in self.pack(self.waiting):
+            if group_batches:
+                waiting.extend(group_batches.pop())
+            batches.extend(group_batches)
+        self.waiting = waiting
+        return batches
+
+    def flush(self):
+        batches = [batch for group_batches in self.pack(self.waiting) for batch in group_batches]
+        self.waiting = []
+        return batches
+
+
+def hilbert_index(x, y, n):
+    # distance of cell (x, y) along the Hilbert curve through an n x n grid, n a power of two
+    d = 0
+    s = n // 2
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x = n - 1 - x
+                y = n - 1 - y
+            x, y = y, x
+        s //= 2
+    return d
+
+
+def locality_order(items, position, group=None, grid_bits=10):
+    # sorts items along a Hilbert curve through a grid over their (x, y) positions, so neighbouring items
+    # end up next to each other and batches cut from the order are spatially compact. With `group`
+    # (e.g. the county) every group stays together, groups are ordered by where their centre lies on the curve
+    if not items:
+        return []
+    positions = {item: position(item) for item in items}
+    min_x = min(x for x, _ in positions.values())
+    min_y = min(y for _, y in positions.values())
+    extent = max(max(x - min_x, y - min_y) for x, y in positions.values()) or 1.0
+    n = 1 << grid_bits
+
+    def curve(x, y):
+        return hilbert_index(
+            min(n - 1, int((x - min_x) / extent * n)), min(n - 1, int((y - min_y) / extent * n)), n
+        )
+
+    key = {item: curve(*positions[item]) for item in items}
+    if group is None:
+        return sorted(items, key=key.get)
+    groups = defaultdict(list)
+    for item in items:
+        groups[group(item)].append(item)
+    group_key = {
+        name: curve(
+            sum(positions[item][0] for item in members) / len(members),
+            sum(positions[item][1] for item in members) / len(members),
+        )
+        for name, members in groups.items()
+    }
+    return sorted(items, key=lambda item: (group_key[group(item)], key[item]))
+
+
+def batch_spread(batches, position):
+    # median over batches of the mean distance of an item to its batch centre, in units of the positions
+    spreads = []
+    for batch in batches:
+        points = [position(item) for item in batch]
+        cx = sum(x for x, _ in points) / len(points)
+        cy = sum(y for _, y in points) / len(points)
+        spreads.append(sum(((x - cx) ** 2 + (y - cy) ** 2) ** 0.5 for x, y in points) / len(points))
+    spreads.sort()
+    return spreads[len(spreads) // 2] if spreads else 0.0
+
+
+def diff_records(names, records):
+    # match the records of a response against the requested ED names. Records are only accepted under
+    # the exact name that was asked for, a renamed ED (e.g. Swineford -> Swinford) counts as missing
+    requested = set(names)
+    matched = {}
+    unexpected = []
+    for record in records:
+        if record["query"] in requested and record["query"] not in matched:
+            matched[record["query"]] = record
+        else:
+            unexpected.append(record)
+    missing = [name for name in names if name not in matched]
+    return list(matched.values()), missing, unexpected
@@ -0,0 +1,364 @@
+import asyncio
+import csv
+import gzip
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import fire
+from google.auth.credentials import AnonymousCredentials
+
+from qol_backend import MockBackend, VertexBackend, mock_record
+from qol_session import Endpoint, SessionPool
+from qol_store import ResultStore
+
+REPO_DIR = Path(__file__).parent
+ED_DATASET = REPO_DIR / "ed_dataset" / "irl_ed.csv.gz"
+
+BENCH_SCHEMA = {"type": "ARRAY", "items": {"type": "OBJECT", "properties": {}}}
+
+
+def stand_in_factory(latency):
+    # real SDK handles are still created (with anonymous credentials, so no auth round trip) to
+    # measure the construction and channel setup cost, only the request itself goes to the mock backend
+    vertex = VertexBackend("gemini-1.5-pro-001", ["system prompt"], credentials=AnonymousCredentials())
+    mock = MockBackend(BENCH_SCHEMA, latency=f"fixed:{latency}")
+
+    def create_stand_in(endpoint):
+        model = vertex.create_model(endpoint)
+        # build the prediction client like the first real request would
+        model._prediction_async_client
+        return mock.create_model(endpoint)
+
+    return create_stand_in
+
+
+async def bench_per_call_setup(calls, latency):
+    endpoint = Endpoint("bench-project", "europe-west2", requests_per_minute=calls)
+    create_stand_in = stand_in_factory(latency)
+    setup = 0.0
+    for _ in range(calls):
+        start = time.perf_counter()
+        model = create_stand_in(endpoint)
+        setup += time.perf_counter() - start
+        async for _ in await model.generate_content_async([""]):
+            pass
+    return setup
+
+
+async def bench_pooled_setup(calls, latency):
+    endpoint = Endpoint("bench-project", "europe-west2", requests_per_minute=calls)
+    start = time.perf_counter()
+    pool = SessionPool([endpoint], stand_in_factory(latency))
+    setup = time.perf_counter() - start
+    for _ in range(calls):
+        start = time.perf_counter()
+        session, _ = await pool.acquire()
+        setup += time.perf_counter() - start
+        async for _ in await session.model.generate_content_async([""]):
+            pass
+        pool.release(session)
+    return setup
+
+
+def bench_sessions(calls=100, latency=0.001):
+    results = {}
+    for name, bench in [("per_call", bench_per_call_setup), ("pooled", bench_pooled_setup)]:
+        setup = asyncio.run(bench(calls, latency))
+        results[name] = {"calls": calls, "setup_seconds": setup, "setup_ms_per_call": 1000 * setup / calls}
+    results["speedup"] = results["per_call"]["setup_seconds"] / results["pooled"]["setup_seconds"]
+    return results
+
+
+def read_ed_rows():
+    with gzip.open(ED_DATASET, "rt") as f:
+        return list(csv.DictReader(f))
+
+
+def synthetic_ed_rows(rows):
+    # the real table repeated until it has `rows` rows, names and ids stay unique
+    real_rows = read_ed_rows()
+    for k in range(rows):
+        row = dict(real_rows[k % len(real_rows)])
+        if k >= len(real_rows):
+            row["Electoral Divisions"] = f"{row['Electoral Divisions']} #{k // len(real_rows)}"
+            row["ED_ID"] = str(k)
+            row["GUID"] = f"synthetic-{k}"
+        yield row
+
+
+def write_ed_dataset(directory, rows):
+    (directory / "ed_dataset").mkdir(parents=True, exist_ok=True)
+    names = []
+    with gzip.open(directory / "ed_dataset" / "irl_ed.csv.gz", "wt") as f:
+        writer = None
+        for row in synthetic_ed_rows(rows):
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=row.keys())
+                writer.writeheader()
+            writer.writerow(row)
+            names.append(row["Electoral Divisions"])
+    return names
+
+
+def write_qol_dataset(directory, names, records_per_batch):
+    # a results store as the generator writes it, one commit per batch, scores from the mock backend's
+    # deterministic answers. ED_IDs are the row numbers, as in synthetic_ed_rows
+    from synthesizing_pol import output_json_schema
+
+    template = mock_record("template", output_json_schema["items"])["answer"]
+    store = ResultStore(directory / "qol_dataset", sync=False)
+    batches = 0
+    for start in range(0, len(names), records_per_batch):
+        chunk = names[start : start + records_per_batch]
+        store.put((str(start + k), {"query": name, "answer": template}) for k, name in enumerate(chunk))
+        batches += 1
+    store.close()
+    return batches
+
+
+def run_measured(args, cwd):
+    # runs a stage as its own process, like it is run in practice, and reports wall time and peak memory
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(args, cwd=cwd, stdout=subprocess.DEVNULL, stderr=stderr)
+        _, status, rusage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"{' '.join(map(str, args))} failed:\n{stderr.read().decode()[-2000:]}")
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS
+    peak_bytes = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+    return {"seconds": elapsed, "peak_memory_mb": peak_bytes / 1024 / 1024}
+
+
+def bench_generation(eds=500, latency="lognormal:0.5:0.5", requests_per_minute=600, endpoints=1, options=None):
+    # the full generation pipeline against the mock backend, whose server side quota matches ours
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        write_ed_dataset(directory, eds)
+        backend_options = {"latency": latency, "requests_per_minute": requests_per_minute, **(options or {})}
+        endpoint_specs = ",".join(f"bench-{k}:europe-west2" for k in range(endpoints))
+        result = run_measured(
+            [
+                sys.executable,
+                REPO_DIR / "synthesizing_pol.py",
+                "--backend=mock",
+                f"--backend_options={json.dumps(backend_options)}",
+                f"--endpoints={endpoint_specs}",
+                f"--requests_per_minute={requests_per_minute}",
+                "--response_cache=False",
+            ],
+            directory,
+        )
+        store = ResultStore(directory / "qol_dataset", read_only=True)
+        records = len(store)
+        store.close()
+    return {
+        "eds": eds,
+        "endpoints": endpoints,
+        "requests_per_minute": requests_per_minute,
+        "latency": latency,
+        "records": records,
+        **result,
+        "eds_per_second": records / result["seconds"],
+    }
+
+
+def bench_validation(batches=1000, records_per_batch=10, workers=(1,)):
+    # the same store validated with each of the `workers` process counts
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        names = [row["Electoral Divisions"] for row in synthetic_ed_rows(batches * records_per_batch)]
+        write_qol_dataset(directory, names, records_per_batch)
+        validator = [sys.executable, REPO_DIR / "qol_data_validator.py"]
+        results = []
+        for count in workers:
+            result = run_measured([*validator, f"--workers={count}", "--full"], directory)
+            results.append({"workers": count, **result, "records_per_second": len(names) / result["seconds"]})
+        # nothing changed since the last run, every verdict comes from the validation manifest
+        unchanged = run_measured(validator, directory)
+    return {"batches": batches, "records": len(names), "runs": results, "unchanged_rerun": unchanged}
+
+
+def bench_schema(records=20000, records_per_batch=16, invalid_every=100):
+    # in process, the schema check alone: jsonschema.validate per batch against the old schema (ten copies of
+    # the record schema in tuple form, so records past the tenth of a batch went unchecked), jsonschema on every
+    # record, and the compiled validator of qol_data_validator. About every `invalid_every`-th record has a
+    # string score, the last one of its batch so the old schema can't see it
+    import jsonschema
+
+    from qol_data_validator import QOL_JSON_SCHEMA, validate_records
+    from synthesizing_pol import output_json_schema
+
+    template = mock_record("template", output_json_schema["items"])["answer"]
+    invalid = json.loads(json.dumps(template))
+    invalid["health_equity"]["food_choice"] = "high"
+    invalid_batch_every = max(1, invalid_every // records_per_batch)
+    batches = []
+    for start in range(0, records, records_per_batch):
+        batch = [{"query": f"ED {k}", "answer": template} for k in range(start, min(start + records_per_batch, records))]
+        if len(batches) % invalid_batch_every == 0:
+            batch[-1] = {"query": batch[-1]["query"], "answer": invalid}
+        batches.append(batch)
+    planted = sum(record["answer"] is invalid for batch in batches for record in batch)
+    old_schema = {**QOL_JSON_SCHEMA, "items": [QOL_JSON_SCHEMA["items"]] * 10}
+    validator = jsonschema.Draft4Validator(QOL_JSON_SCHEMA)
+
+    def old(batch):
+        try:
+            jsonschema.validate(batch, old_schema)
+            return 0
+        except jsonschema.exceptions.ValidationError:
+            return 1
+
+    def every_record(batch):
+        return len({error.absolute_path[0] for error in validator.iter_errors(batch)})
+
+    def compiled(batch):
+        return len({index for index, _, _, _ in validate_records(batch)})
+
+    results = {"records": records, "records_per_batch": records_per_batch, "invalid_records": planted}
+    for name, check in [("jsonschema_validate", old), ("jsonschema_all_records", every_record), ("compiled", compiled)]:
+        start = time.perf_counter()
+        found = sum(check(batch) for batch in batches)
+        elapsed = time.perf_counter() - start
+        results[name] = {"seconds": elapsed, "records_per_second": records / elapsed, "invalid_found": found}
+    return results
+
+
+def bench_semantic(rows=1000000, invalid_every=1000):
+    # in process, the semantic checks of qol_semantic on random answers with a matching QoL: building the
+    # score matrix from the records (the only per-record Python) and the vectorized checks on it. Every
+    # `invalid_every`-th answer has a sub-score out of range
+    import numpy as np
+
+    from qol_semantic import score_columns, score_matrix, score_violations
+
+    columns = score_columns()
+    scores = np.random.default_rng(0).integers(1, 101, size=(rows, len(columns) - 1))
+    scores[::invalid_every, 0] = 150
+    answers = []
+    for row in scores.tolist():
+        answer = {"QoL": round(sum(row) / len(row))}
+        for (domain, key), value in zip(columns[1:], row):
+            answer.setdefault(domain, {})[key] = value
+        answers.append(answer)
+    start = time.perf_counter()
+    scores = score_matrix(answers, columns)
+    matrix_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    violations = score_violations(scores, columns)
+    check_seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "matrix_seconds": matrix_seconds,
+        "check_seconds": check_seconds,
+        "rows_per_second": rows / (matrix_seconds + check_seconds),
+        "out_of_range": sum(check == "out_of_range" for _, check, _ in violations),
+    }
+
+
+def bench_combine(rows=3391, records_per_batch=100):
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        names = write_ed_dataset(directory, rows)
+        batches = write_qol_dataset(directory, names, records_per_batch)
+        result = run_measured([sys.executable, REPO_DIR / "qol_combine.py"], directory)
+    return {"rows": rows, "batches": batches, **result, "rows_per_second": rows / result["seconds"]}
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.time(),
+    }
+
+
+def report(results, output):
+    results = {"environment": environment(), **results}
+    text = json.dumps(results, indent=2)
+    print(text)
+    if output:
+        Path(output).write_text(text + "\n")
+
+
+def sessions(calls: int = 100, latency: float = 0.001, output: str = None):
+    # per-call vertexai.init + GenerativeModel + client setup versus handles reused from the session pool
+    report({"sessions": bench_sessions(calls, latency)}, output)
+
+
+def generation(
+    eds: int = 500,
+    latency: str = "lognormal:0.5:0.5",
+    requests_per_minute: int = 600,
+    endpoints: int = 1,
+    options: dict = None,
+    output: str = None,
+):
+    # `options` go to the mock backend, e.g. '{"unavailable_rate": 0.05, "truncation_rate": 0.02}'
+    report({"generation": bench_generation(eds, latency, requests_per_minute, endpoints, options)}, output)
+
+
+def validation(batches: int = 1000, records_per_batch: int = 10, workers: str = "1", output: str = None):
+    # e.g. --workers 1,2,4,8 to see how validation scales with cores
+    workers = [int(count) for count in str(workers).strip("()[]").split(",")]
+    report({"validation": bench_validation(batches, records_per_batch, workers)}, output)
+
+
+def schema(records: int = 20000, records_per_batch: int = 16, output: str = None):
+    report({"schema": bench_schema(records, records_per_batch)}, output)
+
+
+def semantic(rows: int = 1000000, output: str = None):
+    report({"semantic": bench_semantic(rows)}, output)
+
+
+def combine(rows: str = "3391,10000,100000,1000000", records_per_batch: int = 100, output: str = None):
+    rows = [int(row) for row in str(rows).strip("()[]").split(",")]
+    report({"combine": [bench_combine(row, records_per_batch) for row in rows]}, output)
+
+
+def suite(
+    output: str = "bench_results.json", eds: int = 500, batches: int = 1000, rows: str = "3391,10000,100000,1000000"
+):
+    # everything at once, written as json so results can be compared between versions
+    rows = [int(row) for row in str(rows).strip("()[]").split(",")]
+    results = {
+        "sessions": bench_sessions(),
+        "generation": bench_generation(eds),
+        "validation": bench_validation(batches, workers=sorted({1, os.cpu_count() or 1})),
+        "schema": bench_schema(),
+        "semantic": bench_semantic(),
+        "combine": [bench_combine(row) for row in rows],
+    }
+    report(results, output)
+
+
+if __name__ == "__main__":
+    fire.Fire(
+        {
+            "sessions": sessions,
+            "generation": generation,
+            "validation": validation,
+            "schema": schema,
+            "semantic": semantic,
+            "combine": combine,
+            "suite": suite,
+        }
+    )
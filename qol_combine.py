@@ -5,11 +5,13 @@ from pathlib import Path
 
 import fire
 
+from qol_store import ResultStore
+
 ED_DATA_DIR = Path("ed_dataset").glob("*.csv.gz")
 ED_DATA_FORMAT = "csv"
 
-QOL_DATA_DIR = Path("qol_dataset").glob("*.json")
-QOL_DATA_FORMAT = "json"
+QOL_DATA_DIR = Path("qol_dataset")
+QOL_DATA_FORMAT = "store"
 
 OUTPUT_DIR = Path("combined_dataset") / "irl_ed_qol.csv"
 OUTPUT_FORMAT = "csv"
@@ -85,6 +87,11 @@ def read_data(data_dir, data_format):
         for file in data_dir:
             with open(file, "r") as f:
                 result_data.extend(json.load(f))
+    elif data_format == "store":
+        # the latest record of every ED, streamed from the results store (see qol_store)
+        store = ResultStore(data_dir, read_only=True)
+        result_data.extend(record for _, record in store.records())
+        store.close()
     print(f"Read {len(result_data)} rows of data in {data_format} from {data_dir}")
     return result_data
 
@@ -0,0 +1,83 @@
+import collections
+from pathlib import Path
+
+import fire
+
+import synthesizing_pol
+from qol_journal import FAILED, RunJournal
+from qol_semantic import check_store
+from qol_shard import shard_of
+from qol_store import ResultStore
+
+# the checks that send an ED back to the generator, records of EDs not in the ED table are left alone
+RETRY_CHECKS = {
+    "missing",
+    "name_mismatch",
+    "duplicate_name",
+    "incomplete",
+    "out_of_range",
+    "qol_residual",
+    "constant",
+    "duplicate_answer",
+}
+
+
+def complete(
+    max_passes: int = 3,
+    resume: bool = False,
+    qol_tolerance: float = 15.0,
+    state_dir: str = ".qol_state",
+    output_dir: str = "qol_dataset",
+    shard_index: int = 0,
+    num_shards: int = 1,
+    **kwargs,
+):
+    # generates until the store passes the semantic checks or `max_passes` runs of synthesizing_pol are used
+    # up. Every run validates each response as it arrives and retries the EDs that fail, what only shows up
+    # across the whole store (an ED answered twice, answers copied between batches) is checked after a run:
+    # the EDs involved are journaled as failed and their cached answers evicted, so the next pass redoes them.
+    # Takes every option of synthesizing_pol.py
+    options = dict(
+        qol_tolerance=qol_tolerance,
+        state_dir=state_dir,
+        output_dir=output_dir,
+        shard_index=shard_index,
+        num_shards=num_shards,
+        **kwargs,
+    )
+    shard_state_dir, shard_output_dir = synthesizing_pol.shard_dirs(state_dir, output_dir, shard_index, num_shards)
+    data = [row for row in synthesizing_pol.load_eds() if shard_of(row["ED_ID"], num_shards) == shard_index]
+    evict = None
+    failing = {}
+    for attempt in range(1, max_passes + 1):
+        print(f"Pass {attempt} of {max_passes}")
+        synthesizing_pol.main(resume=resume or attempt > 1, evict=evict, **options)
+
+        store = ResultStore(shard_output_dir, read_only=True)
+        try:
+            table = check_store(store, data, qol_tolerance)
+        finally:
+            store.close()
+        failing = collections.defaultdict(list)
+        for ed_id, _, check, detail in table:
+            if check in RETRY_CHECKS:
+                failing[ed_id].append(f"{check} {detail}")
+        if not failing:
+            print(f"Complete after {attempt} passes: {len(data)} EDs pass the store checks")
+            return
+        counts = collections.Counter(check for _, _, check, _ in table if check in RETRY_CHECKS)
+        print("Store checks: " + ", ".join(f"{count} {check}" for check, count in counts.most_common()))
+
+        journal = RunJournal(Path(shard_state_dir) / "journal.jsonl")
+        try:
+            for ed_id, problems in failing.items():
+                journal.record([ed_id], FAILED, reason="store check " + "; ".join(problems))
+        finally:
+            journal.close()
+        evict = ",".join(failing)
+
+    print(f"{len(failing)} EDs still fail the store checks after {max_passes} passes, see the journal")
+
+
+if __name__ == "__main__":
+    fire.Fire(complete)
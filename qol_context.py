@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+import statistics
+from collections import defaultdict
+
+import fire
+
+from qol_assets import asset_bytes
+
+# the counties (as in the COUNTY column of irl_ed.csv.gz) each settlement of public_transport.csv lies in,
+# towns spanning a county border are listed under both. Settlements missing here are kept in every slice
+SETTLEMENT_COUNTIES = {
+    "Naas": ["KILDARE"],
+    "Athlone": ["WESTMEATH", "ROSCOMMON"],
+    "Balbriggan": ["DUBLIN"],
+    "Bray": ["WICKLOW", "DUBLIN"],
+    "Carlow": ["CARLOW"],
+    "Drogheda": ["LOUTH", "MEATH"],
+    "Newbridge": ["KILDARE"],
+    "Dundalk": ["LOUTH"],
+    "Ennis": ["CLARE"],
+    "Kilkenny": ["KILKENNY"],
+    "Mullingar": ["WESTMEATH"],
+    "Navan": ["MEATH"],
+    "Portlaoise": ["LAOIS"],
+    "Tralee": ["KERRY"],
+    "Wexford": ["WEXFORD"],
+    "Waterford city and suburbs": ["WATERFORD", "KILKENNY"],
+    "Celbridge": ["KILDARE"],
+    "Galway city and suburbs": ["GALWAY"],
+    "Limerick city and suburbs": ["LIMERICK", "CLARE"],
+    "Cork city and suburbs": ["CORK"],
+    "Swords": ["DUBLIN"],
+    "Dublin city and suburbs": ["DUBLIN"],
+}
+
+POPULATION = "Population (2022) - F1060C01"
+
+# what Gemini charges for an image, text is estimated at 4 characters per token like everywhere else
+IMAGE_TOKENS = 258
+
+
+def estimate_tokens(parts, chars_per_token=4):
+    tokens = 0.0
+    for part in parts:
+        if isinstance(part, str):
+            tokens += len(part) / chars_per_token
+        elif part.inline_data.mime_type.startswith("text/"):
+            tokens += len(part.inline_data.data) / chars_per_token
+        else:
+            tokens += IMAGE_TOKENS
+    return int(tokens)
+
+
+class CountyContext:
+    # slices of the prompt statistics for a set of counties: the public transport rows of the settlements
+    # in them instead of the whole table, and a small population table of the counties (from the ED table)
+    # instead of the two national population charts
+    def __init__(self, data):
+        self.eds_by_county = defaultdict(list)
+        for row in data:
+            self.eds_by_county[row["COUNTY"]].append(row)
+        reader = csv.reader(io.StringIO(asset_bytes("public_transport_csv_as_text").decode()))
+        self.transport_header, *self.transport_rows = list(reader)
+
+    def transport_table(self, counties):
+        rows = [
+            row
+            for row in self.transport_rows
+            if row[0] not in SETTLEMENT_COUNTIES or set(SETTLEMENT_COUNTIES[row[0]]) & set(counties)
+        ]
+        out = io.StringIO()
+        csv.writer(out, lineterminator="\n").writerows([self.transport_header, *rows])
+        return out.getvalue()
+
+    def population_table(self, counties):
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(
+            ["County", "Province", "EDs", "Population (2022)", "Median ED population", "Persons per km2"]
+        )
+        for county in sorted(counties):
+            eds = self.eds_by_county[county]
+            population = [int(row[POPULATION]) for row in eds]
+            area = sum(float(row["AREA"]) for row in eds) / 1e6
+            writer.writerow(
+                [
+                    county.title(),
+                    eds[0]["PROVINCE"],
+                    len(eds),
+                    sum(population),
+                    int(statistics.median(population)),
+                    round(sum(population) / area, 1),
+                ]
+            )
+        return out.getvalue()
+
+
+def report(chars_per_token: int = 4):
+    # prompt size per county against the full prompt, without sending anything
+    from synthesizing_pol import build_prefix_parts, load_eds
+
+    data = load_eds()
+    context = CountyContext(data)
+    full = estimate_tokens(build_prefix_parts(), chars_per_token)
+    counties = {}
+    for county in sorted(context.eds_by_county):
+        tokens = estimate_tokens(build_prefix_parts(context, [county]), chars_per_token)
+        counties[county] = {"tokens": tokens, "reduction": 1 - tokens / full}
+    print(json.dumps({"full_tokens": full, "counties": counties}, indent=2))
+
+
+if __name__ == "__main__":
+    fire.Fire({"report": report})
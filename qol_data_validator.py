@@ -1,1427 +1,426 @@
 from pathlib import Path
+import collections
+import concurrent.futures
+import functools
+import gzip
+import hashlib
 import json
-import jsonschema
+import zlib
+
+import fire
+
+from qol_schema import compile_schema, json_path
+from qol_state import STATE_DIR, atomic_write_text, read_json
+from qol_store import ResultStore, read_member
 
 QOL_JSON_SCHEMA = {
   "$schema": "http://json-schema.org/draft-04/schema#",
   "type": "array",
-  "items": [
-    {
-      "type": "object",
-      "properties": {
-        "answer": {
-          "type": "object",
-          "properties": {
-            "QoL": {
-              "type": "integer"
-            },
-            "a_sense_of_control": {
-              "type": "object",
-              "properties": {
-                "cost_of_living": {
-                  "type": "integer"
-                },
-                "essential_services": {
-                  "type": "integer"
-                },
-                "influence_and_contribution": {
-                  "type": "integer"
-                },
-                "safety": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "cost_of_living",
-                "essential_services",
-                "influence_and_contribution",
-                "safety"
-              ]
-            },
-            "a_sense_of_wonder": {
-              "type": "object",
-              "properties": {
-                "distinctive_design_and_culture": {
-                  "type": "integer"
-                },
-                "play_and_recreation": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "distinctive_design_and_culture",
-                "play_and_recreation"
-              ]
-            },
-            "connected_communities": {
-              "type": "object",
-              "properties": {
-                "belonging": {
-                  "type": "integer"
-                },
-                "local_business_and_jobs": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "belonging",
-                "local_business_and_jobs"
-              ]
-            },
-            "connection_to_nature": {
-              "type": "object",
-              "properties": {
-                "biodiversity": {
-                  "type": "integer"
-                },
-                "climate_resilience_and_adaptation": {
-                  "type": "integer"
-                },
-                "green_and_blue_spaces": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "biodiversity",
-                "climate_resilience_and_adaptation",
-                "green_and_blue_spaces"
-              ]
-            },
-            "getting_around": {
-              "type": "object",
-              "properties": {
-                "car": {
-                  "type": "integer"
-                },
-                "public_transport": {
-                  "type": "integer"
-                },
-                "walking_and_cycling": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "car",
-                "public_transport",
-                "walking_and_cycling"
-              ]
-            },
-            "health_equity": {
-              "type": "object",
-              "properties": {
-                "air_noise_light": {
-                  "type": "integer"
-                },
-                "food_choice": {
-                  "type": "integer"
-                },
-                "housing_standard": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "air_noise_light",
-                "food_choice",
-                "housing_standard"
-              ]
-            }
+  "items": {
+    "type": "object",
+    "properties": {
+      "answer": {
+        "type": "object",
+        "properties": {
+          "QoL": {
+            "type": "integer"
           },
-          "required": [
-            "QoL",
-            "a_sense_of_control",
-            "a_sense_of_wonder",
-            "connected_communities",
-            "connection_to_nature",
-            "getting_around",
-            "health_equity"
-          ]
-        },
-        "query": {
-          "type": "string"
-        }
-      },
-      "required": [
-        "answer",
-        "query"
-      ]
-    },
-    {
-      "type": "object",
-      "properties": {
-        "answer": {
-          "type": "object",
-          "properties": {
-            "QoL": {
-              "type": "integer"
-            },
-            "a_sense_of_control": {
-              "type": "object",
-              "properties": {
-                "cost_of_living": {
-                  "type": "integer"
-                },
-                "essential_services": {
-                  "type": "integer"
-                },
-                "influence_and_contribution": {
-                  "type": "integer"
-                },
-                "safety": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "cost_of_living",
-                "essential_services",
-                "influence_and_contribution",
-                "safety"
-              ]
-            },
-            "a_sense_of_wonder": {
-              "type": "object",
-              "properties": {
-                "distinctive_design_and_culture": {
-                  "type": "integer"
-                },
-                "play_and_recreation": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "distinctive_design_and_culture",
-                "play_and_recreation"
-              ]
-            },
-            "connected_communities": {
-              "type": "object",
-              "properties": {
-                "belonging": {
-                  "type": "integer"
-                },
-                "local_business_and_jobs": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "belonging",
-                "local_business_and_jobs"
-              ]
-            },
-            "connection_to_nature": {
-              "type": "object",
-              "properties": {
-                "biodiversity": {
-                  "type": "integer"
-                },
-                "climate_resilience_and_adaptation": {
-                  "type": "integer"
-                },
-                "green_and_blue_spaces": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "biodiversity",
-                "climate_resilience_and_adaptation",
-                "green_and_blue_spaces"
-              ]
-            },
-            "getting_around": {
-              "type": "object",
-              "properties": {
-                "car": {
-                  "type": "integer"
-                },
-                "public_transport": {
-                  "type": "integer"
-                },
-                "walking_and_cycling": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "car",
-                "public_transport",
-                "walking_and_cycling"
-              ]
-            },
-            "health_equity": {
-              "type": "object",
-              "properties": {
-                "air_noise_light": {
-                  "type": "integer"
-                },
-                "food_choice": {
-                  "type": "integer"
-                },
-                "housing_standard": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "air_noise_light",
-                "food_choice",
-                "housing_standard"
-              ]
-            }
+          "a_sense_of_control": {
+            "type": "object",
+            "properties": {
+              "cost_of_living": {
+                "type": "integer"
+              },
+              "essential_services": {
+                "type": "integer"
+              },
+              "influence_and_contribution": {
+                "type": "integer"
+              },
+              "safety": {
+                "type": "integer"
+              }
+            },
+            "required": [
+              "cost_of_living",
+              "essential_services",
+              "influence_and_contribution",
+              "safety"
+            ]
           },
-          "required": [
-            "QoL",
-            "a_sense_of_control",
-            "a_sense_of_wonder",
-            "connected_communities",
-            "connection_to_nature",
-            "getting_around",
-            "health_equity"
-          ]
-        },
-        "query": {
-          "type": "string"
-        }
-      },
-      "required": [
-        "answer",
-        "query"
-      ]
-    },
-    {
-      "type": "object",
-      "properties": {
-        "answer": {
-          "type": "object",
-          "properties": {
-            "QoL": {
-              "type": "integer"
-            },
-            "a_sense_of_control": {
-              "type": "object",
-              "properties": {
-                "cost_of_living": {
-                  "type": "integer"
-                },
-                "essential_services": {
-                  "type": "integer"
-                },
-                "influence_and_contribution": {
-                  "type": "integer"
-                },
-                "safety": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "cost_of_living",
-                "essential_services",
-                "influence_and_contribution",
-                "safety"
-              ]
-            },
-            "a_sense_of_wonder": {
-              "type": "object",
-              "properties": {
-                "distinctive_design_and_culture": {
-                  "type": "integer"
-                },
-                "play_and_recreation": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "distinctive_design_and_culture",
-                "play_and_recreation"
-              ]
-            },
-            "connected_communities": {
-              "type": "object",
-              "properties": {
-                "belonging": {
-                  "type": "integer"
-                },
-                "local_business_and_jobs": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "belonging",
-                "local_business_and_jobs"
-              ]
-            },
-            "connection_to_nature": {
-              "type": "object",
-              "properties": {
-                "biodiversity": {
-                  "type": "integer"
-                },
-                "climate_resilience_and_adaptation": {
-                  "type": "integer"
-                },
-                "green_and_blue_spaces": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "biodiversity",
-                "climate_resilience_and_adaptation",
-                "green_and_blue_spaces"
-              ]
-            },
-            "getting_around": {
-              "type": "object",
-              "properties": {
-                "car": {
-                  "type": "integer"
-                },
-                "public_transport": {
-                  "type": "integer"
-                },
-                "walking_and_cycling": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "car",
-                "public_transport",
-                "walking_and_cycling"
-              ]
-            },
-            "health_equity": {
-              "type": "object",
-              "properties": {
-                "air_noise_light": {
-                  "type": "integer"
-                },
-                "food_choice": {
-                  "type": "integer"
-                },
-                "housing_standard": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "air_noise_light",
-                "food_choice",
-                "housing_standard"
-              ]
-            }
+          "a_sense_of_wonder": {
+            "type": "object",
+            "properties": {
+              "distinctive_design_and_culture": {
+                "type": "integer"
+              },
+              "play_and_recreation": {
+                "type": "integer"
+              }
+            },
+            "required": [
+              "distinctive_design_and_culture",
+              "play_and_recreation"
+            ]
           },
-          "required": [
-            "QoL",
-            "a_sense_of_control",
-            "a_sense_of_wonder",
-            "connected_communities",
-            "connection_to_nature",
-            "getting_around",
-            "health_equity"
-          ]
-        },
-        "query": {
-          "type": "string"
-        }
-      },
-      "required": [
-        "answer",
-        "query"
-      ]
-    },
-    {
-      "type": "object",
-      "properties": {
-        "answer": {
-          "type": "object",
-          "properties": {
-            "QoL": {
-              "type": "integer"
-            },
-            "a_sense_of_control": {
-              "type": "object",
-              "properties": {
-                "cost_of_living": {
-                  "type": "integer"
-                },
-                "essential_services": {
-                  "type": "integer"
-                },
-                "influence_and_contribution": {
-                  "type": "integer"
-                },
-                "safety": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "cost_of_living",
-                "essential_services",
-                "influence_and_contribution",
-                "safety"
-              ]
-            },
-            "a_sense_of_wonder": {
-              "type": "object",
-              "properties": {
-                "distinctive_design_and_culture": {
-                  "type": "integer"
-                },
-                "play_and_recreation": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "distinctive_design_and_culture",
-                "play_and_recreation"
-              ]
-            },
-            "connected_communities": {
-              "type": "object",
-              "properties": {
-                "belonging": {
-                  "type": "integer"
-                },
-                "local_business_and_jobs": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "belonging",
-                "local_business_and_jobs"
-              ]
-            },
-            "connection_to_nature": {
-              "type": "object",
-              "properties": {
-                "biodiversity": {
-                  "type": "integer"
-                },
-                "climate_resilience_and_adaptation": {
-                  "type": "integer"
-                },
-                "green_and_blue_spaces": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "biodiversity",
-                "climate_resilience_and_adaptation",
-                "green_and_blue_spaces"
-              ]
-            },
-            "getting_around": {
-              "type": "object",
-              "properties": {
-                "car": {
-                  "type": "integer"
-                },
-                "public_transport": {
-                  "type": "integer"
-                },
-                "walking_and_cycling": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "car",
-                "public_transport",
-                "walking_and_cycling"
-              ]
-            },
-            "health_equity": {
-              "type": "object",
-              "properties": {
-                "air_noise_light": {
-                  "type": "integer"
-                },
-                "food_choice": {
-                  "type": "integer"
-                },
-                "housing_standard": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "air_noise_light",
-                "food_choice",
-                "housing_standard"
-              ]
-            }
+          "connected_communities": {
+            "type": "object",
+            "properties": {
+              "belonging": {
+                "type": "integer"
+              },
+              "local_business_and_jobs": {
+                "type": "integer"
+              }
+            },
+            "required": [
+              "belonging",
+              "local_business_and_jobs"
+            ]
           },
-          "required": [
-            "QoL",
-            "a_sense_of_control",
-            "a_sense_of_wonder",
-            "connected_communities",
-            "connection_to_nature",
-            "getting_around",
-            "health_equity"
-          ]
-        },
-        "query": {
-          "type": "string"
-        }
-      },
-      "required": [
-        "answer",
-        "query"
-      ]
-    },
-    {
-      "type": "object",
-      "properties": {
-        "answer": {
-          "type": "object",
-          "properties": {
-            "QoL": {
-              "type": "integer"
-            },
-            "a_sense_of_control": {
-              "type": "object",
-              "properties": {
-                "cost_of_living": {
-                  "type": "integer"
-                },
-                "essential_services": {
-                  "type": "integer"
-                },
-                "influence_and_contribution": {
-                  "type": "integer"
-                },
-                "safety": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "cost_of_living",
-                "essential_services",
-                "influence_and_contribution",
-                "safety"
-              ]
-            },
-            "a_sense_of_wonder": {
-              "type": "object",
-              "properties": {
-                "distinctive_design_and_culture": {
-                  "type": "integer"
-                },
-                "play_and_recreation": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "distinctive_design_and_culture",
-                "play_and_recreation"
-              ]
-            },
-            "connected_communities": {
-              "type": "object",
-              "properties": {
-                "belonging": {
-                  "type": "integer"
-                },
-                "local_business_and_jobs": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "belonging",
-                "local_business_and_jobs"
-              ]
-            },
-            "connection_to_nature": {
-              "type": "object",
-              "properties": {
-                "biodiversity": {
-                  "type": "integer"
-                },
-                "climate_resilience_and_adaptation": {
-                  "type": "integer"
-                },
-                "green_and_blue_spaces": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "biodiversity",
-                "climate_resilience_and_adaptation",
-                "green_and_blue_spaces"
-              ]
-            },
-            "getting_around": {
-              "type": "object",
-              "properties": {
-                "car": {
-                  "type": "integer"
-                },
-                "public_transport": {
-                  "type": "integer"
-                },
-                "walking_and_cycling": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "car",
-                "public_transport",
-                "walking_and_cycling"
-              ]
-            },
-            "health_equity": {
-              "type": "object",
-              "properties": {
-                "air_noise_light": {
-                  "type": "integer"
-                },
-                "food_choice": {
-                  "type": "integer"
-                },
-                "housing_standard": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "air_noise_light",
-                "food_choice",
-                "housing_standard"
-              ]
-            }
+          "connection_to_nature": {
+            "type": "object",
+            "properties": {
+              "biodiversity": {
+                "type": "integer"
+              },
+              "climate_resilience_and_adaptation": {
+                "type": "integer"
+              },
+              "green_and_blue_spaces": {
+                "type": "integer"
+              }
+            },
+            "required": [
+              "biodiversity",
+              "climate_resilience_and_adaptation",
+              "green_and_blue_spaces"
+            ]
           },
-          "required": [
-            "QoL",
-            "a_sense_of_control",
-            "a_sense_of_wonder",
-            "connected_communities",
-            "connection_to_nature",
-            "getting_around",
-            "health_equity"
-          ]
-        },
-        "query": {
-          "type": "string"
-        }
-      },
-      "required": [
-        "answer",
-        "query"
-      ]
-    },
-    {
-      "type": "object",
-      "properties": {
-        "answer": {
-          "type": "object",
-          "properties": {
-            "QoL": {
-              "type": "integer"
-            },
-            "a_sense_of_control": {
-              "type": "object",
-              "properties": {
-                "cost_of_living": {
-                  "type": "integer"
-                },
-                "essential_services": {
-                  "type": "integer"
-                },
-                "influence_and_contribution": {
-                  "type": "integer"
-                },
-                "safety": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "cost_of_living",
-                "essential_services",
-                "influence_and_contribution",
-                "safety"
-              ]
-            },
-            "a_sense_of_wonder": {
-              "type": "object",
-              "properties": {
-                "distinctive_design_and_culture": {
-                  "type": "integer"
-                },
-                "play_and_recreation": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "distinctive_design_and_culture",
-                "play_and_recreation"
-              ]
-            },
-            "connected_communities": {
-              "type": "object",
-              "properties": {
-                "belonging": {
-                  "type": "integer"
-                },
-                "local_business_and_jobs": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "belonging",
-                "local_business_and_jobs"
-              ]
-            },
-            "connection_to_nature": {
-              "type": "object",
-              "properties": {
-                "biodiversity": {
-                  "type": "integer"
-                },
-                "climate_resilience_and_adaptation": {
-                  "type": "integer"
-                },
-                "green_and_blue_spaces": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "biodiversity",
-                "climate_resilience_and_adaptation",
-                "green_and_blue_spaces"
-              ]
-            },
-            "getting_around": {
-              "type": "object",
-              "properties": {
-                "car": {
-                  "type": "integer"
-                },
-                "public_transport": {
-                  "type": "integer"
-                },
-                "walking_and_cycling": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "car",
-                "public_transport",
-                "walking_and_cycling"
-              ]
-            },
-            "health_equity": {
-              "type": "object",
-              "properties": {
-                "air_noise_light": {
-                  "type": "integer"
-                },
-                "food_choice": {
-                  "type": "integer"
-                },
-                "housing_standard": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "air_noise_light",
-                "food_choice",
-                "housing_standard"
-              ]
-            }
+          "getting_around": {
+            "type": "object",
+            "properties": {
+              "car": {
+                "type": "integer"
+              },
+              "public_transport": {
+                "type": "integer"
+              },
+              "walking_and_cycling": {
+                "type": "integer"
+              }
+            },
+            "required": [
+              "car",
+              "public_transport",
+              "walking_and_cycling"
+            ]
           },
-          "required": [
-            "QoL",
-            "a_sense_of_control",
-            "a_sense_of_wonder",
-            "connected_communities",
-            "connection_to_nature",
-            "getting_around",
-            "health_equity"
-          ]
+          "health_equity": {
+            "type": "object",
+            "properties": {
+              "air_noise_light": {
+                "type": "integer"
+              },
+              "food_choice": {
+                "type": "integer"
+              },
+              "housing_standard": {
+                "type": "integer"
+              }
+            },
+            "required": [
+              "air_noise_light",
+              "food_choice",
+              "housing_standard"
+            ]
+          }
         },
-        "query": {
-          "type": "string"
-        }
+        "required": [
+          "QoL",
+          "a_sense_of_control",
+          "a_sense_of_wonder",
+          "connected_communities",
+          "connection_to_nature",
+          "getting_around",
+          "health_equity"
+        ]
       },
-      "required": [
-        "answer",
-        "query"
-      ]
+      "query": {
+        "type": "string"
+      }
     },
-    {
-      "type": "object",
-      "properties": {
-        "answer": {
-          "type": "object",
-          "properties": {
-            "QoL": {
-              "type": "integer"
-            },
-            "a_sense_of_control": {
-              "type": "object",
-              "properties": {
-                "cost_of_living": {
-                  "type": "integer"
-                },
-                "essential_services": {
-                  "type": "integer"
-                },
-                "influence_and_contribution": {
-                  "type": "integer"
-                },
-                "safety": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "cost_of_living",
-                "essential_services",
-                "influence_and_contribution",
-                "safety"
-              ]
-            },
-            "a_sense_of_wonder": {
-              "type": "object",
-              "properties": {
-                "distinctive_design_and_culture": {
-                  "type": "integer"
-                },
-                "play_and_recreation": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "distinctive_design_and_culture",
-                "play_and_recreation"
-              ]
-            },
-            "connected_communities": {
-              "type": "object",
-              "properties": {
-                "belonging": {
-                  "type": "integer"
-                },
-                "local_business_and_jobs": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "belonging",
-                "local_business_and_jobs"
-              ]
-            },
-            "connection_to_nature": {
-              "type": "object",
-              "properties": {
-                "biodiversity": {
-                  "type": "integer"
-                },
-                "climate_resilience_and_adaptation": {
-                  "type": "integer"
-                },
-                "green_and_blue_spaces": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "biodiversity",
-                "climate_resilience_and_adaptation",
-                "green_and_blue_spaces"
-              ]
-            },
-            "getting_around": {
-              "type": "object",
-              "properties": {
-                "car": {
-                  "type": "integer"
-                },
-                "public_transport": {
-                  "type": "integer"
-                },
-                "walking_and_cycling": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "car",
-                "public_transport",
-                "walking_and_cycling"
-              ]
-            },
-            "health_equity": {
-              "type": "object",
-              "properties": {
-                "air_noise_light": {
-                  "type": "integer"
-                },
-                "food_choice": {
-                  "type": "integer"
-                },
-                "housing_standard": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "air_noise_light",
-                "food_choice",
-                "housing_standard"
-              ]
-            }
-          },
-          "required": [
-            "QoL",
-            "a_sense_of_control",
-            "a_sense_of_wonder",
-            "connected_communities",
-            "connection_to_nature",
-            "getting_around",
-            "health_equity"
-          ]
-        },
-        "query": {
-          "type": "string"
-        }
-      },
-      "required": [
-        "answer",
-        "query"
-      ]
-    },
-    {
-      "type": "object",
-      "properties": {
-        "answer": {
-          "type": "object",
-          "properties": {
-            "QoL": {
-              "type": "integer"
-            },
-            "a_sense_of_control": {
-              "type": "object",
-              "properties": {
-                "cost_of_living": {
-                  "type": "integer"
-                },
-                "essential_services": {
-                  "type": "integer"
-                },
-                "influence_and_contribution": {
-                  "type": "integer"
-                },
-                "safety": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "cost_of_living",
-                "essential_services",
-                "influence_and_contribution",
-                "safety"
-              ]
-            },
-            "a_sense_of_wonder": {
-              "type": "object",
-              "properties": {
-                "distinctive_design_and_culture": {
-                  "type": "integer"
-                },
-                "play_and_recreation": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "distinctive_design_and_culture",
-                "play_and_recreation"
-              ]
-            },
-            "connected_communities": {
-              "type": "object",
-              "properties": {
-                "belonging": {
-                  "type": "integer"
-                },
-                "local_business_and_jobs": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "belonging",
-                "local_business_and_jobs"
-              ]
-            },
-            "connection_to_nature": {
-              "type": "object",
-              "properties": {
-                "biodiversity": {
-                  "type": "integer"
-                },
-                "climate_resilience_and_adaptation": {
-                  "type": "integer"
-                },
-                "green_and_blue_spaces": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "biodiversity",
-                "climate_resilience_and_adaptation",
-                "green_and_blue_spaces"
-              ]
-            },
-            "getting_around": {
-              "type": "object",
-              "properties": {
-                "car": {
-                  "type": "integer"
-                },
-                "public_transport": {
-                  "type": "integer"
-                },
-                "walking_and_cycling": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "car",
-                "public_transport",
-                "walking_and_cycling"
-              ]
-            },
-            "health_equity": {
-              "type": "object",
-              "properties": {
-                "air_noise_light": {
-                  "type": "integer"
-                },
-                "food_choice": {
-                  "type": "integer"
-                },
-                "housing_standard": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "air_noise_light",
-                "food_choice",
-                "housing_standard"
-              ]
-            }
-          },
-          "required": [
-            "QoL",
-            "a_sense_of_control",
-            "a_sense_of_wonder",
-            "connected_communities",
-            "connection_to_nature",
-            "getting_around",
-            "health_equity"
-          ]
-        },
-        "query": {
-          "type": "string"
-        }
-      },
-      "required": [
-        "answer",
-        "query"
-      ]
-    },
-    {
-      "type": "object",
-      "properties": {
-        "answer": {
-          "type": "object",
-          "properties": {
-            "QoL": {
-              "type": "integer"
-            },
-            "a_sense_of_control": {
-              "type": "object",
-              "properties": {
-                "cost_of_living": {
-                  "type": "integer"
-                },
-                "essential_services": {
-                  "type": "integer"
-                },
-                "influence_and_contribution": {
-                  "type": "integer"
-                },
-                "safety": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "cost_of_living",
-                "essential_services",
-                "influence_and_contribution",
-                "safety"
-              ]
-            },
-            "a_sense_of_wonder": {
-              "type": "object",
-              "properties": {
-                "distinctive_design_and_culture": {
-                  "type": "integer"
-                },
-                "play_and_recreation": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "distinctive_design_and_culture",
-                "play_and_recreation"
-              ]
-            },
-            "connected_communities": {
-              "type": "object",
-              "properties": {
-                "belonging": {
-                  "type": "integer"
-                },
-                "local_business_and_jobs": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "belonging",
-                "local_business_and_jobs"
-              ]
-            },
-            "connection_to_nature": {
-              "type": "object",
-              "properties": {
-                "biodiversity": {
-                  "type": "integer"
-                },
-                "climate_resilience_and_adaptation": {
-                  "type": "integer"
-                },
-                "green_and_blue_spaces": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "biodiversity",
-                "climate_resilience_and_adaptation",
-                "green_and_blue_spaces"
-              ]
-            },
-            "getting_around": {
-              "type": "object",
-              "properties": {
-                "car": {
-                  "type": "integer"
-                },
-                "public_transport": {
-                  "type": "integer"
-                },
-                "walking_and_cycling": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "car",
-                "public_transport",
-                "walking_and_cycling"
-              ]
-            },
-            "health_equity": {
-              "type": "object",
-              "properties": {
-                "air_noise_light": {
-                  "type": "integer"
-                },
-                "food_choice": {
-                  "type": "integer"
-                },
-                "housing_standard": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "air_noise_light",
-                "food_choice",
-                "housing_standard"
-              ]
-            }
-          },
-          "required": [
-            "QoL",
-            "a_sense_of_control",
-            "a_sense_of_wonder",
-            "connected_communities",
-            "connection_to_nature",
-            "getting_around",
-            "health_equity"
-          ]
-        },
-        "query": {
-          "type": "string"
-        }
-      },
-      "required": [
-        "answer",
-        "query"
-      ]
-    },
-    {
-      "type": "object",
-      "properties": {
-        "answer": {
-          "type": "object",
-          "properties": {
-            "QoL": {
-              "type": "integer"
-            },
-            "a_sense_of_control": {
-              "type": "object",
-              "properties": {
-                "cost_of_living": {
-                  "type": "integer"
-                },
-                "essential_services": {
-                  "type": "integer"
-                },
-                "influence_and_contribution": {
-                  "type": "integer"
-                },
-                "safety": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "cost_of_living",
-                "essential_services",
-                "influence_and_contribution",
-                "safety"
-              ]
-            },
-            "a_sense_of_wonder": {
-              "type": "object",
-              "properties": {
-                "distinctive_design_and_culture": {
-                  "type": "integer"
-                },
-                "play_and_recreation": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "distinctive_design_and_culture",
-                "play_and_recreation"
-              ]
-            },
-            "connected_communities": {
-              "type": "object",
-              "properties": {
-                "belonging": {
-                  "type": "integer"
-                },
-                "local_business_and_jobs": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "belonging",
-                "local_business_and_jobs"
-              ]
-            },
-            "connection_to_nature": {
-              "type": "object",
-              "properties": {
-                "biodiversity": {
-                  "type": "integer"
-                },
-                "climate_resilience_and_adaptation": {
-                  "type": "integer"
-                },
-                "green_and_blue_spaces": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "biodiversity",
-                "climate_resilience_and_adaptation",
-                "green_and_blue_spaces"
-              ]
-            },
-            "getting_around": {
-              "type": "object",
-              "properties": {
-                "car": {
-                  "type": "integer"
-                },
-                "public_transport": {
-                  "type": "integer"
-                },
-                "walking_and_cycling": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "car",
-                "public_transport",
-                "walking_and_cycling"
-              ]
-            },
-            "health_equity": {
-              "type": "object",
-              "properties": {
-                "air_noise_light": {
-                  "type": "integer"
-                },
-                "food_choice": {
-                  "type": "integer"
-                },
-                "housing_standard": {
-                  "type": "integer"
-                }
-              },
-              "required": [
-                "air_noise_light",
-                "food_choice",
-                "housing_standard"
-              ]
-            }
-          },
-          "required": [
-            "QoL",
-            "a_sense_of_control",
-            "a_sense_of_wonder",
-            "connected_communities",
-            "connection_to_nature",
-            "getting_around",
-            "health_equity"
-          ]
-        },
-        "query": {
-          "type": "string"
-        }
-      },
-      "required": [
-        "answer",
-        "query"
-      ]
-    }
-  ]
+    "required": [
+      "answer",
+      "query"
+    ]
+  }
 }
 
 
 
 
-QOL_DATA_DIR = Path("qol_dataset").glob("*.json")
-NUM_CITIES = 10
+QOL_DATA_DIR = Path("qol_dataset")
 
+# a violation of the schema: index of the record in what was validated (None for the array itself), its
+# ED name, the JSON path from the array down and the message
+RecordError = collections.namedtuple("RecordError", ["index", "name", "path", "message"])
+# validate_file's result: records read, their errors, and the reason the file couldn't be read (or None)
+FileResult = collections.namedtuple("FileResult", ["path", "records", "errors", "read_error"])
 
-erroneous_files = []
 
-for file in QOL_DATA_DIR:
+def compile_validator(schema):
+    # the compiled checker (see qol_schema), or jsonschema's validator for schemas it can't compile
     try:
-        data = json.loads(file.read_text())
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON in {file}: {e}")
-        erroneous_files.append(file)
-        continue
+        check = compile_schema(schema)
+    except NotImplementedError:
+        import jsonschema
+
+        jsonschema.Draft4Validator.check_schema(schema)
+        validator = jsonschema.Draft4Validator(schema)
+
+        def check(data):
+            return [(tuple(error.absolute_path), error.message) for error in validator.iter_errors(data)]
+
+    return check
+
+
+@functools.lru_cache(maxsize=None)
+def record_checker():
+    # compiled on first use rather than on import, once per process
+    return compile_validator(QOL_JSON_SCHEMA)
+
+
+def check_records(data):
+    # (path, message) of every violation in a list of records, the empty tuple when they are all valid
+    return record_checker()(data)
+
+
+def validate_records(records):
+    # every violation in an iterable of records as RecordErrors, an empty list when they are all valid.
+    # Cheap enough for a hot path: valid records only go through the generated fast path of qol_schema
+    data = records if isinstance(records, list) else list(records)
+    errors = []
+    for path, message in check_records(data):
+        index = path[0] if path else None
+        record = data[index] if index is not None else None
+        name = record.get("query") if isinstance(record, dict) else None
+        errors.append(RecordError(index, name, json_path(path), message))
+    return errors
 
-    # if the data is not adherant to the JSON schema, then we will add it to the erroneous files
+
+def read_records(path):
+    # the records of a batch file of older runs (a JSON array), or of a JSONL file such as a store part or
+    # an export, gzip'd or not. Every line of a store part, records replaced since included
+    path = Path(path)
+    if path.name.endswith((".jsonl", ".jsonl.gz")):
+        with (gzip.open(path, "rt") if path.suffix == ".gz" else open(path)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    return json.loads(path.read_text())
+
+
+def validate_file(path):
+    # a FileResult for one file, see read_records. A file that can't be read or decoded comes back with
+    # read_error set instead of raising
+    try:
+        data = read_records(path)
+    except (json.JSONDecodeError, OSError, EOFError, zlib.error) as e:
+        return FileResult(str(path), 0, [], str(e))
+    if not isinstance(data, list):
+        # not an array of records at all
+        errors = [
+            RecordError(None, None, json_path(error_path), message) for error_path, message in check_records(data)
+        ]
+        return FileResult(str(path), 0, errors, None)
+    return FileResult(str(path), len(data), validate_records(data), None)
+
+
+def schema_hash(schema):
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+
+
+def file_hashes(path, prefix_size, size=None):
+    # sha256 of the first `prefix_size` bytes and of the first `size` bytes (the whole file by default), in one read
+    digest = hashlib.sha256()
+    prefix = None
+    with open(path, "rb") as f:
+        if prefix_size:
+            digest.update(f.read(prefix_size))
+            prefix = digest.hexdigest()
+        remaining = None if size is None else size - prefix_size
+        while remaining is None or remaining > 0:
+            block = f.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not block:
+                break
+            digest.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return prefix, digest.hexdigest()
+
+
+def validate_chunk(chunk):
+    # (path, errors, JSON error) of a chunk of members, errors keyed by "offset:line" of the record as
+    # [ED name, JSON path within the record, message]. Runs in the worker processes
+    path, members = chunk
+    keys = []
+    data = []
+    try:
+        with open(path, "rb") as f:
+            for offset, length, lines in members:
+                data.extend(read_member(f, offset, length, lines))
+                keys.extend(f"{offset}:{line}" for line, _ in lines)
+    except (json.JSONDecodeError, OSError, EOFError, zlib.error) as e:
+        # a damaged part, gzip errors included
+        return path, {}, str(e)
+    errors = {}
+    for error_path, message in check_records(data):
+        record = data[error_path[0]]
+        name = record.get("query") if isinstance(record, dict) else None
+        errors.setdefault(keys[error_path[0]], []).append([name, list(error_path[1:]), message])
+    return path, errors, None
+
+
+def validate_files(paths):
+    # the CLI for files outside the store, with the same output as for the store
+    erroneous_files = []
+    records = 0
+    for path in paths:
+        result = validate_file(path)
+        records += result.records
+        if result.read_error is not None:
+            print(f"Error reading {path}: {result.read_error}")
+        elif result.errors:
+            print(f"Data does not adhere to the JSON schema in {path}:")
+            for error in result.errors:
+                print(f"  record {error.index} ({error.name!r}) at {error.path}: {error.message}")
+        if result.read_error is not None or result.errors:
+            erroneous_files.append(str(path))
+    print(f"Validated {records} records in {len(paths)} files")
+    Path("erroneous_files.txt").write_text("\n".join(erroneous_files))
+
+
+def main(
+    *paths,
+    workers: int = 1,
+    chunk_size: int = 2000,
+    manifest: str = str(STATE_DIR / "validation_manifest.json"),
+    full: bool = False,
+    semantic: bool = False,
+):
+    # the results store (see qol_store) is checked part by part, each part's latest records as one array.
+    # Verdicts are kept in `manifest` by part path with its committed size, mtime and sha256 and the schema
+    # hash: an unchanged part isn't read at all, a part that was only appended to since (the store never
+    # rewrites a part, compaction starts new ones) gets just its new members validated, a schema change or
+    # --full revalidates everything. With --workers > 1 chunks of `chunk_size` records are validated in that many
+    # processes, results are collected in part and chunk order so the output is the same either way.
+    # Files given as arguments (batch JSON of older runs, JSONL exports or parts) are validated instead
+    if paths:
+        validate_files(paths)
+        return
+    store = ResultStore(QOL_DATA_DIR, read_only=True)
+    store.close()
+    current_schema = schema_hash(QOL_JSON_SCHEMA)
+    previous = read_json(manifest) if manifest and not full else None
+    if previous is None or previous.get("schema_hash") != current_schema:
+        previous = {"parts": {}}
+
+    entries = {}
+    chunks = []
+    unchanged = 0
+    for part in range(store.num_parts):
+        path = store.part_path(part)
+        if not path.exists():
+            continue
+        stat = path.stat()
+        # sizes and hashes cover the committed members only, a generator running alongside may have
+        # appended a member it hasn't indexed yet
+        committed = store.ends[part]
+        entry = previous["parts"].get(str(path))
+        unchanged_file = stat.st_size == committed and entry is not None and entry["mtime"] == stat.st_mtime
+        if unchanged_file and entry["size"] == committed:
+            entries[str(path)] = entry
+            unchanged += 1
+            continue
+        grown = entry is not None and entry["size"] <= committed
+        prefix, digest = file_hashes(path, entry["size"] if grown else 0, committed)
+        if grown and prefix == entry["sha256"]:
+            validated_size, errors = entry["size"], entry["errors"]
+        else:
+            validated_size, errors = 0, {}
+        entries[str(path)] = {"size": committed, "mtime": stat.st_mtime, "sha256": digest, "errors": errors}
+
+        members = []
+        records = 0
+        for member in store.live_members(part):
+            if member[0] < validated_size:
+                continue
+            members.append(member)
+            records += len(member[2])
+            if records >= chunk_size:
+                chunks.append((str(path), members))
+                members = []
+                records = 0
+        if members:
+            chunks.append((str(path), members))
+
+    if workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+        results = executor.map(validate_chunk, chunks)
+    else:
+        executor = None
+        results = map(validate_chunk, chunks)
+    decode_errors = {}
     try:
-        jsonschema.validate(data, QOL_JSON_SCHEMA)
-    except jsonschema.exceptions.ValidationError as e:
-        print(f"Data does not adhere to the JSON schema in {file}: {e}")
-        erroneous_files.append(file)
-        continue
+        for path, errors, decode_error in results:
+            if decode_error is not None:
+                decode_errors.setdefault(path, decode_error)
+            entries[path]["errors"].update(errors)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    erroneous_files = []
+    for part in range(store.num_parts):
+        path = str(store.part_path(part))
+        if path in decode_errors:
+            print(f"Error decoding JSON in {path}: {decode_errors[path]}")
+            erroneous_files.append(path)
+            # no verdict for a damaged part, it is read again next time
+            del entries[path]
+            continue
+        if path not in entries:
+            continue
+        # every record is checked and all of its errors are reported, not just the first one found. Errors
+        # are kept by record, its index among the part's latest records is worked out here, and the errors
+        # of records replaced since are dropped
+        errors = entries[path]["errors"]
+        live_errors = {}
+        index = 0
+        for offset, _, lines in store.live_members(part):
+            for line, _ in lines:
+                key = f"{offset}:{line}"
+                if key in errors:
+                    if not live_errors:
+                        print(f"Data does not adhere to the JSON schema in {path}:")
+                    live_errors[key] = errors[key]
+                    for name, error_path, message in errors[key]:
+                        print(f"  record {index} ({name!r}) at {json_path([index, *error_path])}: {message}")
+                index += 1
+        entries[path]["errors"] = live_errors
+        if live_errors:
+            erroneous_files.append(path)
+
+    if manifest:
+        atomic_write_text(manifest, json.dumps({"schema_hash": current_schema, "parts": entries}))
+    records = sum(len(lines) for _, members in chunks for _, _, lines in members)
+    print(f"Validated {records} records, {unchanged} of {len(entries)} parts unchanged since the last run")
+    Path("erroneous_files.txt").write_text("\n".join(map(str, erroneous_files)))
+    if semantic:
+        # range, QoL, coverage and duplicate checks across all records, see qol_semantic
+        from qol_semantic import main as check_semantics
+
+        check_semantics(str(QOL_DATA_DIR))
+
 
-Path("erroneous_files.txt").write_text("\n".join(map(str, erroneous_files)))
\ No newline at end of file
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,97 @@
+import asyncio
+
+
+class GenerationEngine:
+    # keeps up to `concurrency` calls in flight, each one admitted by the rate limiter of a session
+    # from the pool first. `call(job, session, quota_wait)` is a coroutine returning (result, total_token_count or None),
+    # `on_result(job, result)` is called as soon as a job finishes so results are written while the rest
+    # are still running. A call can hand back None as result after resubmitting its job in some other form
+    def __init__(self, call, pool, concurrency=5, token_estimate=10000):
+        self.call = call
+        self.pool = pool
+        self.concurrency = concurrency
+        # the tokens per minute bucket is charged with an estimate up front and corrected afterwards,
+        # the estimate follows the largest request seen so far
+        self.token_estimate = token_estimate
+        self.quota_wait = 0.0
+        self.completed = 0
+        self.queue = asyncio.Queue()
+        # timers of jobs submitted with a delay, the run isn't over while any are left
+        self.scheduled = set()
+        # jobs taken from the queue and not finished yet
+        self.active = 0
+
+    async def run_job(self, job, on_result):
+        estimate = self.token_estimate
+        session, waited = await self.pool.acquire(estimate)
+        self.quota_wait += waited
+        try:
+            result, total_tokens = await self.call(job, session, waited)
+        finally:
+            self.pool.release(session)
+        if total_tokens is not None:
+            session.limiter.settle(estimate, total_tokens)
+            self.token_estimate = max(self.token_estimate, total_tokens)
+        self.completed += 1
+        if result is not None:
+            on_result(job, result)
+
+    async def worker(self, queue, on_result):
+        while True:
+            job = await queue.get()
+            self.active += 1
+            try:
+                await self.run_job(job, on_result)
+            finally:
+                self.active -= 1
+                queue.task_done()
+
+    def submit(self, job):
+        # queue more work, before or while the engine is running
+        self.queue.put_nowait(job)
+
+    def submit_later(self, job, delay):
+        # queue a job after `delay` seconds, e.g. a retry after backing off, without holding up a worker
+        async def timer():
+            await asyncio.sleep(delay)
+            self.submit(job)
+
+        task = asyncio.create_task(timer())
+        self.scheduled.add(task)
+        task.add_done_callback(self.scheduled.discard)
+
+    async def run(self, jobs, on_result, on_drain=None):
+        # `on_drain()` is called whenever the queue runs empty and may submit more jobs (returning True),
+        # e.g. retries held back until they fill a batch
+        self.pool.warm()
+        for job in jobs:
+            self.submit(job)
+
+        workers = [asyncio.create_task(self.worker(self.queue, on_result)) for _ in range(self.concurrency)]
+        tasks = list(workers)
+        try:
+            while True:
+                join = asyncio.create_task(self.queue.join())
+                tasks.append(join)
+                # workers only ever return by raising, in which case the whole run is aborted
+                await asyncio.wait([join, *workers], return_when=asyncio.FIRST_COMPLETED)
+                if not join.done():
+                    break
+                if not self.queue.empty() or self.active:
+                    # a timer fired as the join finished, its job is queued (or already taken by a worker)
+                    # but no longer scheduled
+                    continue
+                if self.scheduled:
+                    # the queue is empty for now, wait for the next delayed job to be queued
+                    await asyncio.wait([*self.scheduled, *workers], return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                if on_drain is None or not on_drain():
+                    break
+        finally:
+            tasks.extend(self.scheduled)
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from collections import deque
+
+from qol_telemetry import percentile
+
+
+class DeadlineExceeded(TimeoutError):
+    # a request that didn't deliver its first chunk or didn't finish in time
+    def __init__(self, deadline, seconds):
+        super().__init__(f"No {deadline} within {seconds}s")
+        self.deadline = deadline
+        self.seconds = seconds
+
+
+class Hedger:
+    # when a request runs longer than the `quantile` of the latencies seen so far, the same request is sent
+    # a second time through any session with quota to spare right now, and the first of the two to finish
+    # wins. The other one is cancelled, it still counts against its endpoint's request quota and is charged
+    # the prompt tokens, which are billed for a cancelled request as well. The backup goes to another endpoint
+    # and is recorded on that endpoint's circuit breaker, so is a primary that failed while the backup won
+    def __init__(self, pool, quantile=95, min_samples=20, window=500):
+        self.pool = pool
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.hedged = 0
+        self.won = 0
+
+    def observe(self, latency):
+        self.latencies.append(latency)
+
+    def delay(self):
+        if len(self.latencies) < self.min_samples:
+            return None
+        return percentile(self.latencies, self.quantile)
+
+    async def run(self, request, session, tokens, usage, log=None):
+        # `request(session)` is the coroutine to hedge, `usage(result)` gives its (prompt tokens, total tokens)
+        # or None. Returns the result, the tokens `session` is to be charged (None if that's up to the caller),
+        # which request won when a duplicate was sent, "primary" or "backup", and the session that answered.
+        # The backup's breaker, and the primary's when the backup won, are recorded here, the rest is up to
+        # the caller. `log(session, role, task, started_at, charged_tokens)` is called for the request of a
+        # hedged pair the caller doesn't see: the one that lost (cancelled, or finished second), or the backup
+        # when both failed. It was sent all the same, charged_tokens is what its endpoint is charged for it
+        started_at = time.time()
+        primary = asyncio.create_task(request(session))
+        tasks = [primary]
+        backup_session = None
+        winner = None
+        try:
+            delay = self.delay()
+            if delay is not None:
+                await asyncio.wait([primary], timeout=delay)
+                if not primary.done():
+                    backup_session = self.pool.try_acquire(tokens, exclude=session)
+            if backup_session is None:
+                return await primary, None, None, session
+
+            self.hedged += 1
+            backup_started_at = time.time()
+            backup = asyncio.create_task(request(backup_session))
+            tasks.append(backup)
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in tasks if task in done and task.exception() is None), None)
+            if winner is None:
+                # both failed, both keep their estimate
+                raise primary.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if backup_session is not None:
+                self.pool.release(backup_session)
+                self.record(backup, backup_session, winner)
+                if winner is backup:
+                    self.record(primary, session, winner)
+                if winner is None and log is not None:
+                    # the primary's error is the caller's to log
+                    log(backup_session, "backup", backup, backup_started_at, tokens)
+
+        result = winner.result()
+        prompt_tokens, total_tokens = usage(result) or (tokens, None)
+        if log is not None:
+            if winner is backup:
+                log(session, "primary", primary, started_at, prompt_tokens)
+            else:
+                log(backup_session, "backup", backup, backup_started_at, prompt_tokens)
+        if winner is backup:
+            self.won += 1
+            if total_tokens is not None:
+                backup_session.limiter.settle(tokens, total_tokens)
+            return result, prompt_tokens, "backup", backup_session
+        backup_session.limiter.settle(tokens, prompt_tokens)
+        return result, total_tokens, "primary", session
+
+    @staticmethod
+    def record(task, session, winner):
+        # the outcome of a request that isn't the caller's to record: a failure, or cancelled as the other won
+        if task is winner:
+            session.breaker.record(True)
+        elif task.cancelled() or task.exception() is None:
+            session.breaker.cancel()
+        else:
+            session.breaker.record(False)
@@ -0,0 +1,75 @@
+import json
+import os
+import time
+from collections import Counter
+from pathlib import Path
+
+from qol_state import STATE_DIR
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class RunJournal:
+    # append-only, one fsync'd json line per state change of a batch of EDs, e.g.
+    # {"ts": ..., "state": "failed", "eds": ["17001", ...], "reason": "..."}
+    # replaying it gives the latest state of every ED, which is all `--resume` needs
+    def __init__(self, path=None, reset=False):
+        self.path = Path(path or STATE_DIR / "journal.jsonl")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.states = {}
+        self.reasons = {}
+        if reset and self.path.exists():
+            self.path.unlink()
+        self.replay()
+        self.file = open(self.path, "a")
+
+    def replay(self):
+        if not self.path.exists():
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a torn final line from a crash mid-write, the state change never happened
+                    continue
+                for ed in entry["eds"]:
+                    self.states[ed] = entry["state"]
+                    if entry["state"] == FAILED:
+                        self.reasons[ed] = entry.get("reason")
+                    else:
+                        self.reasons.pop(ed, None)
+
+    def record(self, eds, state, reason=None, **fields):
+        entry = {"ts": time.time(), "state": state, "eds": list(eds), **fields}
+        if reason is not None:
+            entry["reason"] = reason
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        for ed in eds:
+            self.states[ed] = state
+            if state == FAILED:
+                self.reasons[ed] = reason
+            else:
+                self.reasons.pop(ed, None)
+
+    def state(self, ed):
+        return self.states.get(ed, PENDING)
+
+    def is_done(self, ed):
+        return self.states.get(ed) == SUCCEEDED
+
+    def failed(self):
+        return {ed for ed, state in self.states.items() if state == FAILED}
+
+    def summary(self, eds):
+        # EDs still in flight when loading a journal were interrupted by a killed run and are redone on resume
+        counts = Counter(self.state(ed) for ed in eds)
+        return ", ".join(f"{counts[state]} {state}" for state in [SUCCEEDED, FAILED, IN_FLIGHT, PENDING])
+
+    def close(self):
+        self.file.close()
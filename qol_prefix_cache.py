@@ -0,0 +1,184 @@
+import datetime
+import hashlib
+import json
+import time
+from pathlib import Path
+
+from qol_state import STATE_DIR, atomic_write_text, read_json
+
+
+def part_fingerprint(part):
+    if isinstance(part, str):
+        return part
+    return json.dumps(part.to_dict(), sort_keys=True)
+
+
+def prefix_hash(model_name, system_instruction, prefix_parts):
+    # any change to the model, system prompt or a single prompt asset gives a new hash
+    digest = hashlib.sha256(model_name.encode())
+    for part in [*system_instruction, None, *prefix_parts]:
+        digest.update(b"\0" if part is None else part_fingerprint(part).encode())
+        digest.update(b"\1")
+    return digest.hexdigest()
+
+
+class CachedPrefixModel:
+    # local stand-in for a server side context cache, the registered prefix is prepended
+    # to every request so callers only hand over the per-batch query
+    def __init__(self, model, prefix_parts):
+        self.model = model
+        self.prefix_parts = prefix_parts
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    async def generate_content_async(self, contents, **kwargs):
+        return await self.model.generate_content_async([*self.prefix_parts, *contents], **kwargs)
+
+
+class LocalPrefixCache:
+    def __init__(self, model_name, system_instruction, prefix_parts):
+        self.prefix_parts = prefix_parts
+        self.hash = prefix_hash(model_name, system_instruction, prefix_parts)
+
+    def attach(self, pool):
+        for session in pool.sessions:
+            session.model = CachedPrefixModel(session.model, self.prefix_parts)
+            session.prefix_cached = True
+
+    def refresh(self, pool):
+        pass
+
+    def recover(self, session, error):
+        return False
+
+
+class VertexPrefixCache:
+    # registers the static prefix as Vertex context cache once per endpoint and reuses it across runs
+    # for as long as the prefix hash is unchanged. The registry maps endpoint -> (hash, cache name).
+    # A cache expires `ttl_minutes` after its last update, refresh() extends it once half of that is up
+    # and recover() registers it again should it be gone anyway
+    def __init__(self, model_name, system_instruction, prefix_parts, ttl_minutes=60, registry_file=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.prefix_parts = prefix_parts
+        self.ttl = datetime.timedelta(minutes=ttl_minutes)
+        self.hash = prefix_hash(model_name, system_instruction, prefix_parts)
+        self.registry_file = registry_file or STATE_DIR / "prefix_cache.json"
+        self.registry = read_json(self.registry_file, default={})
+        # endpoint -> (CachedContent, time its ttl was last set) of the caches in use
+        self.cached_contents = {}
+
+    def lookup(self, endpoint):
+        from google.api_core import exceptions
+        from vertexai.preview import caching
+
+        entry = self.registry.get(endpoint.name)
+        if entry is None:
+            return None
+        if entry["hash"] != self.hash:
+            # a prompt asset changed, the old cache must not be used again
+            print(f"Prefix changed for {endpoint.name}, dropping cached content {entry['name']}")
+            try:
+                caching.CachedContent(entry["name"]).delete()
+            except exceptions.GoogleAPICallError:
+                pass
+            return None
+        try:
+            cached_content = caching.CachedContent(entry["name"])
+            cached_content.update(ttl=self.ttl)
+        except exceptions.NotFound:
+            return None
+        self.cached_contents[endpoint.name] = (cached_content, time.time())
+        return cached_content
+
+    @staticmethod
+    def init(endpoint):
+        # the cache calls and the model go to the project and region of the global config, which is that of
+        # whichever endpoint was set up last. With more than one endpoint, every call sets it first
+        import vertexai
+
+        vertexai.init(project=endpoint.project, location=endpoint.location)
+
+    def create(self, endpoint):
+        from vertexai.preview import caching
+
+        self.init(endpoint)
+        cached_content = caching.CachedContent.create(
+            model_name=self.model_name,
+            system_instruction=self.system_instruction,
+            contents=self.prefix_parts,
+            ttl=self.ttl,
+            display_name=f"qol-prefix-{self.hash[:12]}",
+        )
+        self.registry[endpoint.name] = {"hash": self.hash, "name": cached_content.resource_name}
+        atomic_write_text(self.registry_file, json.dumps(self.registry, indent=2))
+        self.cached_contents[endpoint.name] = (cached_content, time.time())
+        return cached_content
+
+    def use(self, session, cached_content):
+        from vertexai.preview.generative_models import GenerativeModel as PreviewGenerativeModel
+
+        self.init(session.endpoint)
+        session.model = PreviewGenerativeModel.from_cached_content(cached_content)
+        session.prefix_cached = True
+
+    def refresh(self, pool):
+        # called before every request, only talks to the API when a cache is past half its ttl. The update
+        # blocks the event loop for one round trip, once per endpoint and half ttl
+        from google.api_core import exceptions
+
+        now = time.time()
+        for session in pool.sessions:
+            entry = self.cached_contents.get(session.endpoint.name)
+            if entry is None or now - entry[1] < self.ttl.total_seconds() / 2:
+                continue
+            try:
+                self.init(session.endpoint)
+                entry[0].update(ttl=self.ttl)
+                self.cached_contents[session.endpoint.name] = (entry[0], now)
+            except exceptions.NotFound:
+                self.use(session, self.create(session.endpoint))
+
+    def recover(self, session, error):
+        # a request failing with NotFound on a cached prefix means the cache expired or was deleted: it is
+        # registered again and the request can be retried, any other error is left to the caller
+        from google.api_core import exceptions
+
+        if not isinstance(error, exceptions.NotFound) or session.endpoint.name not in self.cached_contents:
+            return False
+        if time.time() - self.cached_contents[session.endpoint.name][1] < 60:
+            # requests sent before it was registered again (or its ttl extended) fail the same way
+            return True
+        print(f"Cached content for {session.endpoint.name} is gone, registering it again")
+        self.use(session, self.create(session.endpoint))
+        return True
+
+    def attach(self, pool):
+        from google.api_core import exceptions
+
+        for session in pool.sessions:
+            self.init(session.endpoint)
+            try:
+                cached_content = self.lookup(session.endpoint) or self.create(session.endpoint)
+            except exceptions.InvalidArgument as e:
+                # e.g. a prefix below the minimum cacheable size, keep sending the full prompt
+                print(f"Context caching unavailable for {session.endpoint.name}: {e}")
+                continue
+            self.use(session, cached_content)
+
+
+def attach_prefix_cache(mode, pool, model_name, system_instruction, prefix_parts, state_dir=STATE_DIR):
+    # the registry of Vertex caches lives in the run's (or shard's) state dir
+    if mode is None:
+        return None
+    if mode == "local":
+        prefix_cache = LocalPrefixCache(model_name, system_instruction, prefix_parts)
+    elif mode == "vertex":
+        registry_file = Path(state_dir) / "prefix_cache.json"
+        prefix_cache = VertexPrefixCache(model_name, system_instruction, prefix_parts, registry_file=registry_file)
+    else:
+        raise ValueError(f"Unknown prefix cache mode {mode}, expected 'vertex' or 'local'")
+    prefix_cache.attach(pool)
+    print(f"Prefix cache ({mode}) {prefix_cache.hash[:12]}")
+    return prefix_cache
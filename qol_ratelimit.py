@@ -0,0 +1,111 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from qol_state import atomic_write_text, read_json
+
+
+class TokenBucket:
+    # refills continuously at capacity / period, so a 5 rpm bucket allows a burst of 5
+    # and then one request every 12 seconds
+    def __init__(self, capacity, period=60.0, level=None, updated_at=None):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.level = capacity if level is None else min(level, capacity)
+        self.updated_at = time.time() if updated_at is None else updated_at
+
+    def refill(self, now):
+        if now > self.updated_at:
+            self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        self.refill(now)
+        # a single request larger than the bucket would never fit, let it through once full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount):
+        # the level may go negative when actual usage exceeds the estimate, which is paid
+        # back by later refills
+        self.level -= amount
+
+    def to_dict(self):
+        return {"capacity": self.capacity, "level": self.level, "updated_at": self.updated_at}
+
+
+class RateLimiter:
+    # requests per minute and (optionally) tokens per minute, persisted to `state_file` with
+    # wall clock timestamps so a restarted run doesn't burst through a quota it already used
+    def __init__(self, requests_per_minute=5, tokens_per_minute=None, state_file=None):
+        self.state_file = Path(state_file) if state_file else None
+        state = self.load_state()
+        self.buckets = {"requests": TokenBucket(requests_per_minute, **state.get("requests", {}))}
+        if tokens_per_minute:
+            self.buckets["tokens"] = TokenBucket(tokens_per_minute, **state.get("tokens", {}))
+        self._lock = asyncio.Lock()
+
+    def load_state(self):
+        if self.state_file is None:
+            return {}
+        state = read_json(self.state_file, default={})
+        return {
+            name: {"level": bucket["level"], "updated_at": bucket["updated_at"]}
+            for name, bucket in state.items()
+        }
+
+    def save_state(self):
+        if self.state_file is None:
+            return
+        atomic_write_text(self.state_file, json.dumps({name: bucket.to_dict() for name, bucket in self.buckets.items()}))
+
+    def amounts(self, tokens):
+        return {"requests": 1, "tokens": tokens}
+
+    def wait_time(self, tokens=0, queued=0):
+        # rough time until a new request would be admitted behind `queued` waiting ones
+        now = time.time()
+        amounts = self.amounts(tokens)
+        wait = 0.0
+        for name, bucket in self.buckets.items():
+            bucket.refill(now)
+            wait = max(wait, (amounts[name] * (queued + 1) - bucket.level) / bucket.rate)
+        return wait
+
+    async def acquire(self, tokens=0):
+        # waiters are served in order by the lock, returns the seconds spent waiting for quota
+        start = time.time()
+        amounts = self.amounts(tokens)
+        async with self._lock:
+            while True:
+                now = time.time()
+                wait = max(bucket.wait_time(amounts[name], now) for name, bucket in self.buckets.items())
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            for name, bucket in self.buckets.items():
+                bucket.consume(amounts[name])
+            self.save_state()
+        return time.time() - start
+
+    def try_acquire(self, tokens=0):
+        # admits a request only if that's possible right now without getting ahead of waiting ones
+        if self._lock.locked():
+            return False
+        now = time.time()
+        amounts = self.amounts(tokens)
+        if any(bucket.wait_time(amounts[name], now) > 0 for name, bucket in self.buckets.items()):
+            return False
+        for name, bucket in self.buckets.items():
+            bucket.consume(amounts[name])
+        self.save_state()
+        return True
+
+    def settle(self, estimated_tokens, actual_tokens):
+        # correct the token bucket once the real usage is known
+        if "tokens" in self.buckets:
+            self.buckets["tokens"].consume(actual_tokens - estimated_tokens)
+            self.save_state()
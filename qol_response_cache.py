@@ -0,0 +1,94 @@
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from qol_state import STATE_DIR
+
+
+def response_key(static_prefix_hash, query, generation_config):
+    # content address of an answer: the same prompt (see `prefix_hash` for the model, system prompt and
+    # static prefix part) with the same query (a single ED) and config gets the same answer from the cache
+    digest = hashlib.sha256(static_prefix_hash.encode())
+    digest.update(b"\0" + query.encode())
+    if hasattr(generation_config, "to_dict"):
+        generation_config = generation_config.to_dict()
+    digest.update(b"\0" + json.dumps(generation_config, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    # sqlite backed, evicts the least recently used responses once the stored text exceeds `max_bytes`
+    def __init__(self, path=None, max_bytes=512 * 1024 * 1024):
+        self.path = Path(path or STATE_DIR / "response_cache.sqlite")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db = sqlite3.connect(self.path)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                total_tokens INTEGER,
+                created_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )"""
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self.db.commit()
+
+    def get(self, key):
+        row = self.db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return row[0]
+
+    def put(self, key, response, total_tokens=None):
+        self.put_many([(key, response)], total_tokens)
+
+    def put_many(self, entries, total_tokens=None):
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            [(key, response, len(response.encode()), total_tokens, now, now) for key, response in entries],
+        )
+        self.evict()
+        self.db.commit()
+
+    def delete(self, key):
+        self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self.db.commit()
+
+    def size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def evict(self):
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+        freed = 0
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY used_at").fetchall():
+            if freed >= excess:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            freed += size
+            self.evictions += 1
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"Response cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate), "
+            f"{self.evictions} evicted, {self.size() / 1024 / 1024:.1f} MiB stored"
+        )
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,133 @@
+import random
+import time
+from collections import deque
+
+# what went wrong with a request, decides whether and how it is retried:
+# rate_limit (429) and transient (5xx, timeouts, dropped connections) are retried as they are after backing off,
+# safety (a blocked prompt or answer) and truncation (MAX_TOKENS) are split into smaller requests, schema
+# (missing or invalid records) retries the affected EDs, fatal (bad request, permissions, ...) stops the run
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+SAFETY = "safety"
+SCHEMA = "schema"
+TRUNCATION = "truncation"
+FATAL = "fatal"
+
+SAFETY_FINISH_REASONS = {"SAFETY", "RECITATION", "BLOCKLIST", "PROHIBITED_CONTENT", "SPII", "PROMPT_BLOCKED"}
+
+
+def classify_error(error):
+    from google.api_core import exceptions
+
+    if isinstance(error, exceptions.TooManyRequests):
+        return RATE_LIMIT
+    if isinstance(error, (exceptions.ServerError, exceptions.Aborted, exceptions.RetryError)):
+        return TRANSIENT
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    return FATAL
+
+
+def classify_response(finish_reason, missing=False):
+    # None for a complete response
+    if finish_reason in SAFETY_FINISH_REASONS:
+        return SAFETY
+    if finish_reason == "MAX_TOKENS":
+        return TRUNCATION
+    if missing:
+        return SCHEMA
+    return None
+
+
+def retry_hint(error):
+    # seconds the server asked us to wait, from a RetryInfo in the gRPC error details or a Retry-After header
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers["Retry-After"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    # exponential backoff with jitter: attempt n waits between half and all of min(max_delay, base_delay * 2**(n-1)),
+    # at least as long as the server asked for
+    def __init__(self, max_attempts=5, base_delay=2.0, max_delay=120.0, seed=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = random.Random(seed)
+
+    def should_retry(self, error_class, attempt):
+        return error_class in (RATE_LIMIT, TRANSIENT) and attempt < self.max_attempts
+
+    def delay(self, attempt, hint=None):
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = cap / 2 + self.rng.uniform(0, cap / 2)
+        return max(delay, hint) if hint is not None else delay
+
+
+class CircuitBreaker:
+    # per endpoint: opens once `threshold` of the last `window` requests failed (and at least `min_failures`),
+    # then no requests go to the endpoint for `cooldown` seconds. After that a single trial request is let
+    # through, its success closes the breaker, its failure opens it again for twice as long
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window=20, threshold=0.5, min_failures=5, cooldown=30.0, max_cooldown=600.0):
+        self.threshold = threshold
+        self.min_failures = min_failures
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.results = deque(maxlen=window)
+        self.state = self.CLOSED
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.trips = 0
+
+    def available(self, now=None):
+        now = time.time() if now is None else now
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return now >= self.open_until
+        return not self.trial_in_flight
+
+    def start(self, now=None):
+        # a request was sent through the endpoint
+        now = time.time() if now is None else now
+        if self.state == self.OPEN and now >= self.open_until:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            self.trial_in_flight = True
+
+    def record(self, success, now=None):
+        now = time.time() if now is None else now
+        if self.state == self.HALF_OPEN and self.trial_in_flight:
+            self.trial_in_flight = False
+            if success:
+                self.state = self.CLOSED
+                self.cooldown = self.base_cooldown
+                self.results.clear()
+            else:
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self.trip(now)
+            return
+        self.results.append(success)
+        failures = self.results.count(False)
+        if self.state == self.CLOSED and failures >= self.min_failures and failures >= self.threshold * len(self.results):
+            self.trip(now)
+
+    def cancel(self):
+        # a request given up on before it had a result counts neither way, but no longer holds the trial
+        self.trial_in_flight = False
+
+    def trip(self, now):
+        self.state = self.OPEN
+        self.open_until = now + self.cooldown
+        self.trips += 1
@@ -0,0 +1,246 @@
+# draft-4 JSON schemas compiled once, for the keywords the QoL schemas use. A compiled checker takes a value
+# and returns every violation as (path, message), path being the tuple of keys / indices from the value down
+# to the offending one, and the shared empty tuple for a valid value. It is two functions: the schema
+# generated as straight-line Python source that only answers valid or not, which is all almost every record
+# needs, and nested closures that collect the violations, run only when that says invalid.
+# Schemas with other keywords raise NotImplementedError, jsonschema handles those
+
+SUPPORTED = {
+    "$schema",
+    "type",
+    "properties",
+    "required",
+    "items",
+    "additionalItems",
+    "additionalProperties",
+    "enum",
+    "minimum",
+    "maximum",
+}
+
+TYPES = {
+    "object": (dict,),
+    "array": (list,),
+    "string": (str,),
+    # bool is an int in Python but not in JSON
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "null": (type(None),),
+}
+
+OK = ()
+
+
+def json_path(path):
+    return "$" + "".join(f"[{part}]" if isinstance(part, int) else f".{part}" for part in path)
+
+
+def unexpected(extra):
+    # worded as jsonschema does, so either validator reports the same messages
+    return f"{', '.join(map(repr, extra))} {'was' if len(extra) == 1 else 'were'} unexpected"
+
+
+def nested(key, errors):
+    return [((key, *path), message) for path, message in errors]
+
+
+def compile_schema(schema):
+    errors = compile_errors(schema)
+    valid = compile_valid(schema)
+    if valid is None:
+        return errors
+
+    def check(value):
+        return OK if valid(value) else errors(value)
+
+    return check
+
+
+def compile_valid(schema):
+    # a single generated function without calls into other checkers, None where the schema has something it
+    # doesn't generate (tuple form items) or is nested too deep for Python's block limit
+    lines = ["def valid(v0):"]
+    constants = {}
+    if not emit_valid(schema, "v0", 1, lines, constants):
+        return None
+    lines.append("    return True")
+    try:
+        code = compile("\n".join(lines), "<compiled schema>", "exec")
+    except SyntaxError:
+        return None
+    exec(code, constants)
+    return constants["valid"]
+
+
+def emit_valid(schema, var, indent, lines, constants):
+    # appends the statements returning False when `var` violates `schema`
+    pad = "    " * indent
+    kind = schema.get("type")
+    if kind == "null":
+        lines.append(f"{pad}if {var} is not None: return False")
+    elif kind == "number":
+        lines.append(f"{pad}if type({var}) not in (int, float): return False")
+    elif kind is not None:
+        lines.append(f"{pad}if type({var}) is not {TYPES[kind][0].__name__}: return False")
+    if "enum" in schema:
+        name = f"enum_{len(constants)}"
+        constants[name] = schema["enum"]
+        lines.append(f"{pad}if {var} not in {name}: return False")
+    if "minimum" in schema:
+        lines.append(f"{pad}if type({var}) in (int, float) and {var} < {schema['minimum']!r}: return False")
+    if "maximum" in schema:
+        lines.append(f"{pad}if type({var}) in (int, float) and {var} > {schema['maximum']!r}: return False")
+
+    if "required" in schema or "properties" in schema or "additionalProperties" in schema:
+        if kind != "object":
+            lines.append(f"{pad}if type({var}) is dict:")
+            indent += 1
+            pad = "    " * indent
+        required = schema.get("required", [])
+        if required:
+            lines.append(f"{pad}if {' or '.join(f'{key!r} not in {var}' for key in required)}: return False")
+        if schema.get("additionalProperties", True) is False:
+            name = f"known_{len(constants)}"
+            constants[name] = frozenset(schema.get("properties", {}))
+            lines.append(f"{pad}if not {name}.issuperset({var}): return False")
+        child = f"v{int(var[1:]) + 1}"
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in required:
+                lines.append(f"{pad}{child} = {var}[{key!r}]")
+                if not emit_valid(sub_schema, child, indent, lines, constants):
+                    return False
+            else:
+                lines.append(f"{pad}if {key!r} in {var}:")
+                lines.append(f"{pad}    {child} = {var}[{key!r}]")
+                if not emit_valid(sub_schema, child, indent + 1, lines, constants):
+                    return False
+        if kind != "object":
+            indent -= 1
+            pad = "    " * indent
+
+    if "items" in schema:
+        if isinstance(schema["items"], list):
+            return False
+        if kind != "array":
+            lines.append(f"{pad}if type({var}) is list:")
+            indent += 1
+            pad = "    " * indent
+        child = f"v{int(var[1:]) + 1}"
+        lines.append(f"{pad}for {child} in {var}:")
+        if not emit_valid(schema["items"], child, indent + 1, lines, constants):
+            return False
+    return True
+
+
+def compile_errors(schema):
+    unsupported = set(schema) - SUPPORTED
+    if unsupported:
+        raise NotImplementedError(f"Unsupported schema keywords {sorted(unsupported)}")
+    checks = []
+
+    if "type" in schema:
+        kind = schema["type"]
+        if kind not in TYPES:
+            raise NotImplementedError(f"Unsupported type {kind!r}")
+        allowed = TYPES[kind]
+        boolean = kind == "boolean"
+
+        def check_type(value):
+            if type(value) in allowed or (not boolean and type(value) is not bool and isinstance(value, allowed)):
+                return OK
+            return [((), f"{value!r} is not of type {kind!r}")]
+
+        checks.append(check_type)
+
+    if "enum" in schema:
+        options = schema["enum"]
+
+        def check_enum(value):
+            return OK if value in options else [((), f"{value!r} is not one of {options!r}")]
+
+        checks.append(check_enum)
+
+    if "minimum" in schema or "maximum" in schema:
+        low, high = schema.get("minimum"), schema.get("maximum")
+
+        def check_range(value):
+            if type(value) not in (int, float):
+                return OK
+            if low is not None and value < low:
+                return [((), f"{value!r} is less than the minimum of {low!r}")]
+            if high is not None and value > high:
+                return [((), f"{value!r} is greater than the maximum of {high!r}")]
+            return OK
+
+        checks.append(check_range)
+
+    if "required" in schema or "properties" in schema or "additionalProperties" in schema:
+        required = schema.get("required", [])
+        properties = [(key, compile_errors(sub_schema)) for key, sub_schema in schema.get("properties", {}).items()]
+        known = set(schema.get("properties", {}))
+        additional = schema.get("additionalProperties", True)
+
+        def check_object(value):
+            if type(value) is not dict:
+                return OK
+            errors = OK
+            for key in required:
+                if key not in value:
+                    errors = [*errors, ((), f"{key!r} is a required property")]
+            for key, check in properties:
+                if key in value:
+                    found = check(value[key])
+                    if found:
+                        errors = [*errors, *nested(key, found)]
+            if additional is False:
+                extra = [key for key in value if key not in known]
+                if extra:
+                    errors = [*errors, ((), f"Additional properties are not allowed ({unexpected(extra)})")]
+            return errors
+
+        checks.append(check_object)
+
+    if "items" in schema:
+        items = schema["items"]
+        if isinstance(items, list):
+            # the tuple form only checks the first len(items) elements, the rest against additionalItems
+            positional = [compile_errors(sub_schema) for sub_schema in items]
+            rest = schema.get("additionalItems", True)
+            rest = compile_errors(rest) if isinstance(rest, dict) else rest
+        else:
+            positional = []
+            rest = compile_errors(items)
+
+        def check_array(value):
+            if type(value) is not list:
+                return OK
+            errors = OK
+            for i, item in enumerate(value):
+                if i < len(positional):
+                    found = positional[i](item)
+                elif rest is False:
+                    errors = [*errors, ((), f"Additional items are not allowed ({unexpected(value[i:])})")]
+                    break
+                elif rest is True:
+                    break
+                else:
+                    found = rest(item)
+                if found:
+                    errors = [*errors, *nested(i, found)]
+            return errors
+
+        checks.append(check_array)
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check(value):
+        errors = OK
+        for check_one in checks:
+            found = check_one(value)
+            if found:
+                errors = [*errors, *found]
+        return errors
+
+    return check
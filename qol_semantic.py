@@ -0,0 +1,222 @@
+import csv
+import operator
+
+import fire
+import numpy as np
+
+from qol_data_validator import QOL_JSON_SCHEMA, validate_records
+from qol_store import ResultStore
+
+# what intro_to_qol_matrix asks for: sub-scores are integers in 1-100, QoL an integer in 0-100
+SCORE_RANGE = (1, 100)
+QOL_RANGE = (0, 100)
+
+MISSING = np.iinfo(np.int16).min
+
+CHECKS = [
+    "missing",
+    "unknown_ed",
+    "name_mismatch",
+    "duplicate_name",
+    "incomplete",
+    "out_of_range",
+    "qol_residual",
+    "constant",
+    "duplicate_answer",
+]
+
+
+def score_columns(schema=QOL_JSON_SCHEMA):
+    # (domain, key) of the 18 scores, QoL first (domain None) and then the sub-scores as ordered in the schema
+    answer = schema["items"]["properties"]["answer"]["properties"]
+    sub_scores = [
+        (domain, key)
+        for domain, domain_schema in answer.items()
+        if domain_schema.get("type") == "object"
+        for key in domain_schema["properties"]
+    ]
+    return [(None, "QoL"), *sub_scores]
+
+
+def score_matrix(answers, columns):
+    # the answers as an (n x 18) int16 array, MISSING where a score is absent or not an integer. Complete
+    # answers take one itemgetter per domain, the score by score path is only for the broken ones
+    high = np.iinfo(np.int16).max
+    domains = list(dict.fromkeys(domain for domain, _ in columns))
+    getters = [
+        (domain, operator.itemgetter(*keys) if len(keys) > 1 else lambda group, key=keys[0]: (group[key],))
+        for domain in domains
+        for keys in [[key for column_domain, key in columns if column_domain == domain]]
+    ]
+
+    def complete_row(answer):
+        values = []
+        try:
+            for domain, getter in getters:
+                values.extend(getter(answer) if domain is None else getter(answer[domain]))
+        except (KeyError, TypeError, IndexError):
+            return None
+        if all(type(value) is int for value in values) and MISSING < min(values) and max(values) <= high:
+            return values
+        return None
+
+    def score(answer, domain, key):
+        group = answer.get(domain) if domain is not None and isinstance(answer, dict) else answer
+        value = group.get(key) if isinstance(group, dict) else None
+        if type(value) is not int:
+            return MISSING
+        return min(max(value, MISSING + 1), high)
+
+    rows = [complete_row(answer) or [score(answer, domain, key) for domain, key in columns] for answer in answers]
+    return np.array(rows, dtype=np.int16).reshape(len(rows), len(columns))
+
+
+def score_violations(scores, columns, tolerance=15.0, weights="mean"):
+    # (row, check, detail) of every violation in the score matrix. "mean" compares QoL with the mean of the
+    # 17 sub-scores, "domain" with the mean of the 6 domain means (every domain weighted equally)
+    names = [key if domain is None else f"{domain}:{key}" for domain, key in columns]
+    violations = []
+    known = scores != MISSING
+    complete = known.all(axis=1)
+    for row in np.flatnonzero(~complete):
+        violations.append((row, "incomplete", "no integer " + ", ".join(np.array(names)[~known[row]])))
+
+    low = np.array([QOL_RANGE[0]] + [SCORE_RANGE[0]] * (len(columns) - 1))
+    high = np.array([QOL_RANGE[1]] + [SCORE_RANGE[1]] * (len(columns) - 1))
+    out_of_range = known & ((scores < low) | (scores > high))
+    for row, column in zip(*np.nonzero(out_of_range)):
+        violations.append((row, "out_of_range", f"{names[column]} = {scores[row, column]}"))
+
+    sub_scores = scores[:, 1:].astype(np.float64)
+    if weights == "mean":
+        estimate = sub_scores.mean(axis=1)
+    elif weights == "domain":
+        domains = list(dict.fromkeys(domain for domain, _ in columns[1:]))
+        averaging = np.zeros((len(columns) - 1, len(domains)))
+        for k, (domain, _) in enumerate(columns[1:]):
+            averaging[k, domains.index(domain)] = 1
+        averaging /= averaging.sum(axis=0)
+        estimate = (sub_scores @ averaging).mean(axis=1)
+    else:
+        raise ValueError(f"Unknown weights {weights}, expected 'mean' or 'domain'")
+    residual = scores[:, 0] - estimate
+    for row in np.flatnonzero(complete & (np.abs(residual) > tolerance)):
+        violations.append((row, "qol_residual", f"QoL {scores[row, 0]} against {estimate[row]:.1f} ({weights})"))
+
+    constant = complete & (scores[:, 1:].min(axis=1) == scores[:, 1:].max(axis=1))
+    for row in np.flatnonzero(constant):
+        violations.append((row, "constant", f"every sub-score is {scores[row, 1]}"))
+
+    # the same 18 scores for different EDs, as a model copying an answer produces. Rows are compared as
+    # single opaque values, several times faster than np.unique(axis=0)
+    rows = np.flatnonzero(complete)
+    if len(rows):
+        complete_scores = np.ascontiguousarray(scores[rows])
+        row_values = complete_scores.view(np.dtype((np.void, complete_scores.itemsize * len(columns)))).ravel()
+        _, inverse, counts = np.unique(row_values, return_inverse=True, return_counts=True)
+        shared = counts[inverse.reshape(-1)]
+        for row, count in zip(rows[shared > 1], shared[shared > 1]):
+            violations.append((row, "duplicate_answer", f"same scores as {count - 1} other EDs"))
+    return violations
+
+
+def record_violations(records, tolerance=15.0, weights="mean"):
+    # (index, check, detail) of the records of a single response failing the schema or the score checks,
+    # the store checks short of coverage, cheap enough to run on every response. Copies are only found
+    # within the records given
+    violations = [(index, "schema", f"{path}: {message}") for index, _, path, message in validate_records(records)]
+    columns = score_columns()
+    scores = score_matrix([record.get("answer") if isinstance(record, dict) else None for record in records], columns)
+    violations.extend(score_violations(scores, columns, tolerance, weights))
+    return violations
+
+
+def reject_invalid(records, tolerance=15.0, weights="mean"):
+    # the records of a response that pass record_violations, and {ED name: problems} of those that don't
+    problems = {}
+    for index, check, detail in record_violations(records, tolerance, weights):
+        problems.setdefault(index, []).append(f"{check} {detail}")
+    invalid = {records[index]["query"]: "; ".join(found) for index, found in problems.items()}
+    return [record for index, record in enumerate(records) if index not in problems], invalid
+
+
+def coverage_violations(ed_ids, ed_names, store_ids, record_names):
+    # (row, check, detail) for the ED table: rows without a record, records answering a different or the same
+    # name as another ED. Records of ED_IDs not in the table come back with row None
+    violations = []
+    position = {ed_id: row for row, ed_id in enumerate(ed_ids)}
+    for ed_id in store_ids:
+        if ed_id not in position:
+            violations.append((None, "unknown_ed", ed_id))
+    present = np.array([name is not None for name in record_names], dtype=bool)
+    for row in np.flatnonzero(~present):
+        violations.append((row, "missing", "no record"))
+    names = np.array([name if name is not None else "" for name in record_names], dtype=object)
+    expected = np.array(ed_names, dtype=object)
+    for row in np.flatnonzero(present & (names != expected)):
+        violations.append((row, "name_mismatch", f"record answers {names[row]!r}"))
+    rows = np.flatnonzero(present)
+    if len(rows):
+        _, inverse, counts = np.unique(names[rows].astype(str), return_inverse=True, return_counts=True)
+        shared = counts[inverse.reshape(-1)]
+        for row, count in zip(rows[shared > 1], shared[shared > 1]):
+            violations.append((row, "duplicate_name", f"{names[row]!r} answered for {count} EDs"))
+    return violations
+
+
+def check_store(store, data, tolerance=15.0, weights="mean"):
+    # the per-ED violation table of a results store against the ED table, as (ED_ID, name, check, detail)
+    ed_ids = [row["ED_ID"] for row in data]
+    ed_names = [row["Electoral Divisions"] for row in data]
+    records = dict(store.records())
+    answers = [records[ed_id]["answer"] if ed_id in records else None for ed_id in ed_ids]
+    record_names = [records[ed_id].get("query") if ed_id in records else None for ed_id in ed_ids]
+    columns = score_columns()
+    scores = score_matrix(answers, columns)
+
+    violations = coverage_violations(ed_ids, ed_names, store.ids(), record_names)
+    # EDs without a record are reported as missing rather than incomplete
+    scored = score_violations(scores, columns, tolerance, weights)
+    violations.extend(violation for violation in scored if answers[violation[0]] is not None)
+    order = {check: k for k, check in enumerate(CHECKS)}
+    violations.sort(key=lambda violation: (-1 if violation[0] is None else violation[0], order[violation[1]]))
+    return [
+        (
+            ed_ids[row] if row is not None else detail,
+            ed_names[row] if row is not None else None,
+            check,
+            detail,
+        )
+        for row, check, detail in violations
+    ]
+
+
+def main(
+    directory: str = "qol_dataset",
+    output: str = "qol_violations.csv",
+    tolerance: float = 15.0,
+    weights: str = "mean",
+):
+    # semantic checks of the results store on top of the schema: every ED of the table answered exactly once
+    # under its own name, scores within range, QoL within `tolerance` of the sub-score average, no constant
+    # or copied answers. Writes the per-ED violation table to `output` and prints the count per check
+    from synthesizing_pol import load_eds
+
+    store = ResultStore(directory, read_only=True)
+    try:
+        table = check_store(store, load_eds(), tolerance, weights)
+    finally:
+        store.close()
+    with open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["ED_ID", "Electoral Divisions", "check", "detail"])
+        writer.writerows(table)
+    counts = {check: 0 for check in CHECKS}
+    for _, _, check, _ in table:
+        counts[check] += 1
+    print(", ".join(f"{count} {check}" for check, count in counts.items()))
+    print(f"{len({ed_id for ed_id, _, _, _ in table})} EDs with violations, see {output}")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,109 @@
+import asyncio
+import time
+from pathlib import Path
+
+from qol_ratelimit import RateLimiter
+from qol_retry import CircuitBreaker
+
+DEFAULT_ENDPOINT = "versatile-hub-433711-g9:europe-west2"
+
+
+class Endpoint:
+    # a project/region pair with its own quota, written as "project:location[:requests_per_minute[:tokens_per_minute]]"
+    def __init__(self, project, location, requests_per_minute=5, tokens_per_minute=None):
+        self.project = project
+        self.location = location
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+    @classmethod
+    def parse(cls, spec, requests_per_minute=5, tokens_per_minute=None):
+        project, location, *quota = spec.split(":")
+        if len(quota) > 0 and quota[0]:
+            requests_per_minute = int(quota[0])
+        if len(quota) > 1 and quota[1]:
+            tokens_per_minute = int(quota[1])
+        return cls(project, location, requests_per_minute, tokens_per_minute)
+
+    @property
+    def name(self):
+        return f"{self.project}:{self.location}"
+
+
+def parse_endpoints(endpoints, requests_per_minute=5, tokens_per_minute=None):
+    # fire hands over either a single string, a comma separated string or a tuple
+    if isinstance(endpoints, str):
+        endpoints = endpoints.split(",")
+    return [Endpoint.parse(spec.strip(), requests_per_minute, tokens_per_minute) for spec in endpoints if spec.strip()]
+
+
+class ModelSession:
+    def __init__(self, endpoint, model, limiter, breaker=None):
+        self.endpoint = endpoint
+        self.model = model
+        self.limiter = limiter
+        self.breaker = breaker or CircuitBreaker()
+        # set when the static prompt prefix is held by a context cache for this model
+        self.prefix_cached = False
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+
+
+class SessionPool:
+    # model handles are created once per endpoint (by `model_factory(endpoint)`, see qol_backend) and reused
+    # by every request, requests go to whichever endpoint can admit them soonest so throughput adds up
+    def __init__(self, endpoints, model_factory, state_dir=None):
+        self.sessions = []
+        for endpoint in endpoints:
+            state_file = None
+            if state_dir is not None:
+                state_file = Path(state_dir) / f"rate_limit_{endpoint.project}_{endpoint.location}.json"
+            limiter = RateLimiter(endpoint.requests_per_minute, endpoint.tokens_per_minute, state_file=state_file)
+            self.sessions.append(ModelSession(endpoint, model_factory(endpoint), limiter))
+
+    def warm(self):
+        # the prediction client (and its grpc channel) is otherwise created lazily on the first request,
+        # this has to run inside the event loop that will use the async client
+        for session in self.sessions:
+            getattr(session.model, "_prediction_async_client", None)
+
+    def pick(self, tokens):
+        # endpoints whose circuit breaker is open are left out, None if that's all of them
+        now = time.time()
+        sessions = [session for session in self.sessions if session.breaker.available(now)]
+        if not sessions:
+            return None
+        return min(
+            sessions,
+            key=lambda session: (session.limiter.wait_time(tokens, queued=session.queued), session.in_flight),
+        )
+
+    async def acquire(self, tokens=0):
+        start = time.time()
+        while (session := self.pick(tokens)) is None:
+            await asyncio.sleep(max(0.1, min(session.breaker.open_until for session in self.sessions) - time.time()))
+        # a half open breaker lets only this request through until it has finished
+        session.breaker.start()
+        session.queued += 1
+        try:
+            await session.limiter.acquire(tokens)
+        finally:
+            session.queued -= 1
+        session.in_flight += 1
+        return session, time.time() - start
+
+    def try_acquire(self, tokens=0, exclude=None):
+        # a session other than `exclude` that has quota left right now, or None, for extra requests that
+        # shouldn't wait
+        for session in sorted(self.sessions, key=lambda session: session.in_flight):
+            if session is exclude:
+                continue
+            if session.breaker.state == CircuitBreaker.CLOSED and session.limiter.try_acquire(tokens):
+                session.in_flight += 1
+                return session
+        return None
+
+    def release(self, session):
+        session.in_flight -= 1
+        session.completed += 1
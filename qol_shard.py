@@ -0,0 +1,104 @@
+import hashlib
+from pathlib import Path
+
+import fire
+
+from qol_store import ResultStore
+
+
+def shard_of(ed_id, num_shards):
+    # stable across machines, runs and Python versions (unlike hash()), and independent of the table order
+    return int(hashlib.sha256(ed_id.encode()).hexdigest()[:16], 16) % num_shards
+
+
+def shard_name(shard_index, num_shards):
+    return f"shard_{shard_index}_of_{num_shards}"
+
+
+def merge(output_dir: str = "qol_dataset", on_conflict: str = "fail", records_per_commit: int = 100):
+    # combines the stores of every <output_dir>/shard_*/ (copied together from the machines that ran them)
+    # and the one already in <output_dir> into the canonical store in <output_dir>. Records for the same ED
+    # with the same answer are duplicates and kept once, different answers are conflicts: "fail" stops
+    # without touching anything, "first" keeps the answer from the first source and "latest" the one from
+    # the last. The merged store comes first, then the shards in sorted order, so "first" never replaces an
+    # answer merged before and "latest" lets a shard rerun since replace it. Every conflict is printed with
+    # the source whose answer was kept. The result is rewritten in ED table order
+    from synthesizing_pol import load_eds
+
+    if on_conflict not in ("fail", "first", "latest"):
+        raise ValueError(f"Unknown on_conflict {on_conflict}, expected 'fail', 'first' or 'latest'")
+    output_dir = Path(output_dir)
+    data = load_eds()
+    position = {row["ED_ID"]: i for i, row in enumerate(data)}
+
+    shard_dirs = sorted(path for path in output_dir.glob("shard_*") if (path / "store.json").exists())
+    store = ResultStore(output_dir)
+    try:
+        existing = dict(store.records())
+        sources = [(path.name, path) for path in shard_dirs]
+        records = dict(existing)
+        origin = dict.fromkeys(existing, "merged")
+        duplicates = 0
+        conflicts = []
+        unknown = []
+        misplaced = []
+        for source, path in sources:
+            shard_store = ResultStore(path, read_only=True)
+            try:
+                shard_records = list(shard_store.records())
+            finally:
+                shard_store.close()
+            # an ED in a shard it isn't assigned to, e.g. outputs of runs with different --num_shards
+            index, num_shards = (int(part) for part in source[len("shard_") :].split("_of_"))
+            for ed_id, record in shard_records:
+                if ed_id not in position:
+                    unknown.append((source, ed_id))
+                    continue
+                if shard_of(ed_id, num_shards) != index:
+                    misplaced.append((source, ed_id))
+                if ed_id not in records:
+                    records[ed_id] = record
+                    origin[ed_id] = source
+                elif record["answer"] == records[ed_id]["answer"]:
+                    duplicates += 1
+                else:
+                    conflicts.append((ed_id, origin[ed_id], source))
+                    if on_conflict == "latest":
+                        records[ed_id] = record
+                        origin[ed_id] = source
+
+        print(f"Read {len(records)} EDs from {len(shard_dirs)} shards and {len(existing)} merged EDs")
+        print(
+            f"{duplicates} duplicates, {len(conflicts)} conflicts, {len(unknown)} unknown EDs, {len(misplaced)} misplaced"
+        )
+        for ed_id, first, other in conflicts:
+            name = data[position[ed_id]]["Electoral Divisions"]
+            kept = {"first": f", kept {first}", "latest": f", kept {other}"}.get(on_conflict, "")
+            print(f"Conflict for {name!r}: {first} and {other} differ{kept}")
+        for source, ed_id in unknown:
+            print(f"Unknown ED_ID {ed_id!r} in {source}")
+        for source, ed_id in misplaced:
+            print(f"{data[position[ed_id]]['Electoral Divisions']!r} in {source} does not belong to that shard")
+        if conflicts and on_conflict == "fail":
+            raise SystemExit(
+                "Not merged, rerun with --on_conflict first to keep the first answer or latest to keep the last"
+            )
+
+        # EDs new to the merged store are appended and, with "latest", the ones a shard answered differently
+        # replaced, then everything is compacted into ED table order (EDs not in the table last)
+        written = sorted((ed_id for ed_id in records if origin[ed_id] != "merged"), key=position.get)
+        for start in range(0, len(written), records_per_commit):
+            store.put((ed_id, records[ed_id]) for ed_id in written[start : start + records_per_commit])
+        if written:
+            store.compact(key=lambda ed_id: position.get(ed_id, len(position)), records_per_member=records_per_commit)
+        replaced = sum(ed_id in existing for ed_id in written)
+        missing = len(data) - len(records)
+        print(
+            f"Wrote {len(written) - replaced} new and {replaced} replaced EDs to {output_dir} in ED table order, "
+            f"{missing} EDs missing"
+        )
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    fire.Fire({"merge": merge})
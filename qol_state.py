@@ -0,0 +1,28 @@
+import json
+import os
+from pathlib import Path
+
+# run state (rate limiter buckets, caches, journals) lives here unless told otherwise
+STATE_DIR = Path(".qol_state")
+
+
+def atomic_write_text(path, text):
+    # write next to the target and rename over it, so a crash never leaves a half written file
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_json(path, default=None):
+    path = Path(path)
+    if not path.exists():
+        return default
+    try:
+        return json.loads(path.read_text())
+    except json.JSONDecodeError:
+        return default
@@ -0,0 +1,306 @@
+import gzip
+import json
+import os
+import tarfile
+from pathlib import Path
+
+import fire
+
+from qol_state import atomic_write_text, read_json
+
+
+def read_member(f, offset, length, lines):
+    # the records at the given (line, ED_ID) of the gzip member at `offset` of an open part file
+    f.seek(offset)
+    text = gzip.decompress(f.read(length)).splitlines()
+    return [json.loads(text[line]) for line, _ in lines]
+
+
+class ResultStore:
+    # the generated records of a run, appended to a few gzip'd JSONL part files instead of one JSON file per
+    # batch. Every put() is one commit: its records are appended to one part as a single gzip member (so a
+    # part stays a plain .jsonl.gz that zcat and gzip.open read), the part is fsync'd, then a line listing the
+    # ED_IDs of the member is appended to the index and fsync'd. That index line is the commit point, data
+    # past the last indexed member of a part was never committed and is cut off when the store is opened.
+    # Replaying the index maps every ED_ID to the member and line of its latest record, get() reads and
+    # inflates just that member, putting an ED again replaces its record (compact() drops the old ones).
+    # One writer at a time, sharded runs (see qol_shard) each have their own store. Readers open it with
+    # read_only=True: they create and repair nothing and stop at the last indexed member, so they can run
+    # alongside the writer without cutting off a commit it is halfway through
+    VERSION = 1
+
+    def __init__(self, directory="qol_dataset", num_parts=8, sync=True, read_only=False):
+        self.directory = Path(directory)
+        self.sync = sync
+        self.read_only = read_only
+        if read_only:
+            meta = read_json(self.directory / "store.json")
+            if meta is None:
+                raise FileNotFoundError(f"No result store in {self.directory}")
+        else:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            meta = read_json(self.directory / "store.json")
+        if meta is None:
+            meta = {"version": self.VERSION, "num_parts": num_parts, "generation": 0}
+            atomic_write_text(self.directory / "store.json", json.dumps(meta))
+        self.num_parts = meta["num_parts"]
+        self.generation = meta["generation"]
+        self.load()
+
+    def part_path(self, part, generation=None):
+        generation = self.generation if generation is None else generation
+        return self.directory / f"part-{generation:04d}-{part:02d}.jsonl.gz"
+
+    def index_path(self, generation=None):
+        generation = self.generation if generation is None else generation
+        return self.directory / f"index-{generation:04d}.jsonl"
+
+    def load(self):
+        # ED_ID -> (part, offset, length, line) of its latest record, and the members of every part in file order
+        self.index = {}
+        self.members = [[] for _ in range(self.num_parts)]
+        self.ends = [0] * self.num_parts
+        self.commits = 0
+        index_path = self.index_path()
+        committed = 0
+        if index_path.exists():
+            with open(index_path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a torn final line from a crash mid-write, the commit never happened
+                        break
+                    self.add_member(entry)
+                    committed += len(line)
+        self.part_files = {}
+        if self.read_only:
+            # members past self.ends are never read, whatever is there is left for the writer to commit or cut off
+            self.index_file = None
+            return
+        if index_path.exists() and committed < index_path.stat().st_size:
+            os.truncate(index_path, committed)
+        for part in range(self.num_parts):
+            path = self.part_path(part)
+            if path.exists() and path.stat().st_size > self.ends[part]:
+                os.truncate(path, self.ends[part])
+        self.index_file = open(index_path, "a")
+
+    def add_member(self, entry):
+        part, offset, length = entry["part"], entry["offset"], entry["length"]
+        self.members[part].append((offset, length, entry["eds"]))
+        for line, ed_id in enumerate(entry["eds"]):
+            self.index[ed_id] = (part, offset, length, line)
+        self.ends[part] = max(self.ends[part], offset + length)
+        self.commits += 1
+
+    def put(self, items):
+        # (ED_ID, record) pairs, committed together
+        if self.read_only:
+            raise ValueError(f"{self.directory} was opened read-only")
+        items = list(items)
+        if not items:
+            return
+        part = self.commits % self.num_parts
+        member = gzip.compress("".join(json.dumps(record) + "\n" for _, record in items).encode(), mtime=0)
+        if part not in self.part_files:
+            self.part_files[part] = open(self.part_path(part), "ab")
+        f = self.part_files[part]
+        # offsets are where the bytes actually go, not where the last commit ended
+        offset = f.tell()
+        index_offset = self.index_file.tell()
+        try:
+            f.write(member)
+            f.flush()
+            if self.sync:
+                os.fsync(f.fileno())
+            entry = {"part": part, "offset": offset, "length": len(member), "eds": [ed_id for ed_id, _ in items]}
+            self.index_file.write(json.dumps(entry) + "\n")
+            self.index_file.flush()
+            if self.sync:
+                os.fsync(self.index_file.fileno())
+        except BaseException:
+            self.rollback(part, offset, index_offset)
+            raise
+        self.add_member(entry)
+
+    def rollback(self, part, offset, index_offset):
+        # a write or fsync that failed halfway leaves the part and the index as they were before the put,
+        # rather than with a partial member or index line later commits would be appended after
+        for f, path, size in [
+            (self.part_files.pop(part), self.part_path(part), offset),
+            (self.index_file, self.index_path(), index_offset),
+        ]:
+            try:
+                f.close()
+            except OSError:
+                # the buffered rest couldn't be written either, it is cut off below all the same
+                pass
+            os.truncate(path, size)
+        self.index_file = open(self.index_path(), "a")
+
+    def get(self, ed_id):
+        location = self.index.get(ed_id)
+        if location is None:
+            return None
+        part, offset, length, line = location
+        with open(self.part_path(part), "rb") as f:
+            return read_member(f, offset, length, [(line, ed_id)])[0]
+
+    def __contains__(self, ed_id):
+        return ed_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def ids(self):
+        return self.index.keys()
+
+    def live_members(self, part):
+        # (offset, length, [(line, ED_ID)]) of the members of a part that still hold an ED's latest record
+        for offset, length, ed_ids in self.members[part]:
+            location = (part, offset, length)
+            lines = [(line, ed_id) for line, ed_id in enumerate(ed_ids) if self.index[ed_id] == (*location, line)]
+            if lines:
+                yield offset, length, lines
+
+    def records(self, part=None):
+        # (ED_ID, record) of every ED's latest record, streamed part by part in the order they were written
+        parts = range(self.num_parts) if part is None else [part]
+        for part in parts:
+            if not self.members[part]:
+                continue
+            with open(self.part_path(part), "rb") as f:
+                for offset, length, lines in self.live_members(part):
+                    records = read_member(f, offset, length, lines)
+                    for (_, ed_id), record in zip(lines, records):
+                        yield ed_id, record
+
+    def compact(self, key=None, records_per_member=100):
+        # rewrites the latest records (ordered by `key` of the ED_ID) into a new generation of parts, the
+        # switch to it is a single atomic write of store.json, after which the old generation is removed
+        if self.read_only:
+            raise ValueError(f"{self.directory} was opened read-only")
+        records = sorted(self.records(), key=lambda item: key(item[0])) if key else list(self.records())
+        old_generation = self.generation
+        self.close()
+        self.generation += 1
+        self.index_path().unlink(missing_ok=True)
+        for part in range(self.num_parts):
+            self.part_path(part).unlink(missing_ok=True)
+        self.load()
+        for start in range(0, len(records), records_per_member):
+            self.put(records[start : start + records_per_member])
+        meta = {"version": self.VERSION, "num_parts": self.num_parts, "generation": self.generation}
+        atomic_write_text(self.directory / "store.json", json.dumps(meta))
+        self.index_path(old_generation).unlink(missing_ok=True)
+        for part in range(self.num_parts):
+            self.part_path(part, old_generation).unlink(missing_ok=True)
+
+    def size(self):
+        paths = [self.index_path(), *(self.part_path(part) for part in range(self.num_parts))]
+        return sum(path.stat().st_size for path in paths if path.exists())
+
+    def close(self):
+        if self.index_file is not None:
+            self.index_file.close()
+        for f in self.part_files.values():
+            f.close()
+        self.part_files = {}
+
+
+def legacy_records(path):
+    # records of the old per-batch JSON files, given as files, directories of them or the tar.gz they were
+    # packed into, without the macOS ._* AppleDouble files that came with the archive
+    path = Path(path)
+    if path.is_dir():
+        for file in sorted(path.glob("*.json")):
+            yield from legacy_records(file)
+    elif path.name.endswith((".tar.gz", ".tgz", ".tar")):
+        with tarfile.open(path) as tar:
+            for member in tar:
+                name = Path(member.name).name
+                if member.isfile() and name.endswith(".json") and not name.startswith("._"):
+                    yield from json.load(tar.extractfile(member))
+    elif not path.name.startswith("._"):
+        yield from json.loads(path.read_text())
+
+
+def import_files(*paths, directory: str = "qol_dataset", records_per_member: int = 100):
+    # moves the output of older runs into the store, records are matched to EDs by name
+    from synthesizing_pol import load_eds
+
+    ed_ids = {row["Electoral Divisions"]: row["ED_ID"] for row in load_eds()}
+    store = ResultStore(directory)
+    items = []
+    unknown = 0
+    try:
+        for path in paths:
+            for record in legacy_records(path):
+                if record["query"] not in ed_ids:
+                    print(f"Unknown ED {record['query']!r} in {path}")
+                    unknown += 1
+                    continue
+                items.append((ed_ids[record["query"]], record))
+                if len(items) == records_per_member:
+                    store.put(items)
+                    items = []
+        store.put(items)
+        print(f"{len(store)} EDs in {directory}, {unknown} unknown EDs skipped")
+    finally:
+        store.close()
+
+
+def export(output: str = "qol_dataset.jsonl.gz", directory: str = "qol_dataset"):
+    # every ED's latest record in the order of the ED table, as a single gzip'd JSONL file to hand over
+    from synthesizing_pol import load_eds
+
+    position = {row["ED_ID"]: i for i, row in enumerate(load_eds())}
+    store = ResultStore(directory, read_only=True)
+    try:
+        records = sorted(store.records(), key=lambda item: position.get(item[0], len(position)))
+    finally:
+        store.close()
+    with gzip.open(output, "wt") as f:
+        for _, record in records:
+            f.write(json.dumps(record) + "\n")
+    print(f"Wrote {len(records)} records to {output}")
+
+
+def get(ed_id: str, directory: str = "qol_dataset"):
+    store = ResultStore(directory, read_only=True)
+    try:
+        return store.get(str(ed_id))
+    finally:
+        store.close()
+
+
+def compact(directory: str = "qol_dataset"):
+    # drops replaced records and rewrites the parts in ED_ID order
+    store = ResultStore(directory)
+    try:
+        before = store.size()
+        store.compact(key=lambda ed_id: (len(ed_id), ed_id))
+        print(f"{len(store)} EDs, {before / 1e6:.2f} MB -> {store.size() / 1e6:.2f} MB")
+    finally:
+        store.close()
+
+
+def stats(directory: str = "qol_dataset"):
+    store = ResultStore(directory, read_only=True)
+    try:
+        records = sum(len(ed_ids) for members in store.members for _, _, ed_ids in members)
+        return {
+            "eds": len(store),
+            "replaced_records": records - len(store),
+            "commits": store.commits,
+            "parts": store.num_parts,
+            "generation": store.generation,
+            "bytes": store.size(),
+        }
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    fire.Fire({"import": import_files, "export": export, "get": get, "compact": compact, "stats": stats})
@@ -0,0 +1,90 @@
+import json
+
+
+class JsonArrayStream:
+    # incremental parser for a streamed top level JSON array of objects, `feed` returns every
+    # object completed by the chunk so records can be handled before the response is finished
+    def __init__(self):
+        self.buffer = []
+        self.started = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.errors = []
+
+    def feed(self, chunk):
+        records = []
+        for char in chunk:
+            if not self.started:
+                if char == "[":
+                    self.started = True
+                continue
+            if self.depth == 0:
+                # between elements, only the start of the next object matters
+                if char == "{":
+                    self.depth = 1
+                    self.buffer = [char]
+                continue
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    text = "".join(self.buffer)
+                    self.buffer = []
+                    try:
+                        records.append(json.loads(text))
+                    except json.JSONDecodeError as e:
+                        self.errors.append(f"{e}: {text[:200]}")
+        return records
+
+    @property
+    def incomplete(self):
+        # true when the stream stopped inside an object
+        return self.depth > 0
+
+
+def schema_errors(value, schema, path="$"):
+    # checks a value against the response schema handed to Vertex (OBJECT / ARRAY / STRING / INTEGER)
+    kind = schema["type"]
+    if kind == "OBJECT":
+        if not isinstance(value, dict):
+            return [f"{path}: expected an object"]
+        errors = [f"{path}: missing {key}" for key in schema.get("required", []) if key not in value]
+        for key, property_schema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(schema_errors(value[key], property_schema, f"{path}.{key}"))
+        return errors
+    if kind == "ARRAY":
+        if not isinstance(value, list):
+            return [f"{path}: expected an array"]
+        return [error for i, item in enumerate(value) for error in schema_errors(item, schema["items"], f"{path}[{i}]")]
+    if kind == "STRING":
+        return [] if isinstance(value, str) else [f"{path}: expected a string"]
+    if kind == "INTEGER":
+        return [] if isinstance(value, int) and not isinstance(value, bool) else [f"{path}: expected an integer"]
+    return []
+
+
+def parse_records(text, schema):
+    # the non-streaming counterpart, returns the schema-valid records and the errors of the others
+    stream = JsonArrayStream()
+    records = []
+    errors = []
+    for record in stream.feed(text):
+        record_errors = schema_errors(record, schema)
+        if record_errors:
+            errors.extend(record_errors)
+        else:
+            records.append(record)
+    return records, errors + stream.errors
@@ -0,0 +1,140 @@
+import json
+import math
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import fire
+
+from qol_state import STATE_DIR
+
+DEFAULT_PATH = STATE_DIR / "telemetry" / "requests.jsonl"
+
+
+class TelemetryLog:
+    # one json line per API call, e.g.
+    # {"run": ..., "ts": ..., "endpoint": "project:location", "eds": 17, "attempt": 1, "quota_wait": 0.0,
+    #  "time_to_first_chunk": 4.2, "latency": 38.1, "prompt_tokens": 7012, "output_tokens": 6630, ...}
+    # lines are buffered in memory and written out every `flush_every` records or `flush_interval` seconds,
+    # without fsync, so logging never holds up a request. A killed run loses at most the unflushed tail
+    def __init__(self, path=None, flush_every=20, flush_interval=10.0):
+        self.path = Path(path or DEFAULT_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.run = time.time()
+        self.buffer = []
+        self.flushed_at = time.monotonic()
+        self.file = open(self.path, "a")
+
+    def record(self, **fields):
+        self.buffer.append(json.dumps({"run": self.run, **fields}) + "\n")
+        if len(self.buffer) >= self.flush_every or time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.writelines(self.buffer)
+        self.file.flush()
+        self.buffer = []
+        self.flushed_at = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_records(path=None):
+    records = []
+    with open(path or DEFAULT_PATH) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def percentile(values, q):
+    # nearest-rank percentile, None for no values
+    values = sorted(values)
+    if not values:
+        return None
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def summarize(records):
+    # latency distribution, throughput and how much of the configured quota a run actually used
+    # a cancelled hedged request ends when the other finishes, its latency says nothing about the model
+    latencies = [r["latency"] for r in records if r.get("latency") is not None and not r.get("cancelled")]
+    first_chunks = [r["time_to_first_chunk"] for r in records if r.get("time_to_first_chunk") is not None]
+    output_tokens = sum(r.get("output_tokens") or 0 for r in records)
+    start = min(r["ts"] for r in records)
+    end = max(r["ts"] + (r.get("latency") or 0) for r in records)
+    wall = max(end - start, 1e-9)
+
+    context = [r for r in records if r.get("context_tokens") and r.get("full_context_tokens")]
+    context_tokens = context_share = None
+    if context:
+        context_tokens = sum(r["context_tokens"] for r in context) / len(context)
+        context_share = sum(r["context_tokens"] / r["full_context_tokens"] for r in context) / len(context)
+
+    endpoints = {}
+    by_endpoint = defaultdict(list)
+    for r in records:
+        by_endpoint[r["endpoint"]].append(r)
+    for endpoint, endpoint_records in by_endpoint.items():
+        requests_per_minute = endpoint_records[0].get("requests_per_minute")
+        tokens_per_minute = endpoint_records[0].get("tokens_per_minute")
+        minutes = wall / 60
+        # the limiter allows a full bucket up front, so a short run can go slightly above 100%
+        used_requests = len(endpoint_records) / minutes
+        used_tokens = sum(r.get("total_tokens") or 0 for r in endpoint_records) / minutes
+        endpoints[endpoint] = {
+            "requests": len(endpoint_records),
+            "requests_per_minute": used_requests,
+            "request_quota_utilisation": used_requests / requests_per_minute if requests_per_minute else None,
+            "tokens_per_minute": used_tokens,
+            "token_quota_utilisation": used_tokens / tokens_per_minute if tokens_per_minute else None,
+            "quota_wait": sum(r.get("quota_wait") or 0 for r in endpoint_records),
+        }
+
+    return {
+        "requests": len(records),
+        "errors": sum(1 for r in records if r.get("error")),
+        "retries": sum(1 for r in records if (r.get("attempt") or 1) > 1),
+        "hedged": sum(1 for r in records if r.get("hedged")),
+        "cancelled": sum(1 for r in records if r.get("cancelled")),
+        "finish_reasons": dict(Counter(str(r.get("finish_reason")) for r in records)),
+        "error_classes": dict(Counter(r["error_class"] for r in records if r.get("error_class"))),
+        "wall_seconds": wall,
+        "latency": {f"p{q}": percentile(latencies, q) for q in (50, 95, 99)},
+        "time_to_first_chunk": {f"p{q}": percentile(first_chunks, q) for q in (50, 95, 99)},
+        "output_tokens": output_tokens,
+        # overall rate of the run next to the rate of a single streaming response
+        "output_tokens_per_second": output_tokens / wall,
+        "output_tokens_per_second_per_request": percentile(
+            [r["output_tokens"] / r["latency"] for r in records if r.get("output_tokens") and r.get("latency")], 50
+        ),
+        # prompt prefix per request against the full prefix, below 100% with county scoped context
+        "context_tokens": context_tokens,
+        "context_share": context_share,
+        "endpoints": endpoints,
+    }
+
+
+def summary(path: str = None, run: str = "last"):
+    # `run` is "last", "all" or the run id (start timestamp) found in the log
+    records = read_records(path)
+    if not records:
+        print("No requests logged")
+        return
+    if run == "last":
+        last = max(r["run"] for r in records)
+        records = [r for r in records if r["run"] == last]
+    elif run != "all":
+        records = [r for r in records if r["run"] == float(run)]
+    print(json.dumps(summarize(records), indent=2))
+
+
+if __name__ == "__main__":
+    fire.Fire({"summary": summary})
@@ -1,117 +1,659 @@
-import base64
+import asyncio
+import collections
+import copy
+import functools
 import fire
 from pathlib import Path
-import re
 import csv
 import time
 import gzip
-import vertexai
-from vertexai.generative_models import (
-    GenerativeModel,
-    GenerationConfig,
-    Part,
-    # SafetySetting,
-)
-import vertexai.generative_models
-
+import json
+import re
 
-def generate(location: str):
-    vertexai.init(project="versatile-hub-433711-g9", location="europe-west2")
-    model = GenerativeModel("gemini-1.5-pro-001", system_instruction=[system_prompt])
-    responses = model.generate_content(
-        [
+from qol_assets import asset_part
+from qol_backend import create_backend
+from qol_batching import BatchPlanner, RetryPacker, batch_spread, diff_records, locality_order
+from qol_context import CountyContext, estimate_tokens
+from qol_engine import GenerationEngine
+from qol_hedge import DeadlineExceeded, Hedger
+from qol_journal import FAILED, IN_FLIGHT, PENDING, SUCCEEDED, RunJournal
+from qol_prefix_cache import attach_prefix_cache, prefix_hash
+from qol_response_cache import ResponseCache, response_key
+from qol_retry import FATAL, SAFETY, TRANSIENT, RetryPolicy, classify_error, classify_response, retry_hint
+from qol_store import ResultStore
+from qol_semantic import reject_invalid as reject_invalid_records
+from qol_stream import JsonArrayStream, schema_errors
+from qol_session import DEFAULT_ENDPOINT, Endpoint, SessionPool, parse_endpoints
+from qol_shard import shard_name, shard_of
+from qol_telemetry import TelemetryLog
+
+
+def build_prefix_parts(context=None, counties=None):
+    # everything in front of the per-batch query, identical for every request unless a
+    # qol_context.CountyContext narrows the statistics down to the counties of the batch
+    if context is not None:
+        return [
             intro_to_qol_matrix,
             intro_to_housing_crisis,
-            housing_crisis_statistic_figure_1,
-            housing_crisis_statistic_figure_2,
+            asset_part("housing_crisis_statistic_figure_1"),
+            asset_part("housing_crisis_statistic_figure_2"),
             geographic_overview,
-            electoral_district_population_chart_1,
+            context.population_table(counties),
             """</electoral_district_population_table_snippet>
+</geographic_facts>
+
+<public_transportation_statistics>""",
+            context.transport_table(counties),
+        ]
+    return [
+        intro_to_qol_matrix,
+        intro_to_housing_crisis,
+        asset_part("housing_crisis_statistic_figure_1"),
+        asset_part("housing_crisis_statistic_figure_2"),
+        geographic_overview,
+        asset_part("electoral_district_population_chart_1"),
+        """</electoral_district_population_table_snippet>
 <electoral_district_population_chart>""",
-            electoral_district_population_chart_2,
-            """</electoral_district_population_chart>
+        asset_part("electoral_district_population_chart_2"),
+        """</electoral_district_population_chart>
 </geographic_facts>
 
 <public_transportation_statistics>""",
-            public_transport_csv_as_text,
-            task_instruction_prompt.format(location),
-        ],
-        generation_config=generation_config,
-        safety_settings=safety_settings,
-        stream=True,
-    )
+        asset_part("public_transport_csv_as_text"),
+    ]
 
-    return "".join([response.text for response in responses])
 
+def build_contents(location: str, prefix_cached: bool = False, prefix_parts=None):
+    query = task_instruction_prompt.format(location)
+    if prefix_cached:
+        return [query]
+    return [*(prefix_parts or build_prefix_parts()), query]
 
-def main(only_retry: bool = False):
-    # input csv input column name: Electoral Divisions
-    # output csv output column name: Quality of Life
 
-    # load input csv into list of dicts
+def build_query(batch, ed_name):
+    # the EDs of a request are tagged with their row in the ED table, `parse_query` reverses this
+    return "".join([f"<query_{i}>" + ed_name(i) + f"</query_{i}>" for i in batch])
+
+
+def parse_query(query):
+    return [(int(i), name) for i, name in re.findall(r"<query_(\d+)>(.*?)</query_\1>", query, flags=re.DOTALL)]
+
+
+def load_eds():
+    # input csv input column name: Electoral Divisions
     with gzip.open("ed_dataset/irl_ed.csv.gz", "rt") as f:
         reader = csv.DictReader(f)
-        data = [row for row in reader]
-
-    if only_retry:
-        # load erroneous files
-        erroneous_files = Path("erroneous_files.txt").read_text().splitlines()
-        erroneous_entries = [
-            re.search(
-                r"qol_dataset/batch_record_bs10_batch_(?P<batch_start>[0-9]+)\.json",
-                file_name,
-            ).group("batch_start")
-            for file_name in erroneous_files
-        ]
-        # retry with only the erroneous entries
-        retry = list(map(int, erroneous_entries))
-    else:
-        retry = list(range(len(data)))
-    # generate quality of life for each batch of 100 electoral division
-    # the responses are in csv format, need to parse them into json format and assign each record to original record
-    # the output context size is 8192 to the max, we are counting 10k characters for being on the safe side
-    # a single record is roughly 1k characters.
-    batch_size = 10
+        return [row for row in reader]
+
+
+def store_batch(store, data, batch, records, stored=None):
+    # the records of a batch are committed to the results store together, matched to the EDs by name. With
+    # `stored` (ED_ID -> latest record in the store, kept up to date here) records the store already holds
+    # are left out
+    ed_ids = {data[i]["Electoral Divisions"]: data[i]["ED_ID"] for i in batch}
+    items = [(ed_ids[record["query"]], record) for record in records]
+    if stored is not None:
+        items = [(ed_id, record) for ed_id, record in items if stored.get(ed_id) != record]
+        stored.update(items)
+    store.put(items)
+
+
+def generate(location: str, backend: str = "vertex", backend_options: dict = None):
+    # one-off request outside of main()'s engine, e.g. from a notebook
+    model = create_backend(
+        backend, model_name, [system_prompt], output_json_schema, backend_options
+    ).create_model(Endpoint.parse(DEFAULT_ENDPOINT))
+    return asyncio.run(generate_async(location, model)).text
+
+
+# `records` are the schema-valid objects of the response array, `error` is set when the stream broke off
+# after some records were already complete. Times are in seconds from sending the request
+Generation = collections.namedtuple(
+    "Generation",
+    ["text", "records", "record_errors", "usage_metadata", "finish_reason", "error", "time_to_first_chunk", "latency"],
+)
 
-    # VertexAI free tier allows only 5 requests per minute (concurrently)
 
-    quota_per_minute = 5
-    call_count = 0
-    start_time = None
-    elapsed_time = None
+async def generate_async(
+    location: str,
+    model,
+    prefix_cached: bool = False,
+    prefix_parts=None,
+    first_chunk_timeout: float = None,
+    timeout: float = None,
+):
+    # `first_chunk_timeout` and `timeout` are deadlines in seconds from sending the request, for the first
+    # chunk and the whole response. A response cut off by its deadline keeps the records completed before
+    # the cut, it comes back with the DeadlineExceeded as its error
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    total_deadline = loop.time() + timeout if timeout is not None else None
+    first_deadline = loop.time() + first_chunk_timeout if first_chunk_timeout is not None else None
+    if total_deadline is not None and first_deadline is not None:
+        first_deadline = min(first_deadline, total_deadline)
+
+    chunks = []
+    stream = JsonArrayStream()
+    records = []
+    record_errors = []
+    usage_metadata = None
+    finish_reason = None
+    error = None
+    time_to_first_chunk = None
+    deadline = None
+    try:
+        async with asyncio.timeout_at(first_deadline if first_deadline is not None else total_deadline) as deadline:
+            responses = await model.generate_content_async(
+                build_contents(location, prefix_cached, prefix_parts),
+                generation_config=build_generation_config(),
+                safety_settings=safety_settings,
+                stream=True,
+            )
+            async for response in responses:
+                if time_to_first_chunk is None:
+                    time_to_first_chunk = time.perf_counter() - start
+                    deadline.reschedule(total_deadline)
+                candidate = response.candidates[0] if response.candidates else None
+                if candidate is not None and candidate.content.parts:
+                    chunks.append(response.text)
+                    # every record is checked as soon as its closing brace arrives
+                    for record in stream.feed(response.text):
+                        errors = schema_errors(record, output_json_schema["items"])
+                        if errors:
+                            record_errors.extend(errors)
+                        else:
+                            records.append(record)
+                if candidate is not None and candidate.finish_reason:
+                    finish_reason = candidate.finish_reason.name
+                elif candidate is None and getattr(getattr(response, "prompt_feedback", None), "block_reason", None):
+                    # the prompt itself was blocked, no candidate comes back at all
+                    finish_reason = "PROMPT_BLOCKED"
+                usage_metadata = response.usage_metadata
+    except Exception as e:
+        if isinstance(e, TimeoutError) and deadline is not None and deadline.expired():
+            if time_to_first_chunk is None and first_chunk_timeout is not None:
+                e = DeadlineExceeded("first chunk", first_chunk_timeout)
+            else:
+                e = DeadlineExceeded("complete response", timeout)
+        if not records:
+            raise e
+        error = e
+    return Generation(
+        "".join(chunks),
+        records,
+        record_errors + stream.errors,
+        usage_metadata,
+        finish_reason,
+        error,
+        time_to_first_chunk,
+        time.perf_counter() - start,
+    )
 
-    for i in range(0, len(data), batch_size):
 
-        if i not in retry:
-            continue
+def generation_usage(generation):
+    # (prompt tokens, total tokens) of a response, for the quota accounting of hedged requests
+    if generation.usage_metadata is None:
+        return None
+    return generation.usage_metadata.prompt_token_count, generation.usage_metadata.total_token_count
+
+
+def shard_dirs(state_dir, output_dir, shard_index, num_shards):
+    # the state and output directories of a shard, below the usual ones
+    if num_shards == 1:
+        return Path(state_dir), Path(output_dir)
+    return Path(state_dir) / shard_name(shard_index, num_shards), Path(output_dir) / shard_name(shard_index, num_shards)
+
+
+def main(
+    resume: bool = False,
+    only_retry: bool = False,
+    output_dir: str = "qol_dataset",
+    concurrency: int = None,
+    endpoints: str = DEFAULT_ENDPOINT,
+    requests_per_minute: int = 5,
+    tokens_per_minute: int = None,
+    state_dir: str = ".qol_state",
+    prefix_cache: str = None,
+    response_cache: bool = True,
+    response_cache_mb: int = 512,
+    max_retries: int = 2,
+    backend: str = "vertex",
+    backend_options: dict = None,
+    telemetry: bool = True,
+    context: str = "full",
+    schedule: str = "locality",
+    shard_index: int = 0,
+    num_shards: int = 1,
+    first_chunk_timeout: float = 120.0,
+    request_timeout: float = 600.0,
+    hedge: bool = False,
+    hedge_quantile: float = 95,
+    max_request_attempts: int = 5,
+    backoff_base: float = 2.0,
+    backoff_max: float = 120.0,
+    validate: bool = True,
+    qol_tolerance: float = 15.0,
+    evict: str = None,
+):
+    # output csv output column name: Quality of Life
+    if context not in ("full", "county"):
+        raise ValueError(f"Unknown context {context}, expected 'full' or 'county'")
+    if context == "county" and prefix_cache:
+        # a context cache holds one fixed prefix, county scoped prompts differ from batch to batch
+        raise ValueError("--prefix_cache only works with --context full")
+    if schedule not in ("locality", "csv"):
+        raise ValueError(f"Unknown schedule {schedule}, expected 'locality' or 'csv'")
 
-        if elapsed_time is not None and elapsed_time < 60:
-            if call_count >= quota_per_minute:
-                time.sleep(60 - elapsed_time)
-                call_count = 0
-                start_time = time.time()
-                elapsed_time = 0
-        elif elapsed_time is not None and elapsed_time >= 60:
-            call_count = call_count - quota_per_minute if call_count >= quota_per_minute else 0
-            start_time = time.time()
-            elapsed_time = 0
-
-        batch = data[i : i + batch_size]
-        query = "".join(
-            [
-                f"<query_{i + j}>" + row["Electoral Divisions"] + f"</query_{i + j}>"
-                for j, row in enumerate(batch)
-            ]
+    # load input csv into list of dicts
+    data = load_eds()
+
+    # a shard only generates the EDs hashed to it, with its own journal, quota state and output directory
+    # below the usual ones. Shards run anywhere (give each its own --endpoints), `qol_shard.py merge` combines them
+    shard_ids = {row["ED_ID"] for row in data}
+    if num_shards > 1:
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"--shard_index must be in [0, {num_shards})")
+        shard_ids = {ed for ed in shard_ids if shard_of(ed, num_shards) == shard_index}
+        state_dir, output_dir = shard_dirs(state_dir, output_dir, shard_index, num_shards)
+        print(f"Shard {shard_index} of {num_shards}: {len(shard_ids)} EDs")
+
+    # every ED's state is journaled, a fresh run starts a new journal while --resume picks up
+    # everything a killed run didn't finish and --only_retry just the EDs that failed
+    journal = RunJournal(Path(state_dir) / "journal.jsonl", reset=not (resume or only_retry))
+    if only_retry:
+        retry = journal.failed() & shard_ids
+    else:
+        retry = {ed for ed in shard_ids if not journal.is_done(ed)}
+    print(f"Journal: {journal.summary(shard_ids)}")
+
+    # the output context size is 8192 tokens to the max, a single record is roughly 1k characters.
+    # the planner packs as many EDs into a request as fit in that with a safety margin, learning
+    # the size of a record from the usage metadata of past responses
+    planner = BatchPlanner(max_output_tokens, state_file=Path(state_dir) / "batch_planner.json")
+
+    # VertexAI free tier allows only 5 requests per minute (concurrently) per project and region, every
+    # endpoint gets its own limiter whose state is kept on disk so a restarted run picks up the quota already spent
+    pool = SessionPool(
+        parse_endpoints(endpoints, requests_per_minute, tokens_per_minute),
+        # "mock" runs the whole pipeline offline, see qol_backend.MockBackend for its options
+        create_backend(backend, model_name, [system_prompt], output_json_schema, backend_options).create_model,
+        state_dir=state_dir,
+    )
+    prefix_parts = build_prefix_parts()
+    # "vertex" registers the static prefix as context cache per endpoint, "local" is an in-process stand-in
+    prefix_cache = attach_prefix_cache(prefix_cache, pool, model_name, [system_prompt], prefix_parts, state_dir)
+
+    # EDs answered before under the same prompt, model and config are taken from disk instead of the API
+    cache = None
+    if response_cache:
+        cache = ResponseCache(Path(state_dir) / "response_cache.sqlite", max_bytes=response_cache_mb * 1024 * 1024)
+    static_prefix_hash = prefix_hash(model_name, [system_prompt], prefix_parts)
+    full_context_tokens = estimate_tokens(prefix_parts)
+
+    # "county" only sends the transport and population statistics of the counties in a batch, see qol_context
+    county_context = CountyContext(data) if context == "county" else None
+
+    @functools.lru_cache(maxsize=None)
+    def county_prefix(counties):
+        parts = build_prefix_parts(county_context, counties)
+        return parts, prefix_hash(model_name, [system_prompt], parts), estimate_tokens(parts)
+
+    def batch_prefix(batch):
+        # (prefix parts or None for the full prompt, estimated prefix tokens)
+        if county_context is None:
+            return None, full_context_tokens
+        parts, _, tokens = county_prefix(tuple(sorted({data[i]["COUNTY"] for i in batch})))
+        return parts, tokens
+
+    # one line per API call in <state_dir>/telemetry/requests.jsonl, `python qol_telemetry.py summary` reads it
+    telemetry_log = TelemetryLog(Path(state_dir) / "telemetry" / "requests.jsonl") if telemetry else None
+
+    def ed_name(i):
+        return data[i]["Electoral Divisions"]
+
+    def batch_ids(batch):
+        return [data[i]["ED_ID"] for i in batch]
+
+    def batch_names(batch):
+        return [ed_name(i) for i in batch]
+
+    def cache_key(i):
+        # per ED rather than per batch, so a cached answer doesn't depend on how EDs happened to be batched.
+        # With county context that is the prompt of the ED's own county
+        if county_context is None:
+            return response_key(static_prefix_hash, ed_name(i), build_generation_config())
+        _, county_hash, _ = county_prefix((data[i]["COUNTY"],))
+        return response_key(county_hash, ed_name(i), build_generation_config())
+
+    def ed_position(i):
+        return float(data[i]["CENTROID_X"]), float(data[i]["CENTROID_Y"])
+
+    def ed_order(items):
+        # "locality" batches EDs of the same county lying next to each other, "csv" keeps the table order
+        if schedule == "csv":
+            return list(items)
+        return locality_order(items, ed_position, group=lambda i: data[i]["COUNTY"])
+
+    def plan(items):
+        items = ed_order(items)
+        if county_context is None:
+            return planner.plan(items, name=ed_name)
+        # batches don't cross county borders so each one gets the smallest context
+        by_county = collections.defaultdict(list)
+        for i in items:
+            by_county[data[i]["COUNTY"]].append(i)
+        return [batch for county_items in by_county.values() for batch in planner.plan(county_items, name=ed_name)]
+
+    # EDs that are missing or invalid in a response are failed on their own, collected across batches
+    # and retried in fresh dense batches, at most `max_retries` times each. With county context these don't
+    # cross county borders either, the prompt of a batch and the cache keys of its EDs need the same county
+    county = (lambda i: data[i]["COUNTY"]) if county_context is not None else None
+    retries = RetryPacker(planner, name=ed_name, max_retries=max_retries, order=ed_order, group=county)
+
+    def requeue(items, reason):
+        journal.record(batch_ids(items), FAILED, reason=reason)
+        for retry_batch in retries.add(items):
+            engine.submit(retry_batch)
+
+    def on_drain():
+        retry_batches = retries.flush()
+        for retry_batch in retry_batches:
+            engine.submit(retry_batch)
+        return len(retry_batches) > 0
+
+    def reject_invalid(records):
+        # the validation stage: records failing the schema or the score checks of qol_semantic are dropped,
+        # returned as {name: problems} so their EDs are retried like missing ones
+        if not validate or not records:
+            return records, {}
+        return reject_invalid_records(records, qol_tolerance)
+
+    def check_records(batch, records, reason):
+        # keep the valid records answering this batch and requeue the EDs without one
+        records, missing, unexpected = diff_records(batch_names(batch), records)
+        records, invalid = reject_invalid(records)
+        for name, problems in invalid.items():
+            print(f"Invalid record {name!r} for batch {batch[0]}: {problems}")
+            rejected.append(name)
+        if invalid:
+            requeue([i for i in batch if ed_name(i) in invalid], "failed validation: " + "; ".join(invalid.values()))
+        if cache is not None:
+            positions = {ed_name(i): i for i in batch}
+            cache.put_many([(cache_key(positions[record["query"]]), json.dumps(record)) for record in records])
+        for record in unexpected:
+            print(f"Unexpected record {record['query']!r} for batch {batch[0]}")
+        if missing:
+            missing = set(missing)
+            requeue([i for i in batch if ed_name(i) in missing], reason)
+        return records
+
+    request_prefix_tokens = []
+
+    def log_request(
+        batch,
+        session,
+        quota_wait,
+        started_at,
+        prefix_tokens,
+        generation=None,
+        error=None,
+        hedge=None,
+        error_class=None,
+        cancelled_tokens=None,
+    ):
+        if telemetry_log is None:
+            return
+        fields = {"latency": time.time() - started_at, "records": 0}
+        if cancelled_tokens is not None:
+            # no usage comes back for a cancelled request, it is charged the prompt tokens
+            fields.update(prompt_tokens=cancelled_tokens, total_tokens=cancelled_tokens)
+        if generation is not None:
+            usage_metadata = generation.usage_metadata
+            error = generation.error
+            fields = {
+                "time_to_first_chunk": generation.time_to_first_chunk,
+                "latency": generation.latency,
+                "prompt_tokens": usage_metadata.prompt_token_count if usage_metadata else None,
+                "output_tokens": usage_metadata.candidates_token_count if usage_metadata else None,
+                "total_tokens": usage_metadata.total_token_count if usage_metadata else None,
+                "finish_reason": generation.finish_reason,
+                "records": len(generation.records),
+                "invalid_records": len(generation.record_errors),
+            }
+        telemetry_log.record(
+            ts=started_at,
+            endpoint=session.endpoint.name,
+            requests_per_minute=session.endpoint.requests_per_minute,
+            tokens_per_minute=session.endpoint.tokens_per_minute,
+            batch=batch[0],
+            eds=len(batch),
+            # 1 for the first request of an ED, more for retries of the request or of EDs that failed before
+            attempt=1 + max(retries.attempts[i] for i in batch) + request_attempts[tuple(batch)],
+            quota_wait=quota_wait,
+            prefix_cached=session.prefix_cached,
+            context_tokens=prefix_tokens,
+            # "primary" or "backup" when a duplicate was sent, both requests of the pair are logged
+            hedge=hedge,
+            hedged=hedge is not None,
+            # the request of a hedged pair cancelled as the other won
+            cancelled=cancelled_tokens is not None,
+            full_context_tokens=full_context_tokens,
+            error=repr(error) if error is not None else None,
+            # see qol_retry, None for a complete response
+            error_class=error_class,
+            **fields,
         )
+
+    async def call(batch, session, quota_wait):
+        query = build_query(batch, ed_name)
         print(query)
-        if start_time is None:
-            start_time = time.time()
-        responses = generate(query)
-        elapsed_time = time.time() - start_time
-        call_count += 1
-        print(responses)
-        with open(f"batch_record_bs{batch_size}_batch_{i}.json", "w") as f:
-            f.write(responses)
+        journal.record(batch_ids(batch), IN_FLIGHT)
+        prefix_parts, prefix_tokens = batch_prefix(batch)
+        request_prefix_tokens.append(prefix_tokens)
+        if prefix_cache is not None:
+            # keeps the context caches from expiring during a long run
+            prefix_cache.refresh(pool)
+        started_at = time.time()
+
+        def request(request_session):
+            return generate_async(
+                query,
+                request_session.model,
+                request_session.prefix_cached,
+                prefix_parts,
+                first_chunk_timeout=first_chunk_timeout,
+                timeout=request_timeout,
+            )
+
+        def log_hedged(request_session, role, task, request_started_at, charged_tokens):
+            # the other request of a hedged pair, which used its endpoint's quota as well
+            if task.cancelled():
+                log_request(
+                    batch,
+                    request_session,
+                    0,
+                    request_started_at,
+                    prefix_tokens,
+                    hedge=role,
+                    cancelled_tokens=charged_tokens,
+                )
+            elif task.exception() is not None:
+                error = task.exception()
+                log_request(
+                    batch,
+                    request_session,
+                    0,
+                    request_started_at,
+                    prefix_tokens,
+                    error=error,
+                    hedge=role,
+                    error_class=classify_error(error),
+                )
+            else:
+                log_request(batch, request_session, 0, request_started_at, prefix_tokens, task.result(), hedge=role)
+
+        try:
+            if hedger is None:
+                generation, charged_tokens, hedge_winner, answered_by = await request(session), None, None, session
+            else:
+                generation, charged_tokens, hedge_winner, answered_by = await hedger.run(
+                    request, session, engine.token_estimate, generation_usage, log=log_hedged
+                )
+        except Exception as e:
+            error_class = classify_error(e)
+            if error_class == FATAL and prefix_cache is not None and prefix_cache.recover(session, e):
+                # the context cache expired under the request, it is registered again and the request retried
+                error_class = TRANSIENT
+            session.breaker.record(False)
+            log_request(batch, session, quota_wait, started_at, prefix_tokens, error=e, error_class=error_class)
+            if error_class == FATAL:
+                journal.record(batch_ids(batch), FAILED, reason=repr(e))
+                raise
+            # rate limits, server errors and missed deadlines: the same request again after backing off
+            key = tuple(batch)
+            request_attempts[key] += 1
+            error_counts[error_class] += 1
+            if retry_policy.should_retry(error_class, request_attempts[key]):
+                delay = retry_policy.delay(request_attempts[key], retry_hint(e))
+                journal.record(batch_ids(batch), PENDING, reason=f"{error_class} {e!r}, retrying in {delay:.1f}s")
+                engine.submit_later(batch, delay)
+            else:
+                journal.record(batch_ids(batch), FAILED, reason=f"{error_class} {e!r}, gave up")
+                gave_up.extend(batch)
+            return None, None
+        if answered_by is session:
+            # a winning backup is recorded on its own endpoint's breaker by the hedger
+            session.breaker.record(True)
+        missing = len(generation.records) < len(batch)
+        error_class = classify_response(generation.finish_reason, missing)
+        if error_class is not None:
+            error_counts[error_class] += 1
+        log_request(
+            batch,
+            answered_by,
+            quota_wait,
+            started_at,
+            prefix_tokens,
+            generation,
+            hedge=hedge_winner,
+            error_class=error_class,
+        )
+        if hedger is not None:
+            hedger.observe(generation.latency)
+        usage_metadata = generation.usage_metadata
+        total_tokens = usage_metadata.total_token_count if usage_metadata else None
+        if charged_tokens is not None:
+            total_tokens = charged_tokens
+        truncated = generation.finish_reason == "MAX_TOKENS" or generation.error is not None
+        if usage_metadata and not isinstance(generation.error, DeadlineExceeded):
+            # a response cut off by its deadline says nothing about the size of a record
+            planner.observe(batch_names(batch), usage_metadata.candidates_token_count, truncated)
+        for error in generation.record_errors:
+            print(f"Invalid record for batch {batch[0]}: {error}")
+        if error_class == SAFETY and not generation.records:
+            # a blocked prompt or answer, halving the batch narrows it down to the ED that triggers it
+            if len(batch) > 1:
+                journal.record(batch_ids(batch), PENDING, reason=f"{generation.finish_reason}, split")
+                for half in planner.split(batch):
+                    engine.submit(half)
+            else:
+                requeue(batch, generation.finish_reason)
+            return None, total_tokens
+        if truncated:
+            reason = repr(generation.error) if generation.error is not None else generation.finish_reason
+            if not generation.records and len(batch) > 1:
+                # nothing was complete before the cut, redo it as two smaller requests
+                journal.record(batch_ids(batch), PENDING, reason=f"{reason}, split")
+                for half in planner.split(batch):
+                    engine.submit(half)
+                return None, total_tokens
+            # keep what was complete before the cut, the rest is retried
+            return check_records(batch, generation.records, reason) or None, total_tokens
+        records = check_records(batch, generation.records, "missing or invalid in response")
+        return records or None, total_tokens
+
+    # records are appended to the compressed JSONL parts of the store in output_dir, see qol_store
+    store = ResultStore(output_dir)
+    # what the store holds already isn't appended again, every fresh run replays all cached answers through
+    # on_result and would otherwise grow the store by a full copy each time
+    stored = dict(store.records())
+
+    def on_result(batch, records):
+        print(json.dumps(records))
+        store_batch(store, data, batch, records, stored)
+        # EDs are done once a valid record with their name came back
+        answered = {record["query"] for record in records}
+        journal.record([data[i]["ED_ID"] for i in batch if ed_name(i) in answered], SUCCEEDED)
+
+    # 5 requests in flight per endpoint unless told otherwise
+    concurrency = concurrency or 5 * len(pool.sessions)
+    engine = GenerationEngine(call, pool, concurrency=concurrency)
+    # requests slower than the `hedge_quantile` latency so far are sent again where quota allows
+    hedger = Hedger(pool, quantile=hedge_quantile) if hedge else None
+    # failed requests by their (batch) EDs, and failures by kind
+    retry_policy = RetryPolicy(max_request_attempts, backoff_base, backoff_max)
+    request_attempts = collections.Counter()
+    error_counts = collections.Counter()
+    gave_up = []
+    # records dropped by the validation stage
+    rejected = []
+
+    # --evict drops the cached answers of these ED_IDs, so they are generated again
+    evict = set(str(evict).strip("()[]").replace(" ", "").split(",")) if evict else set()
+    pending = []
+    cached_records = {}
+    for i, row in enumerate(data):
+        if row["ED_ID"] not in retry:
+            continue
+        if cache is not None and row["ED_ID"] in evict:
+            cache.delete(cache_key(i))
+        cached = cache.get(cache_key(i)) if cache is not None else None
+        if cached is not None and not reject_invalid([json.loads(cached)])[1]:
+            cached_records[i] = json.loads(cached)
+        else:
+            pending.append(i)
+    for batch in planner.plan(list(cached_records), name=ed_name):
+        on_result(batch, [cached_records[i] for i in batch])
+    jobs = plan(pending)
+    if jobs:
+        # median distance of an ED to the centre of its batch, centroids are in metres (Irish Transverse Mercator)
+        print(f"Planned {len(jobs)} batches, {batch_spread(jobs, ed_position) / 1000:.1f} km median spread")
+    start_time = time.time()
+    try:
+        asyncio.run(engine.run(jobs, on_result, on_drain))
+    finally:
+        store.close()
+        journal.close()
+        if telemetry_log is not None:
+            telemetry_log.close()
+    print(
+        f"Generated {engine.completed} batches in {time.time() - start_time:.1f}s "
+        f"({engine.quota_wait:.1f}s waiting for quota)"
+    )
+    for session in pool.sessions:
+        print(f"{session.endpoint.name}: {session.completed} batches")
+    if error_counts:
+        print("Failures: " + ", ".join(f"{count} {error_class}" for error_class, count in error_counts.most_common()))
+    for session in pool.sessions:
+        if session.breaker.trips:
+            print(f"{session.endpoint.name}: circuit breaker opened {session.breaker.trips} times")
+    if gave_up:
+        print(f"Gave up on {len(gave_up)} EDs after {max_request_attempts} attempts, rerun with --resume")
+    if hedger is not None:
+        print(f"Hedged {hedger.hedged} requests, the duplicate was faster for {hedger.won}")
+    if county_context is not None and request_prefix_tokens:
+        average = sum(request_prefix_tokens) / len(request_prefix_tokens)
+        print(
+            f"County context: {average:.0f} prompt tokens per request instead of {full_context_tokens} "
+            f"({1 - average / full_context_tokens:.0%} less)"
+        )
+    if rejected:
+        print(f"Validation rejected {len(rejected)} records")
+    if retries.exhausted:
+        print(f"{len(retries.exhausted)} EDs still failing after {max_retries} retries, see the journal")
+    if cache is not None:
+        print(cache.summary())
+        cache.close()
 
 
 intro_to_qol_matrix = """I need you to generate synthetic data for our Quality of Life index. We are designing an index to present the Quality of Life (hereafter abbreviated as QoL) in areas within Republic of Ireland. The QoL index consists of 6 top level domains, and various secondary level targets within each -- which are all scalar values; additionally, all these scalar values are discrete integer numbers in range of 1-100. Finally, there\'s a final QoL integer ranging from 0 to 100 target score act as some sort of weighted average of the these values. 
@@ -200,18 +742,6 @@ The housing crisis in the Republic of Ireland is characterized by a severe short
 
 Critically, Irish Capital City Dublin and the greater Dublin region possesses distinctive skewed representation of the problem when compared to the rest of the Nation. Published by Department of Housing, Local Government and Heritage, the following two figures presents the Housing statistics of recent years. Specifically, figure_1 presents the statistics for Dublin and figure_2 presents the rest of the nation."""
 
-housing_crisis_statistic_figure_1 = Part.from_data(
-    mime_type="image/png",
-    data=base64.b64decode(
-        """iVBORw0KGgoAAAANSUhEUgAAADwAAAA8CAYAAAA6/NlyAAAEw0lEQVRoQ+1Zf0hbVxT+osbZ6IwLKmVa/UNQwbFN1sLAMjdlc8NZMsGinRinIMNNhk5YWiYbKHNMFx3uj+LY1khXwQy1EelcSdMpkWK7UulKh5Ounf+IdaBVo9H82LsXkr00JnkveaYkeRfEl/vOOe/7zndz37knEkTZkEQZX4iEI11xUWFR4QjLgLikI0xQDzqiwqLCEZaB6FvSDofjSISJ6JOOhCHsiATCN65qcfRVFYZmjDgsfwYpiYlY2XiEt198yY2eG+GpqSmUlZWFJf/rxnM49lo9xW6z2xEbEwOi5U+madQeL3ZxihiFuapECUtOvM7VPii7C+2nceOvBcTGxuJQfDwu37qJ2a++Qaie79BfRnQq3N7eHpRyvb29QfmH0jk6FQ5lhp/0s0K6aT1pstG7aXnL/OLiIrKzs6HX61FYWIi0tDTIZDL6eWhoCGNjY7xE6+rqQn19PTIzM7G6ugqz2Yzu7m4MDAwgLi6OV6y6ujrqm5GRgeXlZdiZYkOhUCAhIQEajQZtbW37xuO0aanVago0Ly8P29vbaGxsxPDwMC+ATuOamhpkZWVhZmYGBQUF6OnpQUpKSkCx1tbWUF1dTZNPxCFvm9nZ2dDV0iNX7uBkSQFn8Npf5qF68wXO9kIYUoV1Oh0qKysDjvdwbQu6q3epf7PyKK2k/I1vx65Tk1T5IeZPhj//+Zd+/vCdY/Q/ue+89heLy31nPE5Lmh1wev4Bco8ocFjxtGvaCZ4N2BeIrZ09/Hjpll+cQhH+bf4+bt97SBPImTCblC+k3kBy9WfH5kKYHXfLbMEn7x6nq2O/4SJMlnRVVZXL5ruJm7BYbX4V8BbUOW9mlPyBg5LeHsQmHEjCHo/LS+GA2B+wE3kVWa1WxDMnLzJ2dnboa8nX4LykDxh7yMJzKi0/OlGJ2/fv4RFTKHTWvoe3Pj/NC2BTWTmULxeh7+LPKH7ueXx6/hzOnKzBFyPDkMsSYYcDp14pwR8P/obp7h2/sW0Xf4WBOUu/8Zkamsb30fb9WZz/WI3ar7+kvqeKS8CExIXpK26xxNLSb2ojwIDzd3hlZQXp6elBU97c3ERSUhKtpVNTU2mjTSIJrj0+NzeH/Px8JCcn+8XHmbDfSGFiIBjhYEtBO6N0DEtpZzzSPgq2BUW0CLi03E9Ib6Wl1WbHWf3vAWvPpdJyBj8zaMCzab6XtNfCg2tV8wFzUNDoruEp6f9nWTbIgyCsGbmGeKn/w4m3KtBtSXMl6kuygyIsFDbX8ZDU0kIFdSZESIWFwuaxaS0sLCA3N5di1mq1UKlUHoIODg6iqamJzk9OTqK8vBwTExNYWlpCc3Ozh/3o6KjHebuzsxMdHR3o7+9HRUUFcnJy0NfXh9bWVupPuhmPd0IMBgNKS0vp/fX1dcjlcrdn7e7uwmg00t/HxsfHoVQq6X3SQmppaaHXgu3SAe9MIXakhElm9vb2YLFYaCOMZI8UBFx6TcSXnFaI78bGBi0m2AqRHhg5wdhsNlejjlyTeVKAsIfJZEJRURGdIvdJr6qhoQFSqVSwtBDC0fWDuGCpC5NAwRWxYUKSDVMkHIai8YIsKswrXWFoLCochqLxgiwqzCtdYWgsKhyGovGCHHUK/we1hSoPks91MQAAAABJRU5ErkJggg=="""
-    ),
-)
-housing_crisis_statistic_figure_2 = Part.from_data(
-    mime_type="image/png",
-    data=base64.b64decode(
-        """iVBORw0KGgoAAAANSUhEUgAAADwAAAA8CAYAAAA6/NlyAAAFPklEQVRoQ+1ae0hbVxz+okaNSXxE0TrJughqh/OBOPCx0TLc/tBu6DLqUJlsdjofuH+UFRy1CQ4pOFDRbjpBRHTULsRKO3XaMdaJ4pxV2UsHa4ey4ZxadT7mK8s5kjRpXjeJBZPcA8GbnN/57u/7feee89175cDFGsfF+IIl7OyKswqzCjtZBdgp7WSCGtBhFWYVdrIKuN6UVqlULziZiGbpcNSEVc5AeGZMgdgkKS7f+Bx/PVzFhaRUfDf7C2RvvKlHT0s4NzcXe3t76OnpoZ/d3V3k5eWhpKQEDQ0N4HK56O7uRk5ODlZXVxEQEIDGxkaUl5efkHoR3Th497NrePvsS+geuYsY8dNIjTqD58SntTk6jcJMq04Jc157mWm8XXFxknBM3//dLgx7Bqv6huCaCutWbWdnB97e3vYU8kSPZRU+0fIcQ3J2LVp+PnysbW0apEEXhye8EPrzBXi4+a/REoiEvljZWDeel7MYD6bim72Gk5KSkJaWBjc3N8jlci1mRkYGNSK9vb1Mz6MXl5qaipGREe1v1dXVmJmZgVKpZIxXUVGBuro6vfi+vj7ExMRAIpGYxGG8aDU3N6O0tBRZWVmIjo5GTU0N4+R0AwcGBtDV1YXOzk7U19ejv78fg4ODNmGRQbW1tSguLqaY4+Pj6OjosOyl29vbkZ+fT5W0p30z9QfOxT+ycfZgPamxVOH5+XmEhYXZTLhRMa4ee3SnGSoSQHr2WVRWVkImkzHKu/XWlEFc4fl4+tvCwgIiIyMZ4ZgLUt79FVkvnnnktA4PDxkRvto9Aj7P0yS2hjCTDGs6v4W/gGcytCzreTDNy9L5rCbcpPzeEqaewuaCf36whK/vPbCIRwiba7ozi8TN/70GcbCf0SFhQUJDha/d/MFiEpYCNAoPDw/TFZ5poYzh6hK2B4dgGyVMfLS5pju9Dg4O4O7uDvJ3eXkZwcHB2N/fh4eHB3x8fLQwS0tLWFlZQVRUFLa2trR929vb4PF4WF9fh6+vL42fnZ2lceQ3oVAIDsfwCdTGxgbtI21xcZHet4vFYu33kJAQ7blJn6en/uXHeFuypKyj9DOylrHPhCM0QARl1RVkflSNr+6Zn/rGrOU/XQrw1Xdh7zXX45OS9xH6Vja1pTGnJej7UI7Xa2UYkl9FUJ7UYu22v7itjr+CxsJShJ96CsILr6K3SoZXLl9CgEAATw8ufmpuQ1CuPhZ7P2yxtE4QwOganpubo5t/VVUVAgMD6YM7sjjZ0sjCFBERQfd8qVQKhUJhCwwdQ2xlQUEB0tPTqQ/XLF7mABkRtjmjEzhQS/i4HE3brUlcPJ9AtyKRSGQT5Y97RuHF9YAl42EN+O3R35CRHGG9tTR1kk9vTmD/UAVvrjsl/Hj7oGUIfnwe1jZ34Mv3Vh97WczXFsKmDIrklL91hA8ODnGp9Q5NkufFhfydc9qEdU+iS5iYhLYvZywSMxVwMT1WazJIzP0/V9F950e14XGDwIyfN4ZnlvDG1n/oGLQt0ccVtscSHqe1NEr4OLy0hjB5bUOeipxYwpppoEmUfL9+/Tqys7NpV2trKwoLC+nx6OgokpOT6fHk5CQSEo6u2enpacTFxRnMKPIoKDMzk/aTRzBkS9J4aPJ+KiUlBYmJiRgbGwN5rGQKa2pqCvHxR/fJunlqtk2CPzExQbeqlpYWFBUV0dimpiaUlZXRY9fdlmxeWRxsIFHYtV6IO5hAdqfrev/jYXfJHAyAVdjBBLM6XVZhq0vmYANYhR1MMKvTZRW2umQONoBV2MEEszrd/wFI40NNNjr9cwAAAABJRU5ErkJggg=="""
-    ),
-)
 geographic_overview = """The housing crisis in Ireland is a complex issue with no easy solutions, requiring sustained government intervention, policy reforms, and increased housing supply to address the underlying causes. 
 </housing_crisis>
 
@@ -260,30 +790,12 @@ Importance in Planning and Policy
   - Urban vs. Rural Dynamics: The contrast between urban and rural EDs is a key factor in national debates on issues like housing, transportation, and public services. Urban EDs often face challenges related to congestion and housing shortages, while rural EDs might struggle with depopulation and access to services.
 </electoral_district>
 <electoral_district_population_table_snippet>"""
-electoral_district_population_chart_1 = Part.from_data(
-    mime_type="image/png",
-    data=base64.b64decode(
-        """iVBORw0KGgoAAAANSUhEUgAAADwAAAA8CAYAAAA6/NlyAAAC20lEQVRoQ+2YP2gaURzHv6dtVVJCEVwcih3E0SHFkE03xUimItJQtIIkQyilhEA7taJgcCgK0rqEghQcC4K1EFxcdCoFQXEROjRQRUmpNaFq8y7VtnjnH84U7+7d6u/3831/n+/v3XvHQGYPIzO9oIKlTpwSpoQl1gFqaYkBHZNDCVPCEusAtbTEgNJNi1qaWlpiHZCfpQeDwSOJQZwoh2m1WgM5CM5kMtjc3IRsBA+hMvV6fSrheDyOvb09wUbw+XxQKBQIBAJYX18XXG9YwGaz4eTkBKurqygWi//UzefzCIfDsFgsCIVCYC5meKrgha3sPxX6dsYt6WOpIC/BasXPS8EXtobBYODtPzEBGXqXy8XGHBwcIBKJzM2rWq2iUCjA7/fPncuXYLfbkUqlcH5+Dr1ez4Z9bvfHwl88e4LEy0OZEl5Yu5ekEN8MjyxdKpXYXWzSQ2y9u7uLcrmMYDAIq9U6tzyPx4N+v490Oj137qSE7e1txGIxaLVaNoxL8NvUGzx8cF+aln7+4YyzP09tCpkKrtVqMBqNvK45OjpiDwqVSgVbW1s4Pj7G/v4+stnsaGecxaPRaBROpxPtdhsbGxuzpMwUQ3ZoMnIqlYqN//SlN5b3/l0aj/33pEn463fug8etG7/fw9Pa2O12oVarp4XN9DshwTCLvZX2ej0olcrR/wsWPJOSJQpq/eAmfPPaBeFOpyO5s/Qpz1lau3L9coan2Yy8O3O5HBwOBxKJBMitR6PRzM2U1Ekmk9jZ2Zk7ly/B7XbD6/XCbDaPNtDTLjdDjXLGGV7Y6q6o0N8XPrI/tHksvUIsLfbrYbPZxOvkK6zdXYPJZILh9h1pCyamGRJuNBrQ6XSsj/hugISwvD7iXdFYLW3ZxZ4Allbmn4VRwSKAJGiJlLCg9okgmRIWASRBS6SEBbVPBMmUsAggCVoiJSyofSJIpoRFAEnQEilhQe0TQbLsCP8CYm8mf02Q6CcAAAAASUVORK5CYII="""
-    ),
-)
-electoral_district_population_chart_2 = Part.from_data(
-    mime_type="image/png",
-    data=base64.b64decode(
-        """iVBORw0KGgoAAAANSUhEUgAAADwAAAA8CAYAAAA6/NlyAAAEq0lEQVRoQ+1aW0hrRxRdMVeNRgyYilbBYq3BCz7gWl+oFLUKFyu0SCuKcFF8oGhprSIiQrQ/ih+C7wdIlYK0PxItftharVgQEato5HJVWj8s1hpJRVPfqTOaQxJzPedqKCcnZ36OntmzZ6+99kzm7D0SOFmTOBleiICFzrjIsMiwwDzgfCFtNBq7BUbivXAk14CNImABe4CVYclX/1D4Chnw48evEBMTg8nJSWRkZGB+fh4XFxfIzc3FyMgIkpKSsLGxgZCQECQnJ6O5uRl+fn5QqVS4vLxEW1sbtFotlEol1ZOTk4M/DKcI/mWVzrHkL8Xg4CBWVlYwPT2NzMxMjI+P07Hx8fFYXl6mcoeqHvr0flVGn+Hh4ejr66Nzp6en02dJSQn0ej329vYs6GMFfPL57b7moYCsRY+zszOcnJyArITZ2VlkZWVRg1xcXCCR3Mp+53IzSc4Vjo6O4OXlReXn5uawtLSE/Px8+Pj4MPINP6QxRr37dz4KCgro/7u7u3Ssh4cHpFIpffcidow+w54poXympcCOj48xPDyM0NBQuLm5YW1tDeXl5Tbj9I0BW2shYE3GMH1mgG3OavXSHLD6+aSl86xkzQFXd8TC1dWVSlxdXdFxbI0V8JPvj6kOxbVe3SdyZGdno6urC42NjejpuQmtw8NDKBQK7OzsICAggL4zfDOFf4d+pn/PfRGLqakpnJ+f07Ek/MrKyug7nU6HoaEhGn6VlZXY3NykckTfwsIC1tfXqU4yX1xc3A2eLz9kcPU//YxGWlVVFXp7e9Hf338vZpuADw4O0N3djbCwMKSmprI5jdf9ZOmYN1aGeY3mAcaJgB/gNIcaIjJM6CKbVnV1Nf1dq6urcygG2YzlxLAupZ7RoxiowJP33mbTy9t+EbAtakSGhRbSZNMiR0B/f38UFxczB3bCftO3H+AdlYK3a5TNME5r2HRgFwGzuZOH/XcYNhgM8PT0tDBV0AyTj2m5XO48gE9PT+Hu7o7CwkIKvKOjg0mpEC/INZ9C+vQtHgYrN5M4bVqmHJIgAW9tbdEknHkTNGCSpgkMDHQewLZWgqAZNgEmSTaScx4YGBA3rcfs0uYpWeLcrz+a4ra92kmK0y5tqj6QOX+r8oL2z0a8/OtXxoQ3MdohAat3f4dmT88ANj5/n7P/nQ4wU7q5dZGs/f8tXr42pEnNJjo6GqWlpbAO6ccwzFvA5jH6YMCmGpNJ2XVxTTiAzeo9FF/bT4AIWGQYvNm0SFTW1taipaWF26YllJAmHxPb29u0cl9RUYHW1lbU1NTc+d0lib/9/X2Mjo7C19cXwcHBSElJuSO3uLhIq/+dnZ1Qq9Xw9va2kKmvr6e14qCgICQkJCAxMZF+k6elpSEiIsJClthTVFSEqKgoWiEh1yzINYn7GqeTFudThQMIPgrwxMQEvYDyuvpTQ0MDVldX6bIgmZTIyEibLmlqaqIV/Ly8PIyN3dzhMG/kOgPRQyr9pkwM0UmWnHXTaDT0zsnMzAza29vv9D8KsAMQyh/AJDsqk8k4XUSxp2MJw8519dCe3nMEXc53m9YRWLGnjSLD9vQmH3WJDPORFXva5HQM/weTdrHZXvsTYgAAAABJRU5ErkJggg=="""
-    ),
-)
-public_transport_csv_as_text = Part.from_data(
-    mime_type="text/plain",
-    data=base64.b64decode(
-        """U2V0dGxlbWVudHMsUGVyY2VudGFnZUNlbnN1czIwMTZfUE9QVUxBVElPTl9QRVJfNTAwbV9QVUJMSUNUUkFOU1BPUlQsUGVyY2VudGFnZUNlbnN1czIwMTZfTUFMRV9QT1BVTEFUSU9OXzUwMG1fUFVCTElDVFJBTlNQT1JULFBlcmNlbnRhZ2VDZW5zdXMyMDE2X0ZFTUFMRV9QT1BVTEFUSU9OXzUwMG1fUFVCTElDVFJBTlNQT1JULFBlcmNlbnRhZ2VDZW5zdXMyMDE2X0RJU0FCTEVEX1BPUFVMQVRJT05fNTAwbV9QVUJMSUNUUkFOU1BPUlQsUGVyY2VudGFnZUNlbnN1czIwMTZfQV8wXzE0XzUwMG1fUFVCTElDVFJBTlNQT1JULFBlcmNlbnRhZ2VDZW5zdXMyMDE2X0FHRV8xNS02NF9QT1BVTEFUSU9OXzUwMG1fUFVCTElDVFJBTlNQT1JULFBlcmNlbnRhZ2VDZW5zdXMyMDE2X0FHRV9BQk9WRV82NV9QT1BVTEFUSU9OXzUwMG1fUFVCTElDVFJBTlNQT1JUDQpOYWFzLDE2LjMsMTYuNCwxNi4yLDIxLjUsMTIuNSwxNi4yLDI0LjINCkF0aGxvbmUsNjkuOCw2OS4zLDcwLjMsNzMuNSw2Ny40LDY5LjEsNzcNCkJhbGJyaWdnYW4sNzguNiw3OC43LDc4LjYsNzguMiw3OSw3OC4xLDgwLjQNCkJyYXksNjQuNyw2NC45LDY0LjUsNjMuOCw2NC40LDY0LjksNjQuOQ0KQ2FybG93LDUsNS4yLDQuOCw3LjksMi45LDUuMSwxMC4zDQpEcm9naGVkYSw1MSw1MS4yLDUwLjcsNjEuNCw0MS44LDUxLDcxLjINCk5ld2JyaWRnZSwxNi4yLDE2LjQsMTYuMSwyMC40LDExLjIsMTYuMiwyOC40DQpEdW5kYWxrLDQzLjQsNDMuNCw0My4zLDQ3LjUsNDAuOSw0My43LDQ0LjENCkVubmlzLDI4LjIsMjguMiwyOC4xLDM0LjgsMjEuNSwyNy4xLDQzLjgNCktpbGtlbm55LDcuNCw3LjcsNy4xLDguNCwzLjYsOCwxMC40DQpNdWxsaW5nYXIsMTQuNywxNS4zLDE0LjEsMTkuMiwxMC4yLDE0LjksMjMuNw0KTmF2YW4sMzkuNSwzOS40LDM5LjYsNDAuNCwzOC40LDM5LjMsNDIuOQ0KUG9ydGxhb2lzZSw1LjQsNS4zLDUuNSw3LjgsMy4zLDUuNCwxMi4yDQpUcmFsZWUsMTQsMTUuMSwxMywxNS43LDguNCwxNSwxNS41DQpXZXhmb3JkLDEyLjUsMTMsMTIsMTQuMiw4LjYsMTIsMTguMw0KV2F0ZXJmb3JkIGNpdHkgYW5kIHN1YnVyYnMsNjAuOSw2MS4zLDYwLjYsNzEuNSw1My4zLDYwLjQsNzMuOQ0KQ2VsYnJpZGdlLDQ2LjksNDcuMiw0Ni42LDU1LjIsNDEuOCw0Ny44LDU2LjYNCkdhbHdheSBjaXR5IGFuZCBzdWJ1cmJzLDY3LjIsNjcuNCw2Nyw3My40LDU3LjMsNjcuNSw4MS45DQpMaW1lcmljayBjaXR5IGFuZCBzdWJ1cmJzLDY4LjksNjksNjguNyw3Ny41LDYyLjcsNjguMiw3OS45DQpDb3JrIGNpdHkgYW5kIHN1YnVyYnMsNzYuMiw3Ni4zLDc2LjEsODEuMiw2OS44LDc2LjksODIuOQ0KU3dvcmRzLDY4LjcsNjksNjguNCw3MS42LDYzLjgsNjkuOCw3NC4yDQpEdWJsaW4gY2l0eSBhbmQgc3VidXJicyw3OC4xLDc4LjEsNzguMSw3OS44LDc0LjMsNzguOCw4MA=="""
-    ),
-)
 task_instruction_prompt = """</public_transportation_statistics>
 
 
 Finally, let me explain your task:
 You are asked to generate synthetic QoL metrics based on given electoral district / settlement area or county, like \"Agha, Carlow\", \"Agha\" or \"Carlow\". 
-I'll provide you with a list of (at most 10) electoral districts, and you'll generate a QoL metrics for each one. 
+I'll provide you with a list of electoral districts, and you'll generate a QoL metrics for each one. 
 Your output should be in JSON format with the keys being the QoL metrics. 
 
 Now here are my queries: <queries>{}</queries>"""
@@ -384,13 +896,22 @@ output_json_schema = {
     },
 }
 
-generation_config = GenerationConfig(
-    max_output_tokens=8192,
-    temperature=0.1,
-    top_p=0.95,
-    response_mime_type="application/json",
-    response_schema=output_json_schema,
-)
+model_name = "gemini-1.5-pro-001"
+max_output_tokens = 8192
+
+
+@functools.lru_cache(maxsize=None)
+def build_generation_config():
+    from vertexai.generative_models import GenerationConfig
+
+    return GenerationConfig(
+        max_output_tokens=max_output_tokens,
+        temperature=0.1,
+        top_p=0.95,
+        response_mime_type="application/json",
+        # the SDK rewrites the schema dict in place, keep ours intact for checking records
+        response_schema=copy.deepcopy(output_json_schema),
+    )
 
 
 safety_settings = [
@@ -415,4 +936,5 @@ safety_settings = [
 ]
 
 
-fire.Fire(main)
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,14 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+sys.path.insert(0, str(REPO_DIR))
+
+
+@pytest.fixture(autouse=True)
+def repo_cwd(monkeypatch):
+    # the ED table and the prompt assets are read relative to the working directory
+    monkeypatch.chdir(REPO_DIR)
@@ -0,0 +1,90 @@
+import json
+
+from conftest import FIXTURES
+from qol_batch_prediction import import_results
+from qol_journal import FAILED, PENDING, SUCCEEDED, RunJournal
+from qol_store import ResultStore
+
+# batch_prediction_results.jsonl holds four predictions output lines: a complete answer for Agha (17001) and
+# Ballinacarrig (17002), an answer cut off by MAX_TOKENS after Ballintemple (17003) so Ballon (17004) is lost,
+# a line without a response for Ballyellin (17005) and Ballymoon (17006), and a request pairing Ballymurphy
+# (17007) with Borris under the row of another ED, which is skipped
+RESULTS = FIXTURES / "batch_prediction_results.jsonl"
+
+
+def import_fixture(tmp_path, **kwargs):
+    import_results(str(RESULTS), output_dir=str(tmp_path / "qol_dataset"), state_dir=str(tmp_path / "state"), **kwargs)
+    journal = RunJournal(tmp_path / "state" / "journal.jsonl")
+    journal.close()
+    return journal, ResultStore(tmp_path / "qol_dataset")
+
+
+def test_import_journals_every_ed(tmp_path):
+    journal, store = import_fixture(tmp_path)
+    store.close()
+    assert {ed: journal.state(ed) for ed in ["17001", "17002", "17003", "17007"]} == dict.fromkeys(
+        ["17001", "17002", "17003", "17007"], SUCCEEDED
+    )
+    assert journal.failed() == {"17004", "17005", "17006"}
+    assert "MAX_TOKENS" in journal.reasons["17004"]
+    assert journal.reasons["17005"] == journal.reasons["17006"] == "INTERNAL: the model failed to generate a response"
+    # Borris (17008) was never matched to a row, so it is left for the next run
+    assert journal.state("17008") == PENDING
+
+
+def test_import_stores_answered_records(tmp_path):
+    _, store = import_fixture(tmp_path)
+    try:
+        assert set(store.ids()) == {"17001", "17002", "17003", "17007"}
+        assert store.get("17001")["query"] == "Agha, Carlow"
+        assert store.get("17002")["answer"]["QoL"] == 50
+        assert store.get("17003")["query"] == "Ballintemple, Carlow"
+        assert store.get("17007")["query"] == "Ballymurphy, Carlow"
+    finally:
+        store.close()
+
+
+def test_import_fills_the_response_cache(tmp_path):
+    import sqlite3
+
+    import_fixture(tmp_path)
+    db = sqlite3.connect(tmp_path / "state" / "response_cache.sqlite")
+    try:
+        queries = {json.loads(response)["query"] for (response,) in db.execute("SELECT response FROM responses")}
+    finally:
+        db.close()
+    assert queries == {"Agha, Carlow", "Ballinacarrig, Carlow", "Ballintemple, Carlow", "Ballymurphy, Carlow"}
+
+
+def test_import_without_response_cache(tmp_path):
+    journal, store = import_fixture(tmp_path, response_cache=False)
+    store.close()
+    assert not (tmp_path / "state" / "response_cache.sqlite").exists()
+    assert len(journal.failed()) == 3
+
+
+def test_import_rejects_invalid_records(tmp_path):
+    # a response answering Borris (17008) and Carlow Rural (17010), the QoL of Carlow Rural being 45 off the
+    # mean of its sub-scores
+    results = str(FIXTURES / "batch_prediction_invalid.jsonl")
+    import_results(results, output_dir=str(tmp_path / "qol_dataset"), state_dir=str(tmp_path / "state"))
+    journal = RunJournal(tmp_path / "state" / "journal.jsonl")
+    journal.close()
+    assert journal.state("17008") == SUCCEEDED
+    assert journal.state("17010") == FAILED
+    assert journal.reasons["17010"].startswith("failed validation: qol_residual")
+    store = ResultStore(tmp_path / "qol_dataset")
+    try:
+        assert set(store.ids()) == {"17008"}
+    finally:
+        store.close()
+
+
+def test_import_without_validation_keeps_invalid_records(tmp_path):
+    results = str(FIXTURES / "batch_prediction_invalid.jsonl")
+    import_results(results, output_dir=str(tmp_path / "qol_dataset"), state_dir=str(tmp_path / "state"), validate=False)
+    store = ResultStore(tmp_path / "qol_dataset")
+    try:
+        assert set(store.ids()) == {"17008", "17010"}
+    finally:
+        store.close()
@@ -0,0 +1,43 @@
+import collections
+import functools
+
+import synthesizing_pol
+from qol_hedge import Hedger
+from qol_telemetry import read_records, summarize
+
+
+def test_both_requests_of_a_hedged_pair_are_logged(tmp_path, monkeypatch):
+    # a dozen batches, two at a time, with latencies spread widely enough that many requests outlast the median,
+    # hedged once a few latencies are known
+    monkeypatch.setattr(synthesizing_pol, "Hedger", functools.partial(Hedger, min_samples=3))
+    synthesizing_pol.main(
+        backend="mock",
+        backend_options={"latency": "exponential:0.02"},
+        endpoints="a:location,b:location",
+        requests_per_minute=100000,
+        state_dir=str(tmp_path / "state"),
+        output_dir=str(tmp_path / "qol_dataset"),
+        response_cache=False,
+        shard_index=0,
+        num_shards=20,
+        hedge=True,
+        hedge_quantile=50,
+        concurrency=2,
+    )
+    state_dir, _ = synthesizing_pol.shard_dirs(tmp_path / "state", tmp_path / "qol_dataset", 0, 20)
+    records = read_records(str(state_dir / "telemetry" / "requests.jsonl"))
+    hedged = [record for record in records if record["hedged"]]
+    assert hedged
+    # every hedged request is logged twice, once as the primary and once as the backup, each on its own endpoint
+    pairs = collections.defaultdict(list)
+    for record in hedged:
+        pairs[(record["batch"], record["attempt"])].append(record)
+    for pair in pairs.values():
+        assert sorted(record["hedge"] for record in pair) == ["backup", "primary"]
+        assert len({record["endpoint"] for record in pair}) == 2
+    cancelled = [record for record in hedged if record["cancelled"]]
+    assert cancelled and all(record["records"] == 0 and record["prompt_tokens"] for record in cancelled)
+    summary = summarize(records)
+    assert summary["hedged"] == len(hedged)
+    assert summary["cancelled"] == len(cancelled)
+    assert summary["requests"] == len(records)
@@ -0,0 +1,216 @@
+import asyncio
+import collections
+import functools
+import json
+import time
+
+import pytest
+from google.api_core import exceptions
+
+import synthesizing_pol
+from qol_backend import MockBackend
+from qol_engine import GenerationEngine
+from qol_journal import FAILED
+from qol_retry import (
+    FATAL,
+    RATE_LIMIT,
+    SAFETY,
+    TRANSIENT,
+    TRUNCATION,
+    CircuitBreaker,
+    RetryPolicy,
+    classify_error,
+    classify_response,
+    retry_hint,
+)
+import qol_session
+from qol_session import Endpoint, SessionPool
+from synthesizing_pol import generate_async, output_json_schema
+
+ENDPOINT = Endpoint("project", "location")
+QUERY = "<query_0>Agha, Carlow</query_0><query_1>Ballinacarrig, Carlow</query_1>"
+
+
+def generate(**faults):
+    # one request through generate_async against a mock model injecting `faults`
+    model = MockBackend(output_json_schema, latency="fixed:0", **faults).create_model(ENDPOINT)
+    return asyncio.run(generate_async(QUERY, model))
+
+
+def run(tmp_path, backend_options, **kwargs):
+    # a generation run over the ~34 EDs of one shard in 100 against the mock backend, returns its journal
+    options = dict(
+        backend="mock",
+        backend_options={"latency": "fixed:0", **backend_options},
+        requests_per_minute=100000,
+        state_dir=str(tmp_path / "state"),
+        output_dir=str(tmp_path / "qol_dataset"),
+        response_cache=False,
+        shard_index=0,
+        num_shards=100,
+        backoff_base=0.01,
+        backoff_max=0.05,
+    )
+    options.update(kwargs)
+    synthesizing_pol.main(**options)
+    return journal_entries(tmp_path)
+
+
+def journal_entries(tmp_path):
+    state_dir, _ = synthesizing_pol.shard_dirs(tmp_path / "state", tmp_path / "qol_dataset", 0, 100)
+    with open(state_dir / "journal.jsonl") as f:
+        return [json.loads(line) for line in f]
+
+
+def final_states(entries):
+    states = {}
+    for entry in entries:
+        states.update(dict.fromkeys(entry["eds"], entry["state"]))
+    return states
+
+
+def test_rate_limit_is_classified_with_its_hint():
+    with pytest.raises(exceptions.ResourceExhausted) as error:
+        generate(rate_limit_rate=1.0, retry_after=2.5)
+    assert classify_error(error.value) == RATE_LIMIT
+    assert retry_hint(error.value) == 2.5
+
+
+def test_unavailable_is_transient():
+    with pytest.raises(exceptions.ServiceUnavailable) as error:
+        generate(unavailable_rate=1.0)
+    assert classify_error(error.value) == TRANSIENT
+
+
+def test_invalid_argument_is_fatal():
+    with pytest.raises(exceptions.InvalidArgument) as error:
+        generate(fatal_rate=1.0)
+    assert classify_error(error.value) == FATAL
+
+
+def test_safety_and_truncation_responses():
+    blocked = generate(safety_rate=1.0)
+    assert not blocked.records
+    assert classify_response(blocked.finish_reason) == SAFETY
+    truncated = generate(truncation_rate=1.0)
+    assert truncated.finish_reason == "MAX_TOKENS"
+    assert classify_response(truncated.finish_reason, len(truncated.records) < 2) == TRUNCATION
+
+
+def test_backoff_grows_and_respects_the_hint():
+    policy = RetryPolicy(max_attempts=4, base_delay=2.0, max_delay=10.0, seed=0)
+    assert [policy.should_retry(RATE_LIMIT, attempt) for attempt in [1, 3, 4]] == [True, True, False]
+    assert not policy.should_retry(FATAL, 1)
+    assert not policy.should_retry(SAFETY, 1)
+    for attempt, cap in [(1, 2.0), (2, 4.0), (3, 8.0), (5, 10.0)]:
+        assert cap / 2 <= policy.delay(attempt) <= cap
+    assert policy.delay(1, hint=30.0) == 30.0
+
+
+@pytest.mark.parametrize("fault", ["rate_limit_rate", "unavailable_rate"])
+def test_rate_limits_and_server_errors_are_retried_with_backoff(tmp_path, monkeypatch, fault):
+    delays = []
+    submit_later = GenerationEngine.submit_later
+
+    def record_delay(engine, batch, delay):
+        delays.append(delay)
+        return submit_later(engine, batch, delay)
+
+    monkeypatch.setattr(GenerationEngine, "submit_later", record_delay)
+    faults = {fault: 0.2, "retry_after": 0.02} if fault == "rate_limit_rate" else {fault: 0.2}
+    entries = run(tmp_path, faults, max_request_attempts=10)
+    assert delays
+    retried = [entry for entry in entries if "retrying in" in entry.get("reason", "")]
+    assert len(retried) == len(delays)
+    assert all(0.005 <= delay <= 0.05 for delay in delays)
+    if fault == "rate_limit_rate":
+        # never shorter than the server asked for
+        assert all(delay >= 0.02 for delay in delays)
+    # every ED got through in the end, nothing failed for good
+    assert set(final_states(entries).values()) == {"succeeded"}
+
+
+@pytest.mark.parametrize("repeat", range(5))
+def test_retries_give_up_after_max_attempts_and_open_the_breaker(tmp_path, monkeypatch, capsys, repeat):
+    # a short cooldown, so the run waits for the open breaker only briefly. Repeated, as retries whose
+    # timer fires just as the queue drains were once lost
+    monkeypatch.setattr(qol_session, "CircuitBreaker", functools.partial(CircuitBreaker, cooldown=0.05))
+    entries = run(tmp_path, {"unavailable_rate": 1.0}, max_request_attempts=3)
+    # every batch was sent three times and then given up on, no ED is left pending
+    gave_up = [tuple(entry["eds"]) for entry in entries if "gave up" in entry.get("reason", "")]
+    sent = collections.Counter(tuple(entry["eds"]) for entry in entries if entry["state"] == "in_flight")
+    assert gave_up and all(sent[batch] == 3 for batch in gave_up)
+    assert set(sent) == set(gave_up)
+    states = final_states(entries)
+    assert set(states.values()) == {FAILED}
+    assert set(states) == {ed for batch in gave_up for ed in batch}
+    assert "circuit breaker opened" in capsys.readouterr().out
+
+
+def test_safety_blocks_are_split_down_to_single_eds(tmp_path):
+    entries = run(tmp_path, {"safety_rate": 1.0}, max_retries=1)
+    splits = [entry for entry in entries if entry.get("reason") == "SAFETY, split"]
+    assert splits
+    # halved until a single ED is left, which fails on its own
+    singles = [entry for entry in entries if entry["state"] == FAILED and entry.get("reason") == "SAFETY"]
+    assert singles and all(len(entry["eds"]) == 1 for entry in singles)
+    assert set(final_states(entries).values()) == {FAILED}
+
+
+def test_truncated_batches_are_split(tmp_path):
+    entries = run(tmp_path, {"truncation_rate": 1.0})
+    splits = [entry for entry in entries if entry.get("reason") == "MAX_TOKENS, split"]
+    # the halves of a split batch are sent as requests of their own
+    requests = [set(entry["eds"]) for entry in entries if entry["state"] == "in_flight"]
+    assert splits
+    for entry in splits:
+        assert any(request < set(entry["eds"]) for request in requests)
+
+
+def test_fatal_errors_stop_the_run(tmp_path):
+    with pytest.raises(exceptions.InvalidArgument):
+        run(tmp_path, {"fatal_rate": 1.0})
+    entries = journal_entries(tmp_path)
+    assert entries[-1]["state"] == FAILED
+    assert "InvalidArgument" in entries[-1]["reason"]
+    # nothing else was sent after the failure
+    assert sum(entry["state"] == "in_flight" for entry in entries) <= 5
+
+
+def test_breaker_opens_on_an_outage_and_half_opens_after_the_cooldown():
+    now = time.time()
+    backend = MockBackend(output_json_schema, latency="fixed:0", outages={"down:location": [0, 3600]})
+    pool = SessionPool([Endpoint("down", "location"), Endpoint("up", "location")], backend.create_model)
+    down, up = pool.sessions
+    breaker = down.breaker = CircuitBreaker(window=10, threshold=0.5, min_failures=3, cooldown=30.0)
+    for _ in range(3):
+        with pytest.raises(exceptions.ServiceUnavailable) as error:
+            asyncio.run(generate_async(QUERY, down.model))
+        assert classify_error(error.value) == TRANSIENT
+        breaker.record(False, now=now)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.trips == 1
+    assert not breaker.available(now=now + 10)
+    # requests go to the other endpoint meanwhile
+    assert pool.pick(0) is up
+
+    # after the cooldown a single trial is let through
+    assert breaker.available(now=now + 31)
+    breaker.start(now=now + 31)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.available(now=now + 31)
+    # the endpoint is still down, so it opens again for twice as long
+    with pytest.raises(exceptions.ServiceUnavailable):
+        asyncio.run(generate_async(QUERY, down.model))
+    breaker.record(False, now=now + 32)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.open_until == now + 32 + 60.0
+
+    # a trial against the endpoint once it is back closes the breaker
+    backend.outages = {}
+    breaker.start(now=now + 100)
+    generation = asyncio.run(generate_async(QUERY, down.model))
+    assert len(generation.records) == 2
+    breaker.record(True, now=now + 100)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.available(now=now + 100)
@@ -0,0 +1,127 @@
+import copy
+import json
+
+import jsonschema
+import pytest
+
+from conftest import FIXTURES
+from qol_data_validator import QOL_JSON_SCHEMA
+from qol_schema import compile_schema
+
+
+def strict(schema):
+    # the QoL schema with every score within 0..100 and no properties beyond the known ones, for the
+    # keywords the schema itself doesn't use
+    schema = dict(schema)
+    if schema.get("type") == "integer":
+        schema.update(minimum=0, maximum=100)
+    if "properties" in schema:
+        schema["properties"] = {key: strict(sub_schema) for key, sub_schema in schema["properties"].items()}
+        schema["additionalProperties"] = False
+    if isinstance(schema.get("items"), dict):
+        schema["items"] = strict(schema["items"])
+    return schema
+
+
+STRICT_SCHEMA = strict(QOL_JSON_SCHEMA)
+TUPLE_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "type": "array",
+    "items": [{"type": "string", "enum": ["Agha, Carlow", "Borris, Carlow"]}, {"type": "integer", "minimum": 0}],
+    "additionalItems": False,
+}
+
+
+def fixture_records():
+    # the records of the first, complete answer of the batch prediction fixture
+    with open(FIXTURES / "batch_prediction_results.jsonl") as f:
+        line = json.loads(f.readline())
+    return json.loads(line["response"]["candidates"][0]["content"]["parts"][0]["text"])
+
+
+def assert_same_errors(schema, value):
+    # the compiled checker and jsonschema report the same violations, compared as (path, message) sets as
+    # the two may find them in a different order
+    validator = jsonschema.Draft4Validator(schema)
+    expected = sorted((tuple(error.absolute_path), error.message) for error in validator.iter_errors(value))
+    assert sorted(compile_schema(schema)(value)) == expected
+    return expected
+
+
+def delete(path):
+    def mutate(records):
+        *parents, key = path
+        container = records
+        for part in parents:
+            container = container[part]
+        del container[key]
+
+    return mutate
+
+
+def assign(path, value):
+    def mutate(records):
+        *parents, key = path
+        container = records
+        for part in parents:
+            container = container[part]
+        container[key] = value
+
+    return mutate
+
+
+MUTATIONS = {
+    "missing_key": delete([0, "answer", "QoL"]),
+    "missing_group": delete([1, "answer", "health_equity"]),
+    "bool_for_integer": assign([1, "answer", "a_sense_of_control", "safety"], True),
+    "float_for_integer": assign([0, "answer", "QoL"], 50.5),
+    "string_for_object": assign([0, "answer"], "50"),
+    "out_of_range": assign([0, "answer", "health_equity", "food_choice"], 101),
+    "negative": assign([1, "answer", "QoL"], -1),
+    "extra_property": assign([1, "extra"], 1),
+    "extra_nested_property": assign([0, "answer", "a_sense_of_wonder", "extra"], 1),
+    "record_not_an_object": assign([1], ["Ballinacarrig, Carlow"]),
+}
+
+
+@pytest.mark.parametrize("schema", [QOL_JSON_SCHEMA, STRICT_SCHEMA], ids=["schema", "strict"])
+def test_valid_records_pass_both(schema):
+    records = fixture_records()
+    assert assert_same_errors(schema, records) == []
+    assert compile_schema(schema)(records) == ()
+
+
+@pytest.mark.parametrize("schema", [QOL_JSON_SCHEMA, STRICT_SCHEMA], ids=["schema", "strict"])
+@pytest.mark.parametrize("mutation", MUTATIONS)
+def test_mutated_records_fail_the_same_way(schema, mutation):
+    records = copy.deepcopy(fixture_records())
+    MUTATIONS[mutation](records)
+    errors = assert_same_errors(schema, records)
+    # the QoL schema itself has no ranges and allows extra properties
+    assert errors or schema is QOL_JSON_SCHEMA
+
+
+def test_violations_across_records_are_all_reported():
+    records = copy.deepcopy(fixture_records())
+    for mutation in ["missing_group", "bool_for_integer", "float_for_integer", "out_of_range", "extra_property"]:
+        MUTATIONS[mutation](records)
+    assert len(assert_same_errors(STRICT_SCHEMA, records)) == 5
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        ["Agha, Carlow", 3],
+        ["Agha, Carlow"],
+        [],
+        ["Carlow", 3],
+        [3, "Agha, Carlow"],
+        ["Agha, Carlow", True],
+        ["Agha, Carlow", -1],
+        ["Agha, Carlow", 3, 4],
+        ["Agha, Carlow", 3, "Borris, Carlow", None],
+        {"not": "an array"},
+    ],
+)
+def test_tuple_form_items(value):
+    assert_same_errors(TUPLE_SCHEMA, value)
@@ -0,0 +1,70 @@
+import pytest
+
+from qol_shard import merge, shard_name, shard_of
+from qol_store import ResultStore
+
+# Agha, Ballinacarrig and Ballintemple of the ED table
+ED_IDS = ["17001", "17002", "17003"]
+
+
+def record(ed_id, qol):
+    return {"query": ed_id, "answer": {"QoL": qol}}
+
+
+def put(directory, items):
+    store = ResultStore(directory)
+    try:
+        store.put(items)
+    finally:
+        store.close()
+
+
+def shard_dir(output_dir, ed_id, num_shards=2):
+    return output_dir / shard_name(shard_of(ed_id, num_shards), num_shards)
+
+
+def merged(output_dir):
+    store = ResultStore(output_dir, read_only=True)
+    try:
+        return {ed_id: record["answer"]["QoL"] for ed_id, record in store.records()}
+    finally:
+        store.close()
+
+
+@pytest.fixture
+def conflicting(tmp_path):
+    # 17001 merged before, and answered differently by its shard since, 17002 and 17003 new to the merged store
+    output_dir = tmp_path / "qol_dataset"
+    put(output_dir, [("17001", record("17001", 10))])
+    for ed_id, qol in [("17001", 20), ("17002", 30), ("17003", 40)]:
+        put(shard_dir(output_dir, ed_id), [(ed_id, record(ed_id, qol))])
+    return output_dir
+
+
+def test_conflicts_fail_the_merge_by_default(conflicting):
+    with pytest.raises(SystemExit):
+        merge(str(conflicting))
+    assert merged(conflicting) == {"17001": 10}
+
+
+def test_first_keeps_the_merged_answer(conflicting, capsys):
+    merge(str(conflicting), on_conflict="first")
+    assert merged(conflicting) == {"17001": 10, "17002": 30, "17003": 40}
+    out = capsys.readouterr().out
+    assert "differ, kept merged" in out
+    assert "Wrote 2 new and 0 replaced EDs" in out
+
+
+def test_latest_lets_a_shard_replace_the_merged_answer(conflicting, capsys):
+    merge(str(conflicting), on_conflict="latest")
+    assert merged(conflicting) == {"17001": 20, "17002": 30, "17003": 40}
+    out = capsys.readouterr().out
+    assert f"differ, kept {shard_dir(conflicting, '17001').name}" in out
+    assert "Wrote 2 new and 1 replaced EDs" in out
+    # the replaced record was compacted away, in ED table order
+    store = ResultStore(conflicting, read_only=True)
+    try:
+        assert [ed_id for ed_id, _ in store.records()] == ED_IDS
+        assert sum(len(ed_ids) for members in store.members for _, _, ed_ids in members) == 3
+    finally:
+        store.close()
@@ -0,0 +1,139 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from qol_store import ResultStore, import_files
+
+
+def record(query, qol=50):
+    return {"query": query, "answer": {"QoL": qol}}
+
+
+def put_eds(directory, ed_ids, **kwargs):
+    store = ResultStore(directory, num_parts=2, **kwargs)
+    try:
+        for ed_id in ed_ids:
+            store.put([(ed_id, record(ed_id))])
+    finally:
+        store.close()
+
+
+def test_torn_write_is_cut_off_and_the_store_recovers(tmp_path):
+    put_eds(tmp_path, ["1", "2"])
+    store = ResultStore(tmp_path)
+    # a crash after the member was appended to the part but before its index line was written
+    path = store.part_path(store.commits % store.num_parts)
+    committed = store.ends[store.commits % store.num_parts]
+    store.close()
+    with open(path, "ab") as f:
+        f.write(gzip.compress(json.dumps(record("3")).encode() + b"\n"))
+
+    store = ResultStore(tmp_path)
+    try:
+        assert "3" not in store
+        assert path.stat().st_size == committed
+        # later commits go where the torn member was, and every record still reads back
+        store.put([("3", record("3", 60))])
+        assert store.get("3") == record("3", 60)
+    finally:
+        store.close()
+    store = ResultStore(tmp_path)
+    try:
+        assert dict(store.records()) == {"1": record("1"), "2": record("2"), "3": record("3", 60)}
+    finally:
+        store.close()
+
+
+def test_torn_index_line_is_cut_off(tmp_path):
+    put_eds(tmp_path, ["1", "2"])
+    store = ResultStore(tmp_path)
+    index_path = store.index_path()
+    store.close()
+    size = index_path.stat().st_size
+    with open(index_path, "a") as f:
+        f.write('{"part": 0, "offset"')
+    store = ResultStore(tmp_path)
+    try:
+        assert set(store.ids()) == {"1", "2"}
+        assert index_path.stat().st_size == size
+    finally:
+        store.close()
+
+
+def test_read_only_store_leaves_uncommitted_data_alone(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ResultStore(tmp_path / "missing", read_only=True)
+    assert not (tmp_path / "missing").exists()
+
+    put_eds(tmp_path, ["1"])
+    writer = ResultStore(tmp_path)
+    path = writer.part_path(writer.commits % writer.num_parts)
+    writer.close()
+    # a member the writer has appended and not indexed yet
+    with open(path, "ab") as f:
+        f.write(b"not indexed yet")
+    size = path.stat().st_size
+    store = ResultStore(tmp_path, read_only=True)
+    try:
+        assert dict(store.records()) == {"1": record("1")}
+        with pytest.raises(ValueError):
+            store.put([("2", record("2"))])
+    finally:
+        store.close()
+    assert path.stat().st_size == size
+
+
+def test_replace_then_get(tmp_path):
+    put_eds(tmp_path, ["1", "2"])
+    store = ResultStore(tmp_path)
+    try:
+        store.put([("1", record("1", 70)), ("3", record("3"))])
+        assert store.get("1") == record("1", 70)
+        assert store.get("2") == record("2")
+    finally:
+        store.close()
+    # the replacement is what a reopened store sees too
+    store = ResultStore(tmp_path, read_only=True)
+    try:
+        assert store.get("1") == record("1", 70)
+        assert len(store) == 3
+    finally:
+        store.close()
+
+
+def test_compact_keeps_the_latest_record_of_every_ed(tmp_path):
+    put_eds(tmp_path, ["3", "1", "2"])
+    store = ResultStore(tmp_path)
+    try:
+        store.put([("1", record("1", 70))])
+        store.put([("3", record("3", 80)), ("1", record("1", 90))])
+        old_paths = [store.index_path(), *(store.part_path(part) for part in range(store.num_parts))]
+        store.compact(key=int)
+        assert store.generation == 1
+        assert list(store.records()) == [("1", record("1", 90)), ("2", record("2")), ("3", record("3", 80))]
+        assert sum(len(ed_ids) for members in store.members for _, _, ed_ids in members) == 3
+    finally:
+        store.close()
+    assert not any(path.exists() for path in old_paths)
+    store = ResultStore(tmp_path, read_only=True)
+    try:
+        assert store.generation == 1
+        assert store.get("1") == record("1", 90)
+    finally:
+        store.close()
+
+
+def test_import_matches_records_to_eds_by_name(tmp_path, capsys):
+    batch = tmp_path / "batch_0.json"
+    batch.write_text(json.dumps([record("Agha, Carlow"), record("Ballinacarrig, Carlow"), record("Nowhere")]))
+    # the macOS AppleDouble file that came with the archive is skipped
+    (tmp_path / "._batch_0.json").write_bytes(os.urandom(16))
+    import_files(str(tmp_path), directory=str(tmp_path / "qol_dataset"))
+    assert "1 unknown EDs skipped" in capsys.readouterr().out
+    store = ResultStore(tmp_path / "qol_dataset", read_only=True)
+    try:
+        assert dict(store.records()) == {"17001": record("Agha, Carlow"), "17002": record("Ballinacarrig, Carlow")}
+    finally:
+        store.close()